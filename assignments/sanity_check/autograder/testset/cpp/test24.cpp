@@ -0,0 +1,55 @@
+/*
+ * test24.cpp
+ *
+ * A batch driver [see Batched Tests in the autograder README]: test24-test27 all run it, and 
+ * each case's argv says what the case does
+ */
+#include <iostream>
+#include <sstream>
+#include <string>
+#include <vector>
+
+static int run_case(const std::vector<std::string> &args)
+{
+        if (!args.empty() && args[0] == "echo") {
+                for (size_t i = 1; i < args.size(); i++)
+                        std::cout << args[i] << (i + 1 < args.size() ? " " : "\n");
+                return 0;
+        }
+        if (!args.empty() && args[0] == "fail") {
+                std::cerr << "this case fails on purpose" << std::endl;
+                return 1;
+        }
+        if (!args.empty() && args[0] == "loop") {
+                volatile bool forever = true;
+                while (forever) {}
+        }
+        return 2;
+}
+
+static std::vector<std::string> split(const std::string &line, char sep)
+{
+        std::vector<std::string> fields;
+        std::stringstream ss(line);
+        std::string field;
+        while (std::getline(ss, field, sep))
+                fields.push_back(field);
+        return fields;
+}
+
+int main(int argc, char **argv)
+{
+        if (argc == 2 && std::string(argv[1]) == "--autograde-batch") {
+                std::string line;
+                while (std::getline(std::cin, line)) {
+                        std::vector<std::string> args = split(line, '\t');
+                        std::cout << "@@autograde-case " << args[0] << "@@" << std::endl;
+                        std::cerr << "@@autograde-case " << args[0] << "@@" << std::endl;
+                        int status = run_case(std::vector<std::string>(args.begin() + 1, args.end()));
+                        std::cerr.flush();
+                        std::cout << "@@autograde-exit " << args[0] << " " << status << "@@" << std::endl;
+                }
+                return 0;
+        }
+        return run_case(std::vector<std::string>(argv + 1, argv + argc));
+}
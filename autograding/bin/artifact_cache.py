@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+artifact_cache.py
+
+A small content-addressed file cache with a size bound.
+
+Entries are plain files named by their key (a hex digest), stored two levels deep
+so no single directory gets huge: <root>/<key[:2]>/<key>. Writes go to a temporary
+file that is renamed into place, so several autograder processes can share a cache
+directory without locking. Reading an entry refreshes its mtime, and evict() removes
+the least-recently-used entries until the cache fits in max_bytes.
+"""
+import os
+import shutil
+import hashlib
+import tempfile
+
+
+def hash_file(h, path, chunk_size=1 << 20):
+    """
+        Purpose:
+            Feed the contents of the file at path into the hashlib object h, a chunk at a time
+    """
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h
+
+
+def new_hash():
+    return hashlib.sha256()
+
+
+class ArtifactCache:
+
+    def __init__(self, root, max_bytes):
+        self.root      = root
+        self.max_bytes = max_bytes
+        self.hits      = 0
+        self.misses    = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key, dest, mode=None):
+        """
+            Purpose:
+                Copy the entry for key to dest, if there is one
+            Parameters:
+                key  (string) : the entry to look up
+                dest (string) : path to copy the entry to
+                mode (int)    : if provided, chmod dest to this
+            Returns:
+                True on a hit, False on a miss
+        """
+        entry = self.path(key)
+        try:
+            shutil.copyfile(entry, dest)
+            os.utime(entry)                 # mark as recently used for evict()
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        if mode is not None:
+            os.chmod(dest, mode)
+        self.hits += 1
+        return True
+
+    def put(self, key, src):
+        """
+            Purpose:
+                Store a copy of the file src under key
+            Notes:
+                The copy is written next to the entry and renamed into place, so readers
+                never see a partially-written entry.
+        """
+        entry = self.path(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(entry))
+        try:
+            with os.fdopen(fd, 'wb') as out, open(src, 'rb') as f:
+                shutil.copyfileobj(f, out)
+            os.replace(tmp, entry)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def evict(self):
+        """
+            Purpose:
+                Remove least-recently-used entries until the cache is no larger than max_bytes
+        """
+        entries = []
+        for d, _, files in os.walk(self.root):
+            for f in files:
+                try:
+                    st = os.stat(os.path.join(d, f))
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, os.path.join(d, f)))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
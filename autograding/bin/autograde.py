@@ -13,28 +13,32 @@ import subprocess
 import argparse
 import shutil
 import traceback
-import toml as tml
 from pathlib import Path
-from copy import deepcopy
-from dataclasses import dataclass, field
-from typing import List, Callable
-from pprint import pprint
-from tqdm import tqdm
-from tqdm.contrib.concurrent import process_map
-from multiprocessing import cpu_count, Lock
-from filelock import FileLock
+from copy import copy
+from dataclasses import dataclass, field, fields
+from typing import List
 import traceback
-from functools import reduce, partial
+import atexit
+from contextlib import contextmanager
+from functools import reduce, partial, lru_cache
 import resource
-from rich.console import Console
-from rich.table import Table, Column
-from rich import print as rprint
-from rich import box
+import signal
+import select
+import time
+import re
+import shlex
+import json
+import difflib
+import bisect
+import zipfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
 from collections.abc import Iterable
+from artifact_cache import ArtifactCache, hash_file, new_hash
 
-if 'canonicalizers.py' in os.listdir():
-    sys.path.append(os.getcwd())
-    import canonicalizers
+# rich, tqdm, toml, asyncio and the assignment's canonicalizers are imported where they're used:
+# this module is imported by every entry point [and worker], most of which never need them.
 
 # colors for printing to terminal
 RED         = "31m"
@@ -47,31 +51,93 @@ LGRAY       = "37m"
 START_COLOR = "\033[1;"
 RESET_COLOR = "\033[0m"
 
-CWD = os.path.abspath(".")
 
-SUBMISSION_DIR = f"{CWD}/submission"
-RESULTS_DIR    = f"{CWD}/results"
-TESTSET_DIR    = f"{CWD}/testset"
+def set_paths(root=".", submission_dir=None, results_dir=None):
+    """
+        Purpose:
+            Set the directories the autograder works in
+        Parameters:
+            root           (string) : the assignment's autograder directory [testset.toml, testset/, canonicalizers.py]
+            submission_dir (string) : the submission to grade; default=root/submission
+            results_dir    (string) : where the submission's results go; default=root/results
+        Notes:
+            Run at import with the current directory, which is how run_autograder uses it. The class 
+            grader [grade_class.py] runs it again in a worker before it touches each submission. 
+            Tests keep the paths they were loaded with [see replace_placeholders].
+    """
+    global CWD, SUBMISSION_DIR, RESULTS_DIR, TESTSET_DIR, REF_OUTPUT_DIR, TEST_CPP_DIR, LINK_DIR, COPY_DIR, \
+           STDIN_DIR, PREBUILT_DIR, BUILD_DIR, ASAN_BUILD_DIR, LOG_DIR, OUTPUT_DIR, RESULTS_STORE, PREBUILD_DIR, \
+           MAKEFILE_PATH, CACHE_DIR
+
+    CWD = os.path.abspath(root)
+
+    SUBMISSION_DIR = os.path.abspath(submission_dir or f"{CWD}/submission")
+    RESULTS_DIR    = os.path.abspath(results_dir or f"{CWD}/results")
+    TESTSET_DIR    = f"{CWD}/testset"
+
+    REF_OUTPUT_DIR = f"{TESTSET_DIR}/ref_output"
+    TEST_CPP_DIR   = f"{TESTSET_DIR}/cpp"
+    LINK_DIR       = f"{TESTSET_DIR}/link"
+    COPY_DIR       = f"{TESTSET_DIR}/copy"
+    STDIN_DIR      = f"{TESTSET_DIR}/stdin"
+    PREBUILT_DIR   = f"{TESTSET_DIR}/prebuilt"
+
+    BUILD_DIR      = f"{RESULTS_DIR}/build"
+    ASAN_BUILD_DIR = f"{RESULTS_DIR}/build-asan"
+    LOG_DIR        = f"{RESULTS_DIR}/logs"
+    OUTPUT_DIR     = f"{RESULTS_DIR}/output"
+    RESULTS_STORE  = f"{LOG_DIR}/results.jsonl"
+    PREBUILD_DIR   = f"{RESULTS_DIR}/prebuild"
 
-REF_OUTPUT_DIR = f"{TESTSET_DIR}/ref_output"
-TEST_CPP_DIR   = f"{TESTSET_DIR}/cpp"
-LINK_DIR       = f"{TESTSET_DIR}/link"
-COPY_DIR       = f"{TESTSET_DIR}/copy"
-LINK_DIR       = f"{TESTSET_DIR}/link"
-STDIN_DIR      = f"{TESTSET_DIR}/stdin"
+    MAKEFILE_PATH  = f"{TESTSET_DIR}/makefile/Makefile"
 
-BUILD_DIR      = f"{RESULTS_DIR}/build"
-LOG_DIR        = f"{RESULTS_DIR}/logs"
-OUTPUT_DIR     = f"{RESULTS_DIR}/output"
+    CACHE_DIR      = f"{CWD}/.autograde_cache"
+
+
+set_paths()
+
+
+@contextmanager
+def using_paths(root=".", submission_dir=None, results_dir=None):
+    """
+        Purpose:
+            Set the autograder's directories [see set_paths] for the duration of a with block
+    """
+    previous = (CWD, SUBMISSION_DIR, RESULTS_DIR)
+    set_paths(root, submission_dir, results_dir)
+    try:
+        yield
+    finally:
+        set_paths(*previous)
 
-MAKEFILE_PATH  = f"{TESTSET_DIR}/makefile/Makefile"
+HEADER_EXTS    = ('.h', '.hh', '.hpp', '.hxx', '.tpp')
+SOURCE_EXTS    = ('.c', '.cc', '.cpp', '.cxx')
+RESULT_ENTRY   = "result.json"          # a test's result in its result cache entry [see store_result]
 
 MEMLEAK_PASS   = "All heap blocks were freed -- no leaks are possible"
 MEMERR_PASS    = "ERROR SUMMARY: 0 errors from 0 contexts (suppressed: 0 from 0)"
 VALG_NO_MEM    = "Valgrind's memory management: out of memory"
+VALG_CONTEXTS  = 5                    # error contexts kept from a valgrind log [see parse_valgrind_log]
+VALG_TAIL      = 64 * 1024            # bytes at the end of a valgrind log searched for its summaries
+LEAK_KINDS     = ("definitely lost", "indirectly lost", "possibly lost", "still reachable")
+ASAN_FLAGS     = "-fsanitize=address -fsanitize-recover=address -fno-omit-frame-pointer"
+ASAN_OPTIONS   = "halt_on_error=0:detect_leaks=1"
+ASAN_RUNTIME   = b"__asan_init"         # symbol in every executable linked with the sanitizer runtime
 
 TRUNCATION_MESSAGE  = "\nFile was truncated by the autograder for being too large"
 
+DIFF_CONTEXT   = 5                    # lines of context shown around each difference
+DIFF_WIDTH     = 80                   # total width of side-by-side diffs
+DIFF_EXACT     = 4000                 # differing lines [both sides] SequenceMatcher is used for; more are anchored
+DIFF_ROWS      = 5000                 # lines a side-by-side diff may show; longer diffs are written unified
+DIFF_SECONDS   = 2                    # time a side-by-side diff may take to render before it's written unified
+DIFF_INLINE    = 1000                 # changed lines longer than this are colored whole, not char by char
+NO_NEWLINE     = b"\\ No newline at end of file\n"
+DIGEST_INDEX   = "digests.json"       # { filename : {size, mtime_ns, sha256} } of the files in ref_output
+RUNTIME_DB     = "runtimes.json"      # { testname : {run, valgrind} } seconds, in ref_output and the cache dir
+LIMITS_DB      = "limits.json"        # { testname : {wall, cpu, rss_kb, valgrind_wall, runs} } of the solution, in ref_output
+BATCH_ARGV     = ["--autograde-batch"]  # the arguments a batch driver is run with [see run_batch]
+
 
 def COLORIZE(s, color):
     return f"{START_COLOR}{color}{s}{RESET_COLOR}"
@@ -124,8 +190,7 @@ def RUN(cmd_ary,
     """
     # Set group information (used for student user)
     if user is not None:                
-        gname = pwd.getpwnam(user).pw_name
-        group = grp.getgrnam(gname).gr_gid
+        user, group  = user_ids(user)
         extra_groups = []
 
     return subprocess.run(["timeout", str(timeout)] + cmd_ary,
@@ -141,6 +206,939 @@ def RUN(cmd_ary,
                           group=group, 
                           extra_groups=extra_groups)
 
+
+@dataclass
+class Supervised:
+    """
+        The outcome of a supervised process [see supervise]. returncode follows the shell's 
+        convention, as `timeout` did: 124 if the process timed out, 128 + signal if it was 
+        killed by a signal, and its exit code otherwise.
+    """
+    returncode:  int
+    term_signal: int    = None     # signal that terminated the process, if any
+    timed_out:   bool   = False
+    max_rss:     int    = None     # peak resident set size, in KB [None if unknown - see rss_shim]
+    user_time:   float  = 0.0      # seconds
+    sys_time:    float  = 0.0      # seconds
+    wall_time:   float  = 0.0      # seconds
+
+
+TIMEOUT_GRACE = 1                  # seconds between SIGTERM and SIGKILL on timeout
+
+
+@lru_cache(maxsize=None)
+def rss_shim():
+    """
+        Purpose:
+            Find the shim that runs each program as its child and reports the program's own peak RSS 
+            [see rss_shim.c], building it the first time
+        Returns:
+            path of the shim
+        Notes:
+            Linux carries a process's peak RSS across exec, so ru_maxrss of a program we start is at 
+            least our own footprint [vfork shares our memory, fork copies it]. Forked from the shim, 
+            the program starts with the shim's few hundred KB instead.
+            The shim is built next to its source, named by the source's digest, if other users can reach 
+            that directory; otherwise it's built in a temporary directory of its own [removed on exit]. Either way the student 
+            user can run it but not replace it.
+    """
+    source    = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rss_shim.c")
+    digest    = hash_file(new_hash(), source).hexdigest()[:12]
+    bindir    = os.path.dirname(source)
+    reachable = all(os.stat(d).st_mode & 0o001 for d in [bindir] + [str(p) for p in Path(bindir).parents])
+    if not (reachable and os.access(bindir, os.W_OK)):
+        bindir = tempfile.mkdtemp(prefix="autograde-")
+        os.chmod(bindir, 0o711)
+        atexit.register(shutil.rmtree, bindir, True)
+    shim = os.path.join(bindir, f".rss_shim-{digest}")
+    if not os.path.exists(shim):
+        proc = subprocess.run(["cc", "-O2", "-o", f"{shim}.{os.getpid()}", source], capture_output=True, text=True)
+        if proc.returncode != 0:
+            FAIL(f"Couldn't build {source}:\n{proc.stderr}")
+        os.chmod(f"{shim}.{os.getpid()}", 0o755)
+        os.replace(f"{shim}.{os.getpid()}", shim)
+    return shim
+
+
+@lru_cache(maxsize=None)
+def user_ids(user):
+    """
+        Purpose:
+            Look up the uid of user and the gid of the group of the same name [once per process]
+    """
+    return pwd.getpwnam(user).pw_uid, grp.getgrnam(user).gr_gid
+
+
+@lru_cache(maxsize=None)
+def launch_shim():
+    """
+        Purpose:
+            Find util-linux's prlimit and setpriv, which launch_command uses to apply limits and 
+            drop privileges
+        Returns:
+            (prlimit path, setpriv path), or None if either is missing
+    """
+    prlimit, setpriv = shutil.which('prlimit'), shutil.which('setpriv')
+    return (prlimit, setpriv) if prlimit and setpriv else None
+
+
+RLIMIT_OPTIONS = { resource.RLIMIT_DATA: '--data', resource.RLIMIT_FSIZE: '--fsize' }
+
+
+def set_rlimits(limits):
+    for rlimit, value in limits.items():
+        resource.setrlimit(rlimit, (value, value))
+
+
+def launch_command(cmd_ary, report_fd, limits=None, user=None):
+    """
+        Purpose:
+            Work out how to start cmd_ary with resource limits, as user, at the lowest cost
+        Parameters:
+            cmd_ary   (list)   : command and options to run
+            report_fd (int)    : file descriptor the program's peak RSS is written to [see rss_shim]
+            limits    (dict)   : { resource.RLIMIT_* : value } hard and soft limits to set
+            user      (string) : user to run as [with the group of the same name, and no others]
+        Returns:
+            (list, dict) : the command to run, and any extra arguments to subprocess.Popen
+        Notes:
+            Popen can only spawn with vfork [much cheaper than fork for a large parent, and safe with 
+            threads] when there is no preexec_fn and no user/group to switch to. So the limits and 
+            the user switch are applied by exec'ing through `prlimit ... -- setpriv ... -- cmd`, 
+            which costs two execs but no fork of this process. Without those tools, we fall back 
+            to a preexec_fn.
+            Either way the program itself is started by the rss_shim, last in the chain, which costs
+            a fork of the [small] shim.
+    """
+    limits  = limits or {}
+    cmd_ary = [rss_shim(), str(report_fd)] + cmd_ary
+    if not limits and user is None:
+        return cmd_ary, {}
+
+    shim = launch_shim()
+    if shim is None:
+        popen_args = {'preexec_fn': partial(set_rlimits, limits)}
+        if user is not None:
+            uid, gid   = user_ids(user)
+            popen_args.update(user=uid, group=gid, extra_groups=[])
+        return cmd_ary, popen_args
+
+    prlimit, setpriv = shim
+    prefix = []
+    if limits:
+        prefix += [prlimit] + [f"{RLIMIT_OPTIONS[r]}={v}:{v}" for r, v in limits.items()] + ["--"]
+    if user is not None:
+        uid, gid = user_ids(user)
+        prefix  += [setpriv, f"--reuid={uid}", f"--regid={gid}", "--clear-groups", "--"]
+    return prefix + cmd_ary, {}
+
+
+def wait_for_exit(pid, timeout):
+    """
+        Purpose:
+            Wait up to timeout seconds for the child pid to exit, without reaping it
+        Returns:
+            True if it exited, False if the timeout expired
+    """
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        # no pidfds [older kernels, non-Linux]: poll with WNOWAIT so the child stays unreaped
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None:
+                return True
+            time.sleep(0.01)
+        return False
+    try:
+        poller = select.poll()
+        poller.register(pidfd, select.POLLIN)
+        return bool(poller.poll(max(timeout, 0) * 1000))
+    finally:
+        os.close(pidfd)
+
+
+async def wait_for_exit_async(pid, timeout):
+    """
+        Purpose:
+            As wait_for_exit, but waits in the running event loop instead of blocking
+    """
+    import asyncio
+    loop = asyncio.get_running_loop()
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        return await loop.run_in_executor(None, wait_for_exit, pid, timeout)
+
+    exited = loop.create_future()
+    loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(True))
+    try:
+        await asyncio.wait_for(exited, max(timeout, 0))
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+
+
+def watch_cases(proc, clock, deadline):
+    """
+        Purpose:
+            Follow the stdout pipe of a batch run until it closes [see CaseClock]
+        Returns:
+            True if it closed in time, False if the run has to be stopped: the run or the case 
+            it was on ran out of time, or it wrote too much
+    """
+    fd     = proc.stdout.fileno()
+    poller = select.poll()
+    poller.register(fd, select.POLLIN)
+    try:
+        while True:
+            wait = clock.remaining(time.monotonic(), deadline)
+            if wait <= 0:
+                return False
+            if not poller.poll(wait * 1000):
+                continue
+            data = os.read(fd, 65536)
+            if not data:
+                return True
+            if not clock.feed(data, time.monotonic()):
+                return False
+    finally:
+        proc.stdout.close()
+
+
+async def watch_cases_async(proc, clock, deadline):
+    """
+        Purpose:
+            As watch_cases, but waits for output in the running event loop
+        Notes:
+            The pipe is read without blocking: the reader callback can fire again after its data 
+            has been read, and a blocking read of the empty pipe would stall the whole loop 
+            [along with every other test's timeout].
+    """
+    import asyncio
+    loop     = asyncio.get_running_loop()
+    fd       = proc.stdout.fileno()
+    readable = asyncio.Event()
+    os.set_blocking(fd, False)
+    loop.add_reader(fd, readable.set)
+    try:
+        while True:
+            wait = clock.remaining(time.monotonic(), deadline)
+            if wait <= 0:
+                return False
+            try:
+                await asyncio.wait_for(readable.wait(), wait)
+            except asyncio.TimeoutError:
+                continue
+            readable.clear()
+            try:
+                data = os.read(fd, 65536)
+            except BlockingIOError:
+                continue
+            if not data:
+                return True
+            if not clock.feed(data, time.monotonic()):
+                return False
+    finally:
+        loop.remove_reader(fd)
+        proc.stdout.close()
+
+
+def spawn(cmd_ary, stdin=None, cwd=".", stdout=None, stderr=None, limits=None, user=None):
+    """
+        Purpose:
+            Start cmd_ary in its own session [see supervise]
+        Returns:
+            (Popen, float, int) : the process, its start time, and the end of the pipe its peak RSS is 
+                                  reported on [see rss_shim]
+    """
+    report, report_w    = os.pipe()
+    cmd_ary, popen_args = launch_command(cmd_ary, report_w, limits, user)
+    try:
+        start = time.monotonic()
+        proc  = subprocess.Popen(cmd_ary,
+                                 stdin=stdin,
+                                 stdout=stdout,
+                                 stderr=stderr,
+                                 cwd=cwd,
+                                 start_new_session=True,
+                                 pass_fds=(report_w,),
+                                 **popen_args)
+    except BaseException:
+        os.close(report)
+        raise
+    finally:
+        os.close(report_w)
+    return proc, start, report
+
+
+def reap(spawned, timed_out):
+    """
+        Purpose:
+            Collect the exit status and resource usage of a process started by spawn, which has exited
+        Returns:
+            (Supervised)
+    """
+    proc, start, report = spawned
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode   = os.waitstatus_to_exitcode(status)      # so Popen doesn't try to reap it again
+    wall_time         = time.monotonic() - start
+    with os.fdopen(report, 'rb') as f:
+        max_rss = f.read().strip()                              # nothing if the shim was killed
+
+    term_signal = os.WTERMSIG(status) if os.WIFSIGNALED(status) else None
+    returncode  = 124 if timed_out else 128 + term_signal if term_signal else os.WEXITSTATUS(status)
+    return Supervised(returncode=returncode,
+                      term_signal=term_signal,
+                      timed_out=timed_out,
+                      max_rss=int(max_rss) if max_rss else None,
+                      user_time=rusage.ru_utime,
+                      sys_time=rusage.ru_stime,
+                      wall_time=wall_time)
+
+
+def supervise(cmd_ary,
+              timeout=5,
+              stdin=None,
+              cwd=".",
+              stdout=None,
+              stderr=None,
+              limits=None,
+              user=None,
+              clock=None):
+    """
+        Purpose:
+            Run cmd_ary, enforcing the wall-clock timeout ourselves, and collect its resource usage
+        Parameters:
+            as RUN, except that stdin/stdout/stderr must be files [or None], and
+            limits (dict)      : { resource.RLIMIT_* : value } to set for the process [see launch_command]
+            clock  (CaseClock) : for a batch run, follows its stdout [which must be subprocess.PIPE], 
+                                 and stops the run when a case runs out of time [see run_batch]
+        Returns:
+            (Supervised) : exit status, terminating signal, and resource usage of the process
+        Notes:
+            The process runs in its own session; on timeout the whole process group is sent SIGTERM, 
+            then SIGKILL after TIMEOUT_GRACE seconds. The child is reaped with os.wait4, whose rusage
+            gives the cpu times directly [no `timeout` or `/usr/bin/time` wrappers]; the peak RSS is
+            the program's own, as reported by the rss_shim it runs from. It is None if the shim was
+            killed [i.e. the program ignored SIGTERM and was killed on timeout].
+            A batch run stopped for writing too much isn't reported as timed out.
+    """
+    spawned   = spawn(cmd_ary, stdin, cwd, stdout, stderr, limits, user)
+    proc, pid = spawned[0], spawned[0].pid
+    if clock is None:
+        stopped = not wait_for_exit(pid, timeout)
+    else:
+        deadline = spawned[1] + timeout
+        stopped  = not (watch_cases(proc, clock, deadline) and wait_for_exit(pid, deadline - time.monotonic()))
+    timed_out = stopped and not (clock and clock.over_limit)
+    if stopped:
+        for sig in [signal.SIGTERM, signal.SIGKILL]:
+            try:
+                os.killpg(pid, sig)
+            except ProcessLookupError:
+                break
+            if wait_for_exit(pid, TIMEOUT_GRACE):
+                break
+    return reap(spawned, timed_out)
+
+
+async def supervise_async(cmd_ary,
+                          timeout=5,
+                          stdin=None,
+                          cwd=".",
+                          stdout=None,
+                          stderr=None,
+                          limits=None,
+                          user=None,
+                          clock=None):
+    """
+        Purpose:
+            As supervise, but waits for the process in the running event loop
+    """
+    spawned   = spawn(cmd_ary, stdin, cwd, stdout, stderr, limits, user)
+    proc, pid = spawned[0], spawned[0].pid
+    if clock is None:
+        stopped = not await wait_for_exit_async(pid, timeout)
+    else:
+        deadline = spawned[1] + timeout
+        stopped  = not (await watch_cases_async(proc, clock, deadline)
+                        and await wait_for_exit_async(pid, deadline - time.monotonic()))
+    timed_out = stopped and not (clock and clock.over_limit)
+    if stopped:
+        for sig in [signal.SIGTERM, signal.SIGKILL]:
+            try:
+                os.killpg(pid, sig)
+            except ProcessLookupError:
+                break
+            if await wait_for_exit_async(pid, TIMEOUT_GRACE):
+                break
+    return reap(spawned, timed_out)
+
+
+def split_lines(data):
+    """
+        Purpose:
+            Split bytes into lines, keeping the line endings [so the last line may have none]
+    """
+    return data.splitlines(keepends=True)
+
+
+def trim_common(a, b):
+    """
+        Purpose:
+            Find the number of lines shared at the start and at the end of a and b
+        Notes:
+            Outputs that differ usually differ in a few places; trimming the common ends first
+            keeps SequenceMatcher's work proportional to the differing region.
+    """
+    lo = 0
+    while lo < len(a) and lo < len(b) and a[lo] == b[lo]:
+        lo += 1
+    hi = 0
+    while hi < len(a) - lo and hi < len(b) - lo and a[-1 - hi] == b[-1 - hi]:
+        hi += 1
+    return lo, hi
+
+
+def anchored_blocks(a, b):
+    """
+        Purpose:
+            Match lists of lines a and b in close to linear time [in the style of patience diff]
+        Returns:
+            list of (i, j, n) matching blocks, ending with (len(a), len(b), 0) [as 
+            SequenceMatcher.get_matching_blocks]
+        Notes:
+            The lines that occur exactly once in each of a and b are paired up, and the longest 
+            sequence of pairs in order on both sides is kept as anchors; each is extended over the 
+            equal lines around it. Whatever lies between the blocks is reported as changed, so the 
+            diff can be longer than SequenceMatcher's, but it never takes quadratic time.
+    """
+    count_a, count_b = Counter(a), Counter(b)
+    where_b = {line: j for j, line in enumerate(b) if count_b[line] == 1}
+    pairs   = [(i, where_b[line]) for i, line in enumerate(a) if count_a[line] == 1 and line in where_b]
+
+    # longest increasing run of j [pairs are in order of i]
+    tails, tail_pairs, prev = [], [], [None] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        t = bisect.bisect_left(tails, j)
+        prev[k] = tail_pairs[t - 1] if t else None
+        tails[t:t + 1], tail_pairs[t:t + 1] = [j], [k]
+    anchors, k = [], tail_pairs[-1] if tail_pairs else None
+    while k is not None:
+        anchors.append(pairs[k])
+        k = prev[k]
+
+    blocks, end_a, end_b = [], 0, 0
+    for i, j in reversed(anchors):
+        if i < end_a:
+            continue                                    # already inside the previous block
+        while i > end_a and j > end_b and a[i - 1] == b[j - 1]:
+            i, j = i - 1, j - 1
+        n = 0
+        while i + n < len(a) and j + n < len(b) and a[i + n] == b[j + n]:
+            n += 1
+        blocks.append((i, j, n))
+        end_a, end_b = i + n, j + n
+    return blocks + [(len(a), len(b), 0)]
+
+
+def block_opcodes(blocks):
+    """
+        Returns:
+            the opcodes [as SequenceMatcher.get_opcodes] that turn a into b, given their matching blocks
+    """
+    ops, i, j = [], 0, 0
+    for ai, bj, n in blocks:
+        if i < ai or j < bj:
+            ops.append(('replace' if i < ai and j < bj else 'delete' if i < ai else 'insert', i, ai, j, bj))
+        if n:
+            ops.append(('equal', ai, ai + n, bj, bj + n))
+        i, j = ai + n, bj + n
+    return ops
+
+
+def diff_opcodes(a, b, context=DIFF_CONTEXT):
+    """
+        Purpose:
+            Compute grouped difflib opcodes for lists of lines a and b
+        Returns:
+            list of hunks, each a list of (tag, i1, i2, j1, j2) [as SequenceMatcher.get_grouped_opcodes]
+        Notes:
+            SequenceMatcher can take quadratic time [e.g. on output where a line repeats many 
+            times], so it only compares differing regions of up to DIFF_EXACT lines; larger ones 
+            are matched by anchored_blocks.
+    """
+    lo, hi = trim_common(a, b)
+    a_mid, b_mid = a[lo:len(a) - hi], b[lo:len(b) - hi]
+    if len(a_mid) + len(b_mid) <= DIFF_EXACT:
+        mid_ops = difflib.SequenceMatcher(None, a_mid, b_mid).get_opcodes()
+    else:
+        mid_ops = block_opcodes(anchored_blocks(a_mid, b_mid))
+    ops = [(tag, i1 + lo, i2 + lo, j1 + lo, j2 + lo) for tag, i1, i2, j1, j2 in mid_ops]
+    if lo:
+        ops.insert(0, ('equal', 0, lo, 0, lo))
+    if hi:
+        ops.append(('equal', len(a) - hi, len(a), len(b) - hi, len(b)))
+
+    # same grouping as SequenceMatcher.get_grouped_opcodes, over the untrimmed opcodes
+    if ops and ops[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = ops[0]
+        ops[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+    if ops and ops[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = ops[-1]
+        ops[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+    hunks, group = [], []
+    for tag, i1, i2, j1, j2 in ops:
+        if tag == 'equal' and i2 - i1 > context * 2:
+            group.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+            hunks.append(group)
+            group = []
+            i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        hunks.append(group)
+    return hunks
+
+
+def hunk_range(start, stop):
+    length = stop - start
+    if length == 1:
+        return f"{start + 1}"
+    return f"{start + 1 if length else start},{length}"
+
+
+def unified_diff(a, b, a_name, b_name, hunks=None):
+    """
+        Purpose:
+            Render a unified diff [as `diff -u`] of lists of byte lines a and b
+        Parameters:
+            hunks (list) : diff_opcodes(a, b), if already computed
+        Returns:
+            the diff, as bytes
+    """
+    out = [f"--- {a_name}\n+++ {b_name}\n".encode()]
+    for hunk in diff_opcodes(a, b) if hunks is None else hunks:
+        first, last = hunk[0], hunk[-1]
+        out.append(f"@@ -{hunk_range(first[1], last[2])} +{hunk_range(first[3], last[4])} @@\n".encode())
+        for tag, i1, i2, j1, j2 in hunk:
+            lines = []
+            if tag == 'equal':
+                lines = [b' ' + line for line in a[i1:i2]]
+            else:
+                lines = [b'-' + line for line in a[i1:i2]] + [b'+' + line for line in b[j1:j2]]
+            for line in lines:
+                out.append(line if line.endswith(b'\n') else line + b'\n' + NO_NEWLINE)
+    return b''.join(out)
+
+
+def wrap_segments(segments, width):
+    """
+        Purpose:
+            Split a line of (text, color) segments into rows no wider than width
+        Returns:
+            list of rows, each a (rendered text, printable width) tuple
+    """
+    rows, row, used = [], "", 0
+    for text, color in segments:
+        while text:
+            piece = text[:width - used]
+            text  = text[len(piece):]
+            row  += COLORIZE(piece, color) if color else piece
+            used += len(piece)
+            if used == width:
+                rows.append((row, used))
+                row, used = "", 0
+    if row or not rows:
+        rows.append((row, used))
+    return rows
+
+
+def side_by_side_diff(a, b, a_name, b_name, width=DIFF_WIDTH):
+    """
+        Purpose:
+            Render a colored side-by-side diff [in the style of icdiff] of lists of byte lines a and b
+        Returns:
+            the diff, as bytes
+        Notes:
+            Lines are decoded with surrogateescape, so non-UTF-8 output is passed through as-is.
+            Within changed lines, only the characters that differ are colored [unless either line
+            is longer than DIFF_INLINE: matching characters is quadratic in the worst case].
+            Rendering costs far more than the diff itself, so a diff that would show more than 
+            DIFF_ROWS lines, or takes longer than DIFF_SECONDS to render, is written as a unified 
+            diff instead [as icdiff's timeout used to fall back to `diff`].
+    """
+    col      = (width - 1) // 2
+    hunks    = diff_opcodes(a, b)
+    shown    = sum(i2 - i1 if tag == 'equal' else max(i2 - i1, j2 - j1) for hunk in hunks for tag, i1, i2, j1, j2 in hunk)
+    deadline = time.monotonic() + DIFF_SECONDS
+    if shown > DIFF_ROWS:
+        return unified_diff(a, b, a_name, b_name, hunks)
+
+    def text(line):
+        return line.decode('utf-8', 'surrogateescape').rstrip('\r\n').replace('\t', '    ')
+
+    def rows(left, right):
+        lrows = wrap_segments(left, col) if left is not None else []
+        rrows = wrap_segments(right, col) if right is not None else []
+        for i in range(max(len(lrows), len(rrows))):
+            lrow, lwidth = lrows[i] if i < len(lrows) else ("", 0)
+            rrow, _      = rrows[i] if i < len(rrows) else ("", 0)
+            out.append(f"{lrow}{' ' * (col - lwidth)} {rrow}".rstrip() + "\n")
+
+    out = []
+    rows([(a_name, BLUE)], [(b_name, BLUE)])
+    for n, hunk in enumerate(hunks):
+        if n:
+            rows([("---", MAGENTA)], [("---", MAGENTA)])
+        for tag, i1, i2, j1, j2 in hunk:
+            if tag == 'equal':
+                for line in a[i1:i2]:
+                    rows([(text(line), None)], [(text(line), None)])
+                continue
+            left, right = [text(line) for line in a[i1:i2]], [text(line) for line in b[j1:j2]]
+            for k in range(max(len(left), len(right))):
+                if time.monotonic() > deadline:
+                    return unified_diff(a, b, a_name, b_name, hunks)
+                if k >= len(right):
+                    rows([(left[k], RED)], None)
+                elif k >= len(left):
+                    rows(None, [(right[k], GREEN)])
+                elif max(len(left[k]), len(right[k])) > DIFF_INLINE:
+                    rows([(left[k], RED)], [(right[k], GREEN)])
+                else:
+                    lsegs, rsegs = [], []
+                    chars = difflib.SequenceMatcher(None, left[k], right[k], autojunk=False)
+                    for ctag, c1, c2, d1, d2 in chars.get_opcodes():
+                        lsegs.append((left[k][c1:c2], None if ctag == 'equal' else RED))
+                        rsegs.append((right[k][d1:d2], None if ctag == 'equal' else GREEN))
+                    rows(lsegs, rsegs)
+    return ''.join(out).encode('utf-8', 'surrogateescape')
+
+
+def file_digest(path):
+    return hash_file(new_hash(), path).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def load_digest_index(directory):
+    """
+        Purpose:
+            Load the digest index of the reference output in directory, if there is one
+    """
+    try:
+        return json.loads(Path(f"{directory}/{DIGEST_INDEX}").read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+@lru_cache(maxsize=None)
+def reference_digest(path, size):
+    """
+        Purpose:
+            Return the digest of the reference output file at path, which is size bytes long
+        Notes:
+            Taken from the digest index when it has an entry of the same size and modification 
+            time; otherwise the file is hashed [once per process]. A file edited since the index 
+            was written is never judged by its old digest, even if its size is unchanged; a copy 
+            of ref_output that doesn't keep modification times just hashes its files.
+    """
+    entry = load_digest_index(os.path.dirname(path)).get(os.path.basename(path))
+    if entry and entry.get('size') == size and entry.get('mtime_ns') == os.stat(path).st_mtime_ns:
+        return entry['sha256']
+    return file_digest(path)
+
+
+def write_digest_index(directory):
+    """
+        Purpose:
+            Write the digest index for the output files in directory
+        Notes:
+            Run when building reference output, so the index is copied into ref_output with the 
+            output it describes. Diffs are not indexed.
+    """
+    index = {}
+    for f in sorted(os.listdir(directory)):
+        path = os.path.join(directory, f)
+        if f not in [DIGEST_INDEX, RUNTIME_DB, LIMITS_DB] and not f.endswith('.diff') and os.path.isfile(path):
+            st       = os.stat(path)
+            index[f] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': file_digest(path)}
+    Path(f"{directory}/{DIGEST_INDEX}").write_text(json.dumps(index, indent=4))
+
+
+def same_as_reference(filea, fileb):
+    """
+        Purpose:
+            Decide whether filea is byte-identical to the reference output fileb without a diff
+        Returns:
+            True if identical, False if not, None if there is no reference output
+        Notes:
+            Sizes are compared first; only if they match is filea hashed and compared against the
+            reference digest. The reference itself is usually never read [see reference_digest].
+    """
+    try:
+        size = os.path.getsize(fileb)
+    except FileNotFoundError:
+        return None
+    if os.path.getsize(filea) != size:
+        return False
+    return file_digest(filea) == reference_digest(fileb, size)
+
+
+def render_diffs(pending, pretty=False):
+    """
+        Purpose:
+            Write the diffs a test deferred [see Test.run_diff] that haven't been written yet
+        Parameters:
+            pending (list) : (filea, fileb, filec) triples
+            pretty  (bool) : write colored side-by-side diffs rather than unified diffs
+    """
+    for filea, fileb, filec in pending:
+        if not os.path.exists(filec):
+            diff_files(filea, fileb, filec, pretty)
+
+
+def diff_files(filea, fileb, filec, pretty=False):
+    """
+        Purpose:
+            Compare filea against fileb in-process, and write a diff to filec
+        Parameters:
+            filea  (str)  : student output filename
+            fileb  (str)  : reference output filename
+            filec  (str)  : file to write the diff to [empty if the files are the same]
+            pretty (bool) : write a colored side-by-side diff rather than a unified diff
+        Returns:
+            (int) the exit status `diff` would have: 0 if the same, 1 if different, 
+                  2 if either file is missing
+    """
+    try:
+        a, b = Path(filea).read_bytes(), Path(fileb).read_bytes()
+    except FileNotFoundError:
+        Path(filec).write_bytes(b"")
+        return 2
+
+    if a == b:
+        Path(filec).write_bytes(b"")
+        return 0
+
+    render = side_by_side_diff if pretty else unified_diff
+    Path(filec).write_bytes(render(split_lines(a), split_lines(b), os.path.relpath(filea, CWD), os.path.relpath(fileb, CWD)))
+    return 1
+
+
+VALG_PREFIX    = re.compile(rb"^==\d+== ?")
+VALG_FRAME     = re.compile(r"^\s+(?:at|by) 0x[0-9A-Fa-f]+: (.*)$")
+VALG_LEAK      = re.compile(r"^\s*(" + "|".join(LEAK_KINDS) + r"): ([\d,]+) bytes in ([\d,]+) blocks")
+VALG_ERRORS    = re.compile(r"ERROR SUMMARY: ([\d,]+) errors from ([\d,]+) contexts \(suppressed: ([\d,]+) from ([\d,]+)\)")
+
+
+def valgrind_lines(f):
+    """
+        Purpose:
+            Yield (offset, line) for the lines of valgrind's own output from file f [opened 'rb'], 
+            without the ==pid== prefix
+    """
+    while True:
+        offset = f.tell()
+        line   = f.readline()
+        if not line:
+            return
+        prefix = VALG_PREFIX.match(line)
+        if prefix:
+            yield offset, line[prefix.end():].rstrip(b'\n').decode('utf-8', 'replace')
+
+
+def parse_valgrind_log(path, max_contexts=VALG_CONTEXTS, tail=VALG_TAIL):
+    """
+        Purpose:
+            Extract the error counts, leak totals, and first error contexts from a valgrind log, 
+            without reading all of a [possibly huge] log
+        Returns:
+            a dictionary of 
+                errors, contexts, suppressed : counts from the ERROR SUMMARY [None if there isn't one]
+                <leak kind>                  : [bytes, blocks] for each of LEAK_KINDS
+                all_freed                    : True if valgrind reported no leaks are possible
+                out_of_memory                : True if valgrind itself ran out of memory
+                top_errors                   : the first max_contexts errors, "what (where)"
+        Notes:
+            The log is read from the start only until max_contexts errors are collected [or the 
+            summaries start]; the verdict is in the summaries at the end of the log, so reading 
+            resumes at most tail bytes from the end. Counts are summed if the log has several processes.
+    """
+    report = {"errors": None, "contexts": None, "suppressed": None, "all_freed": False,
+              "out_of_memory": False, "top_errors": []}
+    report.update({kind: [0, 0] for kind in LEAK_KINDS})
+    size = os.path.getsize(path)
+
+    with open(path, 'rb') as f:
+        resume, started, what, where = 0, False, None, None
+        for offset, line in valgrind_lines(f):
+            if not started:                         # skip the banner, up to the first blank line
+                started = line == ""
+            elif line.startswith("HEAP SUMMARY:") or line.startswith("ERROR SUMMARY:"):
+                resume = offset
+                break
+            elif line == "":
+                if what:
+                    report["top_errors"].append(f"{what} ({where})" if where else what)
+                    what, where = None, None
+                if len(report["top_errors"]) >= max_contexts:
+                    resume = f.tell()
+                    break
+            elif what is None and not line[0].isspace():
+                what = line
+            elif what and where is None and VALG_FRAME.match(line):
+                where = VALG_FRAME.match(line).group(1)
+
+        f.seek(max(resume, size - tail))
+        if f.tell() > resume:
+            f.readline()                            # probably a partial line
+        for _, line in valgrind_lines(f):
+            leak   = VALG_LEAK.match(line)
+            errors = VALG_ERRORS.search(line)
+            if leak:
+                kind = report[leak.group(1)]
+                kind[0] += int(leak.group(2).replace(',', ''))
+                kind[1] += int(leak.group(3).replace(',', ''))
+            elif MEMLEAK_PASS in line:
+                report["all_freed"] = True
+            elif VALG_NO_MEM in line:
+                report["out_of_memory"] = True
+            elif errors:
+                counts = [int(n.replace(',', '')) for n in errors.groups()]
+                for key, n in zip(("errors", "contexts", "suppressed"), [counts[0], counts[1], counts[2] + counts[3]]):
+                    report[key] = (report[key] or 0) + n
+    return report
+
+
+ASAN_ERROR     = re.compile(r"^==\d+==ERROR: AddressSanitizer: (out of memory)?")
+ASAN_SUMMARY   = re.compile(r"^SUMMARY: AddressSanitizer: (\S+) ?(.*)$")
+ASAN_LEAK      = re.compile(r"^(Direct|Indirect) leak of (\d+) byte\(s\) in (\d+) object\(s\)")
+ASAN_BROKEN    = ("LeakSanitizer has encountered a fatal error", "AddressSanitizer failed to allocate",
+                  "Shadow memory range interleaves", "ReserveShadowMemoryRange failed")
+
+
+def parse_asan_log(path, max_contexts=VALG_CONTEXTS):
+    """
+        Purpose:
+            Extract the same report as parse_valgrind_log from the AddressSanitizer/LeakSanitizer
+            reports of a run of a sanitizer build [see Test.asan_run]
+        Returns:
+            the dictionary of parse_valgrind_log, with direct leaks counted as "definitely lost" and
+            indirect leaks as "indirectly lost", plus
+                engine      : "asan"
+                unavailable : True if the sanitizer itself failed [it couldn't check the program]
+        Notes:
+            A clean run writes no report at all, so the error counts are 0 unless the caller knows the
+            run was cut short. LeakSanitizer doesn't report memory still reachable at exit.
+    """
+    report = {"errors": 0, "contexts": 0, "suppressed": 0, "all_freed": True, "out_of_memory": False,
+              "top_errors": [], "engine": "asan", "unavailable": False}
+    report.update({kind: [0, 0] for kind in LEAK_KINDS})
+
+    with open(path, 'r', errors='replace') as f:
+        for line in f:
+            error   = ASAN_ERROR.match(line)
+            leak    = ASAN_LEAK.match(line)
+            summary = ASAN_SUMMARY.match(line)
+            if error and error.group(1):
+                report["out_of_memory"] = True
+            elif error:
+                report["errors"]   += 1
+                report["contexts"] += 1
+            elif leak:
+                kind = report["definitely lost" if leak.group(1) == "Direct" else "indirectly lost"]
+                kind[0] += int(leak.group(2))
+                kind[1] += int(leak.group(3))
+                report["all_freed"] = False
+            elif summary and "leaked in" not in line and summary.group(1) != "out-of-memory":
+                if len(report["top_errors"]) < max_contexts:
+                    what, where = summary.groups()
+                    report["top_errors"].append(f"{what} ({where})" if where else what)
+            elif any(msg in line for msg in ASAN_BROKEN):
+                report["unavailable"] = True
+    return report
+
+
+def describe_valgrind(report):
+    """
+        Purpose:
+            A short summary of a valgrind report [see parse_valgrind_log], e.g. "2 errors, 40 bytes definitely lost"
+    """
+    if not report:
+        return ""
+    tool  = report.get("engine", "valgrind")
+    parts = []
+    if report["out_of_memory"]:
+        parts.append(f"{tool} ran out of memory")
+    elif report["errors"] is None:
+        parts.append(f"no {tool} summary [killed?]")
+    elif report["errors"]:
+        parts.append(f"{report['errors']} error{'s' if report['errors'] != 1 else ''}")
+    for kind in LEAK_KINDS:
+        nbytes, blocks = report[kind]
+        if nbytes:
+            parts.append(f"{nbytes:,} bytes in {blocks:,} block{'s' if blocks != 1 else ''} {kind}")
+    return ", ".join(parts)
+
+
+class OutputIndex:
+    """
+        The files in a directory [results/output, ref_output, or results/logs], by the test they belong to.
+        Built with one listdir, so readers don't each scan the directory for every test. A file belongs 
+        to a test if its name starts with the testname and a '.' [test1.stdout, test1.one.ofile.diff], 
+        so test1 isn't matched against test10's files.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.files     = {}
+        try:
+            entries = sorted(os.listdir(directory))
+        except FileNotFoundError:
+            entries = []
+        for f in entries:
+            self.add(f)
+
+    def add(self, filename):
+        """
+            Purpose:
+                Index filename under every prefix it has that ends before a '.' [test1.one.ofile is 
+                indexed under test1 and test1.one], since the testname isn't known here
+        """
+        i = filename.find('.')
+        while i > 0:
+            self.files.setdefault(filename[:i], []).append(filename)
+            i = filename.find('.', i + 1)
+
+    def find(self, testname, exts=None):
+        """
+            Returns:
+                the names of the files of the given test, only those ending in one of exts if provided
+        """
+        return [f for f in self.files.get(testname, []) if exts is None or f.endswith(tuple(exts))]
+
+    def read(self, testnames, exts):
+        """
+            Returns:
+                { filename: filedata } for the files of the given tests that end in one of exts
+        """
+        return {f: Path(os.path.join(self.directory, f)).read_text() for t in testnames for f in self.find(t, exts)}
+
+
+def reference_index():
+    # the reference output doesn't change while grading; index it once per process [and testset]
+    return index_directory(REF_OUTPUT_DIR)
+
+
+@lru_cache(maxsize=None)
+def index_directory(directory):
+    return OutputIndex(directory)
+
+
 @dataclass
 class TestConfig:
     max_time: int = 10
@@ -164,17 +1162,31 @@ class TestConfig:
     file_size_limit: int = 2
 
     valgrind: bool = True
+    memcheck_engine: str = "valgrind"                # "valgrind" or "asan" [see compile_asan_variants]
+    single_run: bool = False                         # take the output from the valgrind run [see Test.runs_once]
+    batch: bool = False                              # run as a case of a shared process [see run_batch]
     pretty_diff: bool = True
     our_makefile: bool = True
     exitcodepass: int = 0
     visibility: str = "after_due_date"               # gradescope setting
     argv: List[str] = field(default_factory=list)
+    valgrind_max_time: float = None                  # time limit of the valgrind [or sanitizer] run; default=max_time
+
+    # opt-in limits derived from the solution's usage in the reference build [see calibrate_limits]
+    calibrated_limits: bool = False
+    calibration_factor: float = 3                    # limits are this multiple of the solution's time and peak RSS
+    calibration_time_floor: float = 1                # seconds; no calibrated time limit is lower
+    calibration_ram_floor: int = 64                  # MB; no calibrated max_ram is lower
 
-    # assignment-wide ([common]) settings - note that all besides kill_limit are not even
+    # assignment-wide ([common]) settings - note that all besides kill_limit and the compile_ options are not even
     # referenced in this file, however they still must be listed here. If they
     # are not, a TypeError is raised indicating that the TestConfig __init__
     # fails when any of these fields are specified in the TOML - 2/25/2023 slamel01
     kill_limit: int = 5900
+    compile_timeout: int = 30
+    compile_cache_size: int = 256
+    result_cache_size: int = 256
+    prebuild_headers: List[str] = field(default_factory=list)
     max_valgrind_score: int = 8
     valgrind_score_visibility: str = "after_due_date"
     style_check: bool = False
@@ -188,35 +1200,9 @@ class TestConfig:
     # only used for manual mode
     exec_command: str = ""
 
-    # These will be assigned to a test by the time it finshes execution
-    # could keep these as part of the 'Test' class, but it's easier
-    # to load a test from file by throwing all the variables into the config.
-    compiled:            bool = None
-    success:             bool = None
-    valgrind_passed:     bool = None
-    ofile_file_exists:   bool = None
-    stdout_diff_passed:  bool = None
-    stderr_diff_passed:  bool = None
-    fout_diffs_passed:   bool = None
-    timed_out:           bool = None
-    memory_errors:       bool = None
-    memory_leaks:        bool = None
-    valg_out_of_mem:     bool = None
-    segfault:            bool = None
-    max_ram_exceeded:    bool = None
-    kill_limit_exceeded: bool = None
-    exit_status:         int = None
     description:         str = None
     testname:            str = None
     executable:          str = None
-    fpaths:              dict = field(default_factory=dict)
-
-    # this is set as the function with the name provided in the .toml file
-    # it must:
-    #   * live in the 'canonicalizers.py' file
-    #   * take one argument, which is the filename of a test output
-    #   * return a string, which is the result of canonicalization
-    canonicalizer: Callable[[str], str] = None
 
     def update(self, **kwargs):
         """
@@ -230,59 +1216,171 @@ class TestConfig:
     def mergecopy(self, **kwargs):
         """
             Purpose: 
-                Returns a deep copy of myself, updated with the parmeters provided.
+                Returns a shallow copy of myself, updated with the parmeters provided.
             Parameters: 
                 kwargs (key-value pairs) : a list of key-value pairs to update              
             Returns: 
                 The updated copy
+            Notes:
+                Configs are never modified once tests are loaded, so the copy can share 
+                values [e.g. lists from the .toml file] with the original.
         """
-        return deepcopy(self).update(**kwargs)
+        return copy(self).update(**kwargs)
+
+    def in_runtime_units(self):
+        """
+            Purpose:
+                Returns a copy of myself with the settings given in MB converted to the units 
+                tests work in [see RUNTIME_UNITS]
+        """
+        return self.mergecopy(**{key: runtime_value(key, getattr(self, key)) for key in RUNTIME_UNITS})
+
+
+# settings given in MB in the .toml file, and the factor that converts them to the units a Test works in
+RUNTIME_UNITS = {
+    "file_size_limit" : 1024 * 1024,        # MB -> B, truncate_file( ) works in bytes
+    "kill_limit"      : 1024 * 1024,        # MB -> B;  setrlimit uses Bytes
+    "max_ram"         : 1024,               # MB -> KB; max_rss [ru_maxrss] is in KB
+    "calibration_ram_floor" : 1024,         # MB -> KB; compared with max_rss
+}
+
+
+def runtime_value(key, value):
+    if key in RUNTIME_UNITS and value != -1:
+        return value * RUNTIME_UNITS[key]
+    return value
+
+
+def has_placeholder(value):
+    """
+        Purpose:
+            True if a value from the .toml file [or any value in a list of them] contains a
+            placeholder to be replaced per-test [see Test.replace_placeholders]
+    """
+    if isinstance(value, str):
+        return "${" in value or "#{" in value
+    if isinstance(value, Iterable) and not isinstance(value, dict):
+        return any(has_placeholder(v) for v in value)
+    return False
+
+
+def load_canonicalizers():
+    return import_canonicalizers(f"{CWD}/canonicalizers.py")
+
+
+@lru_cache(maxsize=None)
+def import_canonicalizers(path):
+    """
+        Purpose:
+            Import an assignment's canonicalizers.py the first time a test needs it
+        Notes:
+            Imported by path, so each assignment graded in a process gets its own module. Its directory 
+            is put on sys.path, so it can import its own helper modules.
+    """
+    import importlib.util
+    sys.path.append(os.path.dirname(path))
+    spec   = importlib.util.spec_from_file_location("canonicalizers", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TestResult:
+    """
+        The outcome of running a test. These are assigned to a test by the time it finishes execution.
+    """
+    __slots__ = (
+        "compiled", "success", "valgrind_passed", "ofile_file_exists", "stdout_diff_passed",
+        "stderr_diff_passed", "fout_diffs_passed", "timed_out", "memory_errors", "memory_leaks",
+        "valg_out_of_mem", "segfault", "max_ram_exceeded", "kill_limit_exceeded", 
+        "output_limit_exceeded", "exit_status", "term_signal", "max_rss", "user_time", "sys_time", 
+        "wall_time", "valgrind_rcode", "valgrind_wall_time", "valgrind_report", "produced_ofiles", 
+        "pending_diffs",
+    )
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        self.pending_diffs = []
+
+
+# the schema of a record in the results store: the test's configuration and its result
+STORE_FIELDS = tuple(f.name for f in fields(TestConfig)) + TestResult.__slots__
 
 
 class Test:
+    """
+        A test is the config shared by its group, the settings the test itself overrides, and 
+        its result. Attributes are looked up in the overrides, then the result, then the shared 
+        config, so a Test reads like one flat record; assigning a result field updates the result.
+    """
+    __slots__ = ("config", "overrides", "result")
+
+    def __init__(self, config, settings, placeholders=()):
+        """
+            Parameters:
+                config       (TestConfig) : the config of the test's group, in runtime units [shared]
+                settings     (dict)       : the test's own settings from the .toml file
+                placeholders (iterable)   : the fields of config that have placeholders [see has_placeholder]
+        """
+        self.config    = config
+        self.overrides = {key: runtime_value(key, value) for key, value in settings.items()}
+        self.result    = TestResult()
+
+        for key in placeholders:
+            self.overrides.setdefault(key, getattr(config, key))
+        for key in [key for key, value in self.overrides.items() if has_placeholder(value)]:
+            self.overrides[key] = self.replace_placeholders(self.overrides[key])
+
+        # can only get here if the test has compiled, so True by default
+        # however, if exec_command is set, we want manual mode, so compilation is irrelevant
+        self.compiled = True if not self.exec_command else None
 
-    # when our servers have python 10, we'll use inheritance with dataclasses...
-    # this works for now.
-    def __init__(self, config):
-        for (key, value) in vars(config).items():
-            if key != "tests":               # a 'Test' shouldn't contain any information about other Tests.
-                setattr(self, key, value)
+        # chami fix
+        if not self.exec_command:
+            self.overrides['executable'] = './' + (self.executable if self.executable else self.testname)
+
+    def __getattr__(self, name):
+        # unset slots [e.g. while unpickling] and dunders must fail normally, or lookups would recurse
+        if name in Test.__slots__ or name.startswith('__'):
+            raise AttributeError(name)
+        if name in self.overrides:
+            return self.overrides[name]
+        if name in TestResult.__slots__:
+            return getattr(self.result, name)
+        return getattr(self.config, name)
+
+    def __setattr__(self, name, value):
+        if name in Test.__slots__:
+            object.__setattr__(self, name, value)
+        elif name in TestResult.__slots__:
+            setattr(self.result, name, value)
+        else:
+            self.overrides[name] = value
 
+    @property
+    def fpaths(self):
         # note: output files dealt with at runtime
-        self.fpaths = {
+        return {
             "stdin"       : f"{STDIN_DIR}/{self.testname}.stdin",
             "stdout"      : f"{OUTPUT_DIR}/{self.testname}.stdout",
             "stderr"      : f"{OUTPUT_DIR}/{self.testname}.stderr",
             "stdout.diff" : f"{OUTPUT_DIR}/{self.testname}.stdout.diff",
             "stderr.diff" : f"{OUTPUT_DIR}/{self.testname}.stderr.diff",
             "valgrind"    : f"{OUTPUT_DIR}/{self.testname}.valgrind",
-            "memtime"     : f"{OUTPUT_DIR}/{self.testname}.memtime",
+            "asan"        : f"{OUTPUT_DIR}/{self.testname}.asan",
             "ref_stdout"  : f"{REF_OUTPUT_DIR}/{self.testname}.stdout",
             "ref_stderr"  : f"{REF_OUTPUT_DIR}/{self.testname}.stderr",
         }
 
-        # MB -> B, truncate_file( ) works in bytes
-        self.file_size_limit *= (1024 * 1024)
-
-        # MB -> B;  setrlimit uses Bytes
-        self.kill_limit = self.kill_limit * 1024 * 1024
-
-        # KB -> MB; /usr/bin/time -o %M uses KB
-        if self.max_ram != -1:
-            self.max_ram *= 1024
-
-        # can only get here if the test has compiled, so True by default
-        # however, if exec_command is set, we want manual mode, so compilation is irrelevant
-        self.compiled = True if not self.exec_command else None
-
-        # chami fix
-        if not self.exec_command:
-            self.executable = './' + (self.executable if self.executable else self.testname)
-
-        self.replace_placeholders_in_self()
-
-        if vars(config)["ccizer_name"] != "":
-            self.canonicalizer = getattr(canonicalizers, vars(config)["ccizer_name"])
+    # this is the function with the name provided in the .toml file
+    # it must:
+    #   * live in the 'canonicalizers.py' file
+    #   * take one argument, which is the filename of a test output
+    #   * return a string, which is the result of canonicalization
+    @property
+    def canonicalizer(self):
+        return getattr(load_canonicalizers(), self.ccizer_name) if self.ccizer_name else None
 
     def replace_placeholders(self, value_s):
         """
@@ -308,90 +1406,87 @@ class Test:
             value_s = [self.replace_placeholders(v) for v in value_s]
         return value_s
 
-    def replace_placeholders_in_self(self):
-        """
-            Purpose:
-                Replaces all placeholders from the .toml file (e.g. ${testname} ) with the correct stuff.
-            Note!
-                Assumes no dictionaries in .toml.
-        """
-        for (key, value) in vars(self).items():
-            if isinstance(value, Iterable) and \
-               not isinstance(value, dict) and \
-               not isinstance(value, str):
-                value = [self.replace_placeholders(v) for v in value]
-            else:
-                value = self.replace_placeholders(value)
-            setattr(self, key, value)
+    def record(self):
+        return {key: getattr(self, key) for key in STORE_FIELDS}
 
     def __repr__(self):
-        return (repr(vars(self)))
+        return repr(self.record())
 
     def save_status(self, finished=False):
         """
             Purpose:
-                saves
-                    1) the status of a test to the status file. 
-                    2) the variables of the test in a summary file.
+                Appends a record of the test [its state, configuration and results] to the results store.
             Notes:
-                The status file may be concurrently written to by multiple procs, so use a lockfile.
-                Replaces the actual canonicalizer function with its name so the function isn't 
-                attempted to be loaded if the data is read from the file
+                The store is appended to concurrently by multiple procs; each record is a single 
+                O_APPEND write, so no lock is needed, and the latest record for a test wins [see read_results].
+                The canonicalizer function is stored by name [ccizer_name], not as the function itself.
         """
-        logfile  = f"{LOG_DIR}/status"
-        lockfile = f"{LOG_DIR}/status.lock"
-
-        testid = f"{self.testname} - {self.description}"
         if finished:
-            if self.success:
-                line = COLORIZE(f"passed {testid}", color=GREEN)
-            else:
-                line = COLORIZE(f"failed {testid}", color=RED)
+            state = "passed" if self.success else "failed"
         else:
-            line = COLORIZE(f"not run {testid}", color=CYAN)
-
-        with FileLock(lockfile):
-            lines = Path(logfile).read_text().split('\n')
-            found = [i for i, line in enumerate(lines) if testid in line]
-
-            if not found:
-                lines.append(line)
-            else:
-                lines[found[0]] = line
-
-            lines.sort()
-            Path(logfile).write_text('\n'.join(lines))
+            state = "not run"
+        record          = self.record()
+        record['state'] = state
 
-        with open(f"{LOG_DIR}/{self.testname}.summary", 'w') as f:
-            tmpvars                  = deepcopy(vars(self))
-            tmpvars['canonicalizer'] = f"function: [{self.ccizer_name}]"
-            pprint(tmpvars, stream=f)
+        fd = os.open(RESULTS_STORE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (json.dumps(record, default=str) + '\n').encode())
+        finally:
+            os.close(fd)
 
-    def limit_virtual_memory(self):
-        resource.setrlimit(resource.RLIMIT_DATA, (self.kill_limit, self.kill_limit))
-
-    def run_exec(self, exec_prepend=None, STDOUTPATH=None, STDERRPATH=None, user="student"):
+    def limits(self, limit_memory, limit_output, cases=1):
+        """
+            Purpose:
+                The resource limits to run the program with
+            Notes:
+                With RLIMIT_FSIZE, a write past file_size_limit to any regular file [stdout, stderr, 
+                or an ofile] fails and the process gets SIGXFSZ, so runaway output is stopped as it's 
+                written rather than cut down afterwards. A run of several cases [see run_batch] may write 
+                file_size_limit for each.
+        """
+        limits = {}
+        if limit_memory:
+            limits[resource.RLIMIT_DATA]  = self.kill_limit
+        if limit_output:
+            limits[resource.RLIMIT_FSIZE] = self.file_size_limit * cases
+        return limits
+
+    @contextmanager
+    def exec_args(self, exec_prepend=None, STDOUTPATH=None, STDERRPATH=None, user="student", limit_output=False,
+                  executable=None, limit_memory=True, argv=None, STDINPATH=None, cases=1, max_time=None,
+                  clock=None):
         """
             Purpose: 
-                Run self.executable from BUILD_DIR; send output streams to STDOUTPATH and STDERRPATH
+                Prepare to run self.executable from BUILD_DIR; send output streams to STDOUTPATH and STDERRPATH
             Parameters (all optional):
                 exec_prepend (string) : prepend this string to the executable list [e.g. valgrind]
                 STDOUTPATH   (string) : path to stdout file
                 STDERRPATH   (string) : path to stderr file
-            Returns: 
-                Exit code of the process run
+                limit_output (bool)   : cap each file the program writes at file_size_limit
+                executable   (string) : run this instead of self.executable [e.g. its sanitizer build]
+                limit_memory (bool)   : hold the program to kill_limit [when run as the student]
+                argv         (list)   : run with these arguments instead of self.argv
+                STDINPATH    (string) : path to stdin file, instead of testname.stdin
+                cases        (int)    : number of tests the run covers [see run_batch]; the time and 
+                                        output limits are scaled to match
+                max_time     (float)  : time limit of the run, instead of self.max_time
+                clock        (CaseClock) : for a batch run: stdout is copied to STDOUTPATH through it, and 
+                                        each case is timed [see run_batch]
+            Yields: 
+                (dict) : arguments for supervise/supervise_async; files are closed on exit
             Note:  
                 If there is a testname.stdin file then it is used as stdin.                
         """
         if self.exec_command:
             exec_cmds = self.exec_command.split()
         else:
-            exec_cmds = [self.executable] + self.argv
+            exec_cmds = [executable or self.executable] + (self.argv if argv is None else argv)
 
         if exec_prepend:
             exec_cmds = exec_prepend + exec_cmds
 
-        stdin = open(self.fpaths['stdin'], 'r') if os.path.exists(self.fpaths['stdin']) else None
+        STDINPATH = STDINPATH or self.fpaths['stdin']
+        stdin     = open(STDINPATH, 'r') if os.path.exists(STDINPATH) else None
         
         if STDOUTPATH:
             stdout = open(STDOUTPATH, 'wb')
@@ -400,79 +1495,93 @@ class Test:
             stdout = open('/dev/null', 'wb')
             stderr = open('/dev/null', 'wb')
 
-        result = RUN(exec_cmds,
-                     timeout=self.max_time,
-                     stdin=stdin,
-                     cwd=BUILD_DIR,
-                     preexec_fn=self.limit_virtual_memory if user == "student" else None,
-                     stdout=stdout,
-                     stderr=stderr,
-                     user=user)
+        args = dict(cmd_ary=exec_cmds,
+                    timeout=(max_time or self.max_time) * cases,
+                    stdin=stdin,
+                    cwd=BUILD_DIR,
+                    limits=self.limits(limit_memory and user == "student", limit_output, cases),
+                    stdout=stdout,
+                    stderr=stderr,
+                    user=user)
+        if clock:
+            clock.out = stdout
+            args.update(stdout=subprocess.PIPE, clock=clock)
+        try:
+            yield args
+        finally:
+            for f in [stdin, stdout, stderr]:
+                if f != None:
+                    f.close()
+
+    def run_exec(self, **kwargs):
+        """
+            Purpose: 
+                Run self.executable [see exec_args for the parameters]
+            Returns: 
+                (Supervised) : exit status and resource usage of the process run
+        """
+        with self.exec_args(**kwargs) as args:
+            return supervise(**args)
 
-        for f in [stdin, stdout, stderr]:
-            if f != None:
-                f.close()
+    async def run_exec_async(self, **kwargs):
+        with self.exec_args(**kwargs) as args:
+            return await supervise_async(**args)
 
-        return result.returncode
+    def test_exec_args(self, user):
+        return dict(STDOUTPATH=self.fpaths['stdout'], STDERRPATH=self.fpaths['stderr'], user=user, limit_output=True)
 
     def run_test(self, user="student"):
         """
             Purpose: 
                 Runs the 'standard' test and sets variables associated with pass / failure
-            Notes:
-                add ../../ to memtime file because we'll be running from testset/build/ directory and 
-                valgrind writes to a local path. 
         """
-        # always produce a memtime file - helpful for debugging. 
-        prepend = ['/usr/bin/time', '-o', self.fpaths['memtime'], '-f', '%M %S %U']
-        
-        test_rcode = self.run_exec(exec_prepend=prepend,
-                                   STDOUTPATH=self.fpaths['stdout'],
-                                   STDERRPATH=self.fpaths['stderr'],
-                                   user=user)
+        self.record_test(self.run_exec(**self.test_exec_args(user)))
 
-        test_rcode       = abs(test_rcode)               # returns negative value if killed by signal
-        self.exit_status = test_rcode
-        self.timed_out   = test_rcode == 124
-        self.segfault    = test_rcode in [11, 139]
+    async def run_test_async(self, user="student"):
+        self.record_test(await self.run_exec_async(**self.test_exec_args(user)))
+
+    def record_test(self, result):
+        """
+            Purpose: 
+                Sets variables associated with pass / failure from the result of the 'standard' test
+            Notes:
+                Exit status, signal, timeout, peak RSS, and cpu times all come from the 
+                supervisor [see supervise].
+        """
+        self.exit_status = result.returncode
+        self.term_signal = result.term_signal
+        self.timed_out   = result.timed_out
+        self.max_rss     = result.max_rss
+        self.user_time   = result.user_time
+        self.sys_time    = result.sys_time
+        self.wall_time   = result.wall_time
+        self.segfault    = result.term_signal == signal.SIGSEGV or result.returncode == 11
+        self.output_limit_exceeded = result.term_signal == signal.SIGXFSZ     # [see Test.limits]
 
         # exitcode 134 is 'interrupted by exit code 6'
         if self.exit_status in [6, 134] and self.exitcodepass in [6, 134]:
             self.exit_status = self.exitcodepass
 
-        self.max_ram_exceeded    = False
+        self.max_ram_exceeded    = self.max_ram != -1 and self.max_rss is not None and self.max_rss > self.max_ram
         self.kill_limit_exceeded = False
 
-        # ISSUE: if process is killed, no memtime output file is produced; then we need to rely on valgrind results
-        if os.path.exists(self.fpaths['memtime']):
-            memdata = Path(self.fpaths['memtime']).read_text()
-            if memdata != '':               # this might happen if timeout kills program
-                memlines = memdata.splitlines()
-
-                # sometimes with errors (see below), max_rss info won't be first line; guaranteed to be last line in file
-                max_rss = int(memlines[-1].split()[0])  
-                self.max_ram_exceeded = (self.max_ram != -1 and max_rss > self.max_ram)
-
-                # TODO: REFACTOR THIS. Potentially add a new failure condition of uncaught exception, assuming 
-                #       that the kill_limit isn't breached. 
-                # signal 6 is SIGABRT; usually this is sent when kill limit is exceeded, 
-                # however sometimes a program will terminate by throwing an uncaught exception, which produces SIGABRT
-                # we attempt to deal with this by checking if the max_ram value is exceeded and that the program doesn't
-                # expect a return code of 6; if not it's likely that
-                # it's just an uncaught exception; if so, we assume kill limit is exceeded.  
-                if "Command terminated by signal 6" in memlines[0] and self.exitcodepass != 6 and self.max_ram_exceeded:
-                    self.kill_limit_exceeded = True
-
-                elif "Command terminated by signal 9" in memlines[0]:
-                    print("Please share the following note with a TA")
-                    print("This is NOT a usual kill_limit_exceeded occurrence. If you see this, odds are that the ")
-                    print("kill limit for the assignment is less than that of the container. Sometimes you just forgot ")
-                    print("to up the value for a memory-heavy assignment, but other times things actually do bug out ")
-                    print("on gradescope's side and the container's actual RAM value isn't what it seems. Saving an ")
-                    print("'incorrect' value in the gs web interface for the assignment settings, and then saving the ")
-                    print("correct value after that should fix the issue.")
-                    self.kill_limit_exceeded = True
-                
+        # SIGABRT is usually sent when kill limit is exceeded, however sometimes a program will 
+        # terminate by throwing an uncaught exception, which produces SIGABRT. We attempt to deal 
+        # with this by checking if the max_ram value is exceeded and that the program doesn't
+        # expect a return code of 6; if not it's likely that it's just an uncaught exception.
+        if self.term_signal == signal.SIGABRT and self.exitcodepass != 6 and self.max_ram_exceeded:
+            self.kill_limit_exceeded = True
+
+        # we only send SIGKILL on timeout; otherwise it came from the os
+        elif self.term_signal == signal.SIGKILL and not self.timed_out:
+            print("Please share the following note with a TA")
+            print("This is NOT a usual kill_limit_exceeded occurrence. If you see this, odds are that the ")
+            print("kill limit for the assignment is less than that of the container. Sometimes you just forgot ")
+            print("to up the value for a memory-heavy assignment, but other times things actually do bug out ")
+            print("on gradescope's side and the container's actual RAM value isn't what it seems. Saving an ")
+            print("'incorrect' value in the gs web interface for the assignment settings, and then saving the ")
+            print("correct value after that should fix the issue.")
+            self.kill_limit_exceeded = True
 
         # Checking for std::bad_alloc is a bit bittle.
         if not self.kill_limit_exceeded and os.path.exists(self.fpaths['stderr']):
@@ -483,6 +1592,75 @@ class Test:
             if "std::bad_alloc" in stderrdata:
                 self.kill_limit_exceeded = True
 
+    def valgrind_command(self, error_exitcode=True, log_file=None):
+        return [
+            "valgrind",
+            "--show-leak-kinds=all",            # gimme all the leaks
+            "--leak-check=full",                # catch all kinds of leaks
+            "--errors-for-leak-kinds=none",     # separate errors from leaks
+        ] + (["--error-exitcode=1"] if error_exitcode else []) + [     # errors return 1
+            f"--log-file={log_file or self.fpaths['valgrind']}"
+        ]
+
+    @property
+    def runs_once(self):
+        """
+            Whether the program is run just once, under valgrind, for both the 'standard' test and the
+            valgrind test [see run_single]: single_run is set, and no limit needs the timing or memory 
+            usage of an uninstrumented run [max_ram, or a max_time other than the default]
+        """
+        return (self.single_run and self.valgrind and not self.asan_executable
+                and self.max_ram == -1 and self.max_time == TestConfig.max_time)
+
+    @property
+    def batch_key(self):
+        """
+            Tests with the same key run as the cases of one process [see run_batch]; None if this test 
+            runs on its own. A test can't be batched if it has a stdin file [stdin lists the cases] or 
+            a max_ram [which needs its own peak memory usage].
+        """
+        if not self.batch or self.exec_command or self.max_ram != -1 or os.path.exists(self.fpaths['stdin']):
+            return None
+        return (self.executable, self.valgrind, self.memcheck_engine, self.max_time, self.valgrind_max_time,
+                self.file_size_limit)
+
+    def run_single(self, user="student"):
+        """
+            Purpose:
+                Runs the program under valgrind with its output streams captured, and sets the variables 
+                of both the 'standard' test and the valgrind test from that one run
+            Notes:
+                Valgrind isn't given --error-exitcode here, so the exit status is the program's own 
+                [valgrind exits with the program's status, or is killed by the same signal].
+                The run is held to max_time, though valgrind slows the program down, and the valgrind 
+                log is written under its RLIMIT_FSIZE. So if the run times out or is killed, or the log 
+                reaches file_size_limit, the test is run the usual way instead [the program on its own, 
+                then under valgrind]: valgrind's overhead, or a long memcheck report, can only cost the 
+                test its valgrind result, as it would without single_run.
+        """
+        result = self.run_exec(exec_prepend=self.valgrind_command(error_exitcode=False), **self.test_exec_args(user))
+        if self.needs_separate_runs(result):
+            self.run_test(user=user)
+            self.run_valgrind(user=user)
+            return
+        self.record_test(result)
+        self.record_valgrind(result)
+
+    async def run_single_async(self, user="student"):
+        result = await self.run_exec_async(exec_prepend=self.valgrind_command(error_exitcode=False), **self.test_exec_args(user))
+        if self.needs_separate_runs(result):
+            await self.run_test_async(user=user)
+            await self.run_valgrind_async(user=user)
+            return
+        self.record_test(result)
+        self.record_valgrind(result)
+
+    def needs_separate_runs(self, result):
+        if result.timed_out or result.term_signal == signal.SIGKILL:
+            return True
+        path = self.fpaths['valgrind']
+        return os.path.exists(path) and os.path.getsize(path) >= self.file_size_limit
+
     def run_valgrind(self, user="student"):
         """
             Purpose: 
@@ -491,33 +1669,109 @@ class Test:
                 Valgrind will be killed by the os if memory usage exceeds kill_limit; 
                 in practice, this usually only happens if the 'main' test has the same issue; 
                 the 'main' test should show a segfault; here, we will set max_ram_exceeded to true
+                With memcheck_engine = "asan", the sanitizer build runs instead [see asan_run]; 
+                valgrind is still run if there is no sanitizer build, or the sanitizer fails.
         """
         if self.valgrind:
-            valgrind_command = [
-                "valgrind",
-                "--show-leak-kinds=all",            # gimme all the leaks
-                "--leak-check=full",                # catch all kinds of leaks
-                "--errors-for-leak-kinds=none",     # separate errors from leaks
-                "--error-exitcode=1",               # errors return 1
-                f"--log-file={self.fpaths['valgrind']}"
-            ]
-            self.valgrind_rcode = self.run_exec(valgrind_command, user=user)
-            if not os.path.exists(self.fpaths['valgrind']):
-                self.valgrind_passed     = False
-                self.memory_leaks        = False
-                self.memory_errors       = True
-                self.kill_limit_exceeded = True     # valgrind killed so no output file produced
-                self.valg_out_of_mem     = True
-            else:
-                valgrind_output      = Path(self.fpaths['valgrind']).read_text()
-                self.memory_leaks    = MEMLEAK_PASS not in valgrind_output
-                self.memory_errors   = MEMERR_PASS not in valgrind_output
-                self.valg_out_of_mem = VALG_NO_MEM in valgrind_output
-                
-                # if kill limit exceeded in test valgrind fails, but it can't throw errors :/
-                self.valgrind_passed = not self.memory_leaks and not self.memory_errors and not self.valg_out_of_mem and not self.kill_limit_exceeded
-
-    def run_diff(self, filea, fileb, filec, stream=None, canonicalize=False):
+            if self.asan_executable:
+                with self.asan_run() as args:
+                    result = self.run_exec(user=user, max_time=self.valgrind_max_time, **args)
+                if self.record_asan(result):
+                    return
+            self.record_valgrind(self.run_exec(exec_prepend=self.valgrind_command(), user=user, max_time=self.valgrind_max_time))
+
+    async def run_valgrind_async(self, user="student"):
+        if self.valgrind:
+            if self.asan_executable:
+                with self.asan_run() as args:
+                    result = await self.run_exec_async(user=user, max_time=self.valgrind_max_time, **args)
+                if self.record_asan(result):
+                    return
+            self.record_valgrind(await self.run_exec_async(exec_prepend=self.valgrind_command(), user=user,
+                                                           max_time=self.valgrind_max_time))
+
+    @property
+    def asan_executable(self):
+        """
+            The sanitizer build of self.executable [see compile_asan_variants], or None to use valgrind
+        """
+        if self.memcheck_engine != "asan" or self.exec_command:
+            return None
+        exe = os.path.abspath(os.path.join(ASAN_BUILD_DIR, normalize_target(self.executable)))
+        return exe if os.path.exists(exe) else None
+
+    @contextmanager
+    def asan_run(self, log_file=None):
+        """
+            Purpose:
+                Prepare to run the sanitizer build in place of valgrind
+            Yields:
+                (dict) : arguments for run_exec/run_exec_async
+            Notes:
+                The sanitizer writes a report per process [if it finds anything] to a scratch directory;
+                they are collected into fpaths['asan'] on exit. The run isn't held to kill_limit, since the 
+                sanitizer reserves a huge [mostly untouched] shadow memory region up front.
+                log_file, if given, is used instead of fpaths['asan'].
+        """
+        log_file = log_file or self.fpaths['asan']
+        reports  = f"{log_file}.d"
+        os.makedirs(reports, exist_ok=True)
+        os.chmod(reports, 0o777)
+        try:
+            yield dict(executable=self.asan_executable,
+                       exec_prepend=["env", f"ASAN_OPTIONS={ASAN_OPTIONS}:log_path={reports}/report"],
+                       limit_memory=False)
+        finally:
+            with open(log_file, 'wb') as out:
+                for f in sorted(os.listdir(reports)):
+                    with open(os.path.join(reports, f), 'rb') as report:
+                        shutil.copyfileobj(report, out)
+            shutil.rmtree(reports, ignore_errors=True)
+
+    def record_asan(self, result):
+        """
+            Purpose:
+                Sets the variables associated with valgrind pass / failure from a run of the sanitizer build
+            Returns:
+                False if the sanitizer couldn't check the program [e.g. LeakSanitizer can't run in this 
+                container], in which case nothing is set and valgrind should be run instead
+        """
+        report = parse_asan_log(self.fpaths['asan'])
+        if report["unavailable"]:
+            return False
+        if result.timed_out or result.term_signal:
+            report["errors"] = report["contexts"] = report["suppressed"] = None     # its reports may be missing
+        self.valgrind_rcode     = result.returncode
+        self.valgrind_wall_time = result.wall_time
+        self.record_memcheck(report)
+        return True
+
+    def record_valgrind(self, result):
+        self.valgrind_rcode     = result.returncode
+        self.valgrind_wall_time = result.wall_time
+        if not os.path.exists(self.fpaths['valgrind']):
+            self.valgrind_passed     = False
+            self.memory_leaks        = False
+            self.memory_errors       = True
+            self.kill_limit_exceeded = True     # valgrind killed so no output file produced
+            self.valg_out_of_mem     = True
+        else:
+            self.record_memcheck(parse_valgrind_log(self.fpaths['valgrind']))
+
+    def record_memcheck(self, report):
+        """
+            Purpose:
+                Sets the variables associated with valgrind pass / failure from a parsed valgrind or sanitizer report
+        """
+        self.valgrind_report = report
+        self.memory_leaks    = not report["all_freed"]
+        self.memory_errors   = (report["errors"], report["contexts"], report["suppressed"]) != (0, 0, 0)
+        self.valg_out_of_mem = report["out_of_memory"]
+        
+        # if kill limit exceeded in test valgrind fails, but it can't throw errors :/
+        self.valgrind_passed = not self.memory_leaks and not self.memory_errors and not self.valg_out_of_mem and not self.kill_limit_exceeded
+
+    def run_diff(self, filea, fileb, filec, stream=None, canonicalize=False, reuse_ccized=True):
         """
             Purpose:
                 Run diff on filea and fileb, and write the output to filec
@@ -530,13 +1784,19 @@ class Test:
                 filec        (str)  : file to write diff output to
                 stream       (str)  : which output stream is being diff'd 
                 canonicalize (bool) : whether or not to run diff on canonicalized output.
+                reuse_ccized (bool) : whether identical output may take the reference's canonicalized 
+                                      output instead of running the canonicalizer
             Returns: 
                 (int) the return code of the diff.
             Notes:                
-                I like pretty diffs, so icdiff is an option. :) 
-                Am doing diffs with subprocess shell=True. Otherwise will have 
-                problems with any non-utf8 output [encountered with largeGutenberg in gerp]. 
-                [TODO] refactor to use RUN?                        
+                I like pretty diffs, so side-by-side diffs are an option. :) 
+                Diffs are done in-process on bytes [see diff_files], so non-utf8 output 
+                is fine [encountered with largeGutenberg in gerp]. 
+                Identical output is detected by size and digest [see same_as_reference], 
+                and skips canonicalization when the reference has canonicalized output to copy 
+                [never when building reference output: the canonicalizer may have changed 
+                since]. A failing diff is not written here: it is added
+                to pending_diffs, and written by render_diffs when it is reported.
         """
         if not os.path.exists(filea):
             return 2               # diff's non-existing file return code
@@ -554,7 +1814,16 @@ class Test:
             INFORM(f"reference output missing for: {self.testname} file: {os.path.basename(fileb)}" + "- ignore if building reference output",
                    color=MAGENTA)
         
-        if canonicalize:
+        same = same_as_reference(filea, fileb)
+
+        if canonicalize and same and reuse_ccized and os.path.exists(f"{fileb}.ccized"):
+            # identical output is canonicalized identically - reuse the reference's
+            shutil.copyfile(f"{fileb}.ccized", f"{filea}.ccized")
+            filea = f"{filea}.ccized"
+            fileb = f"{fileb}.ccized"
+            filec = f"{filea}.diff"
+
+        elif canonicalize:
             student_bytes = Path(filea).read_bytes()
             solution_bytes = Path(fileb).read_bytes() if os.path.exists(fileb) else None
             try:
@@ -570,50 +1839,48 @@ class Test:
             filea = f"{filea}.ccized"
             fileb = f"{fileb}.ccized"
             filec = f"{filea}.diff"               # => will be original 'filea'.ccized.diff
+            same  = same_as_reference(filea, fileb)
 
-        # icdiff doesn't always return 1 when we expect!
-        diff_result  = subprocess.run(f"diff {filea} {fileb} > {filec} 2> /dev/null", shell=True)
-        diff_retcode = diff_result.returncode
-
-        if self.pretty_diff:
-            # for some wacky reason, icdiff hangs sometimes; we've opened a github issue:
-            # https://github.com/jeffkaufman/icdiff/issues/213
-            try:
-                diff_result = subprocess.run(f"python3 -m icdiff {filea} {fileb} > {filec} 2> /dev/null", shell=True, timeout=5)
-            except subprocess.TimeoutExpired:
-                diff_result = subprocess.run(f"diff {filea} {fileb} > {filec} 2> /dev/null", shell=True)
+        if same is None or same:
+            Path(filec).write_bytes(b"")
+            return 2 if same is None else 0
 
-        return diff_retcode
+        # the diff itself is only written when someone looks at it [see render_diffs]
+        self.pending_diffs.append((filea, fileb, filec))
+        return 1
     
     def truncate_file(self, filepath):
         """
         Purpose:
-            Truncates a file to be only a certain size. This is to prevent
+            Marks a file that was cut off at file_size_limit. This is to prevent
             issues of students (usually inadvertently) creating huge files. 
             One example was found with zap where a student used
             ZapUtil::printTree( ) on a big tree on every test which 
             loaded the container disk space and caused a crash. 
 
-            This function protects against this because after every test
-            is run, before the diffs are run, we truncate down the
-            stdout, stderr, and any produced ofiles. 
+            The limit itself is enforced while the program runs [see Test.limits], 
+            so here the file is at most file_size_limit bytes; if it hit the limit, 
+            the truncation message is appended without reading the file back. Files 
+            written without the limit [e.g. when it's not enforced] are cut down first.
         
         Parameters:
             filepath: str
                 File to be truncated in size -- it is assumed to exist
         """
+        size = os.path.getsize(filepath)
+        if size > self.file_size_limit or (size == self.file_size_limit and self.output_limit_exceeded):
+            os.truncate(filepath, self.file_size_limit)
+            with open(filepath, 'ab') as f:
+                f.write(TRUNCATION_MESSAGE.encode("utf-8"))
 
-        if os.path.getsize(filepath) > self.file_size_limit:
-            with open(filepath, 'rb') as rf:
-                contents = rf.read(self.file_size_limit)
-            with open(filepath, 'wb') as wf:
-                wf.write(contents + TRUNCATION_MESSAGE.encode("utf-8"))
 
-
-    def run_diffs(self):
+    def run_diffs(self, user="student"):
         """
             Purpose:
                 Runs diff tests for stdout, stderr, and any number of other output files            
+            Parameters:
+                user (string) : the user the test ran as; None when building reference output [-n], 
+                                which always runs the canonicalizer [see run_diff]
             ** NOTE ** 
                 Any 'other' output files must of the form: 'testname.ofile'
                 These files will be written to by the student's program        
@@ -622,10 +1889,13 @@ class Test:
         if self.timed_out:
             return
 
+        self.pending_diffs = []
+        reuse_ccized       = user is not None
         if self.diff_stdout:
             self.truncate_file(self.fpaths['stdout'])
             self.stdout_diff_passed = self.run_diff(self.fpaths['stdout'], self.fpaths['ref_stdout'],
-                                                    self.fpaths['stdout.diff'], 'stdout', self.ccize_stdout) == 0
+                                                    self.fpaths['stdout.diff'], 'stdout', self.ccize_stdout,
+                                                    reuse_ccized) == 0
 
         if self.diff_stderr:
             self.truncate_file(self.fpaths['stderr'])
@@ -635,16 +1905,15 @@ class Test:
                 self.fpaths['stderr.diff'],
                 'stderr',
                 self.ccize_stderr,
+                reuse_ccized,
             ) == 0
 
         if self.diff_ofiles:
             self.fout_diffs_passed = True
-            created_files          = os.listdir(REF_OUTPUT_DIR) if os.path.exists(REF_OUTPUT_DIR) else []
-            created_files          = list(set(created_files + os.listdir(OUTPUT_DIR)))
-            self.produced_ofiles   = [x for x in created_files if self.testname in x and x.endswith(".ofile")]
+            self.produced_ofiles   = self.ofiles()
             for ofilename in self.produced_ofiles:
                 retcode = self.run_diff(f"{OUTPUT_DIR}/{ofilename}", f"{REF_OUTPUT_DIR}/{ofilename}",
-                                        f"{OUTPUT_DIR}/{ofilename}.diff", ofilename, self.ccize_ofiles)
+                                        f"{OUTPUT_DIR}/{ofilename}.diff", ofilename, self.ccize_ofiles, reuse_ccized)
                 if retcode == 2:
                     setattr(self, f"{ofilename}_file_exists", False)
 
@@ -652,6 +1921,24 @@ class Test:
                 if not retcode == 0:
                     self.fout_diffs_passed = False
 
+    def ofiles(self):
+        """
+            Purpose:
+                The names of the output files to diff: those in the reference output, and those the 
+                program created among the ofiles its command line names [via ${test_ofile_path}]
+            Notes:
+                If the command line passes the output path without naming an ofile [e.g. just 
+                "${test_ofile_path}"], the program picks the names, so the output dir is indexed.
+        """
+        prefix = f"{OUTPUT_DIR}/{self.testname}"
+        args   = [str(arg) for arg in self.argv] + (shlex.split(self.exec_command) if self.exec_command else [])
+        named  = [os.path.basename(arg) for arg in args if arg.startswith(prefix + '.') and arg.endswith(".ofile")]
+        if any(arg.startswith(prefix) and not arg.endswith(".ofile") for arg in args):
+            produced = OutputIndex(OUTPUT_DIR).find(self.testname, [".ofile"])
+        else:
+            produced = [f for f in named if os.path.exists(os.path.join(OUTPUT_DIR, f))]
+        return sorted(set(reference_index().find(self.testname, [".ofile"]) + produced))
+
     def determine_success(self):
         """
             Purpose:
@@ -678,6 +1965,10 @@ def report_results(TESTS, console=None):
         Purpose:
             Print test results to the terminal                 
     """
+    from rich.console import Console
+    from rich.table import Table, Column
+    from rich import box
+
     report = {
         "segfault"    : { 'test': lambda test: test.segfault,                                    'symbol': "💥", 'mitigation': "See course reference page on debugging segfaults" },
         "timeout"     : { 'test': lambda test: test.timed_out,                                   'symbol': "⏰", 'mitigation': "Infinite loop, or inefficient code" },
@@ -687,6 +1978,7 @@ def report_results(TESTS, console=None):
         "exit code"   : { 'test': lambda test: test.exit_status != test.exitcodepass,            'symbol': "🚪", 'mitigation': "Exit code mismatch. Usually should be EXIT_SUCCESS" },
         "max ram"     : { 'test': lambda test: test.max_ram_exceeded,                            'symbol': "💾", 'mitigation': "Program's memory usage exceeds specified limit" },
         "kill limit"  : { 'test': lambda test: test.kill_limit_exceeded,                         'symbol': "💀", 'mitigation': "Program was killed for excessive memory usage" },
+        "output limit": { 'test': lambda test: test.output_limit_exceeded,                       'symbol': "📜", 'mitigation': "Program was stopped for writing too much output" },
         "build"       : { 'test': lambda test: not test.compiled,                                'symbol': "🔨", 'mitigation': "Unsuccessful build, or wrong executable produced" }
     } 
     FAIL_COLOR = "red"
@@ -717,12 +2009,13 @@ def report_results(TESTS, console=None):
         elif test.success and not test.valgrind:
             table.add_row(prefix, CHECK, DASH if CHECK != "🐘" else "🐘", "")
         elif test.success and not test.valgrind_passed:
+            details = describe_valgrind(test.valgrind_report)
             if test.memory_leaks and test.memory_errors:
-                table.add_row(prefix, CHECK, f":water_wave::thinking_face:", "")
+                table.add_row(prefix, CHECK, f":water_wave::thinking_face:", details)
             elif test.memory_leaks:
-                table.add_row(prefix, CHECK, f":water_wave:", "")
+                table.add_row(prefix, CHECK, f":water_wave:", details)
             elif test.memory_errors:
-                table.add_row(prefix, CHECK, f":thinking_face:", "")
+                table.add_row(prefix, CHECK, f":thinking_face:", details)
         else:
             symbols = ""
             for testtype, test_mitigation_obj in report.items():
@@ -735,38 +2028,640 @@ def report_results(TESTS, console=None):
     
     console.print(table)
 
-    mitigation = Table(Column("Symbol", justify="center"),
-                       Column("Failure Code", justify="left"), 
-                       Column("Details", justify="left"),
-                       box=box.HORIZONTALS)
-    if CHECK == "🐘":
-        mitigation.add_row("🐘", "", "You crushed it! All tests passed!")
-    else:
-        mitigation.add_row("✅", "Test Pass", "Nice work! Test passed")
-        mitigation.add_row("❌", "Test Fail", "Test failed")
-        mitigation.add_row("🚫", "No Valgrind", "Test failed, so no valgrind run [counted as valgrind fail]")
-        mitigation.add_row("➖", "No Valgrind", "No valgrind for this test [not counted as valgrind fail]")
-        for k, v in report.items():
-            mitigation.add_row(v['symbol'], k, v['mitigation'])
-        mitigation.add_row(":water_wave:", "Memory Leak", "Memory leak detected")
-        mitigation.add_row(":thinking_face:", "Memory Error", "Memory error detected")
-    console.print(mitigation)
+    mitigation = Table(Column("Symbol", justify="center"),
+                       Column("Failure Code", justify="left"), 
+                       Column("Details", justify="left"),
+                       box=box.HORIZONTALS)
+    if CHECK == "🐘":
+        mitigation.add_row("🐘", "", "You crushed it! All tests passed!")
+    else:
+        mitigation.add_row("✅", "Test Pass", "Nice work! Test passed")
+        mitigation.add_row("❌", "Test Fail", "Test failed")
+        mitigation.add_row("🚫", "No Valgrind", "Test failed, so no valgrind run [counted as valgrind fail]")
+        mitigation.add_row("➖", "No Valgrind", "No valgrind for this test [not counted as valgrind fail]")
+        for k, v in report.items():
+            mitigation.add_row(v['symbol'], k, v['mitigation'])
+        mitigation.add_row(":water_wave:", "Memory Leak", "Memory leak detected")
+        mitigation.add_row(":thinking_face:", "Memory Error", "Memory error detected")
+    console.print(mitigation)
+
+def run_full_test(tup):
+    test = tup[0]
+    user = tup[1]
+    test.save_status(finished=False)
+    if not test.exec_command and not os.path.exists(os.path.join(BUILD_DIR, test.executable)):
+        test.success  = False
+        test.compiled = False
+        test.save_status(finished=True)
+    else:
+        if test.runs_once:
+            test.run_single(user=user)
+        else:
+            test.run_test(user=user)
+        test.run_diffs(user=user)
+        if not test.runs_once:
+            test.run_valgrind(user=user)
+        test.determine_success()
+        test.save_status(finished=True)
+    return test
+
+def load_runtimes(OPTS):
+    """
+        Purpose:
+            Load the runtime database: how long each test's main and valgrind runs took
+        Returns:
+            dictionary of { testname : {'run': seconds, 'valgrind': seconds} }
+        Notes:
+            Seeded from the reference build [ref_output/runtimes.json], and updated with the 
+            runtimes from earlier runs in the cache directory, which take precedence.
+    """
+    runtimes = {}
+    paths    = [f"{REF_OUTPUT_DIR}/{RUNTIME_DB}"]
+    if not OPTS.get('no_cache'):
+        paths.append(f"{OPTS.get('cache_dir') or CACHE_DIR}/{RUNTIME_DB}")
+    for path in paths:
+        try:
+            runtimes.update(json.loads(Path(path).read_text()))
+        except (FileNotFoundError, ValueError):
+            pass
+    return runtimes
+
+
+def save_runtimes(TESTS, runtimes, OPTS):
+    """
+        Purpose:
+            Record the runtimes of finished tests in the runtime database
+        Notes:
+            Timed-out runs are recorded at their time limit. When building reference output [-n], 
+            the runtimes are also written to results/output, to be copied to ref_output with it.
+    """
+    for test in TESTS.values():
+        if test.wall_time is not None:
+            valgrind = 0 if test.runs_once else test.valgrind_wall_time     # the one run is recorded as 'run'
+            runtimes[test.testname] = {'run': round(test.wall_time, 3), 'valgrind': round(valgrind or 0, 3)}
+
+    paths = []
+    if not OPTS.get('no_cache'):
+        paths.append(f"{OPTS.get('cache_dir') or CACHE_DIR}/{RUNTIME_DB}")
+    if OPTS["no_user"]:
+        paths.append(f"{OUTPUT_DIR}/{RUNTIME_DB}")
+    for path in paths:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Path(f"{path}.{os.getpid()}").write_text(json.dumps(runtimes, indent=4, sort_keys=True))
+        os.replace(f"{path}.{os.getpid()}", path)
+
+
+def estimated_runtime(test, runtimes):
+    """
+        Purpose:
+            Estimate how long test will take: its recorded runtime, or max_time for each of 
+            its runs if it has never been run
+    """
+    if test.testname in runtimes:
+        recorded = runtimes[test.testname]
+        return recorded.get('run', 0) + (recorded.get('valgrind', 0) if test.valgrind else 0)
+    return test.max_time * (2 if test.valgrind and not test.runs_once else 1)
+
+
+def schedule(TESTS, runtimes):
+    """
+        Purpose:
+            Order tests longest-first, so the long tests don't start last and decide the total time
+        Returns:
+            list of tests
+    """
+    return sorted(TESTS.values(), key=lambda test: estimated_runtime(test, runtimes), reverse=True)
+
+
+async def run_full_test_async(test, user, slots):
+    """
+        Purpose:
+            As run_full_test, waiting on the test's processes in the event loop
+        Notes:
+            slots limits the number of tests in flight. Diffs [and canonicalizers] are 
+            run in a worker thread so they don't hold up other tests' processes.
+    """
+    import asyncio
+    async with slots:
+        test.save_status(finished=False)
+        if not test.exec_command and not os.path.exists(os.path.join(BUILD_DIR, test.executable)):
+            test.success  = False
+            test.compiled = False
+            test.save_status(finished=True)
+        else:
+            if test.runs_once:
+                await test.run_single_async(user=user)
+            else:
+                await test.run_test_async(user=user)
+            await asyncio.to_thread(test.run_diffs, user)
+            if not test.runs_once:
+                await test.run_valgrind_async(user=user)
+            test.determine_success()
+            test.save_status(finished=True)
+    return test
+
+
+BATCH_CASE     = re.compile(rb"@@autograde-case (\S+)@@\n")
+BATCH_EXIT     = re.compile(rb"@@autograde-exit (\S+) (-?\d+)@@\n")
+
+
+def split_batch_output(data):
+    """
+        Purpose:
+            Split the output of a batch run by case: each case's output follows its 
+            "@@autograde-case <testname>@@" line, and on stdout ends with "@@autograde-exit <testname> <status>@@"
+        Returns:
+            dictionary of { testname : (output, exit status) } - the status is None if the case didn't finish
+    """
+    cases = list(BATCH_CASE.finditer(data))
+    split = {}
+    for i, case in enumerate(cases):
+        segment = data[case.end():cases[i + 1].start() if i + 1 < len(cases) else len(data)]
+        end     = BATCH_EXIT.search(segment)
+        name    = case.group(1).decode('utf-8', 'replace')
+        if end and end.group(1) == case.group(1):
+            split[name] = (segment[:end.start()], int(end.group(2)))
+        else:
+            split[name] = (segment, None)
+    return split
+
+
+class CaseClock:
+    """
+        Follows the stdout of a batch run as the driver writes it: copies it to out, times each case 
+        from when its markers arrive, and says when the run has to be stopped - when the case it's 
+        on [or its startup, or the gap between cases] has taken case_time seconds, or it has written
+        more than output_limit bytes [stdout is a pipe, so RLIMIT_FSIZE doesn't hold it]
+    """
+    def __init__(self, case_time, output_limit):
+        self.out          = None            # set by Test.exec_args
+        self.case_time    = case_time
+        self.output_limit = output_limit
+        self.written      = 0
+        self.partial      = b""             # the start of a line still being written
+        self.last_marker  = None            # when the last marker arrived [or the run started]
+        self.case         = None            # (testname, start) of the case running
+        self.times        = {}              # { testname : seconds } of the finished cases
+        self.over_limit   = False
+
+    def remaining(self, now, deadline):
+        """
+            Seconds until the run has to be stopped, if nothing more arrives; deadline is the end of 
+            the run's own time limit
+        """
+        self.last_marker = self.last_marker or now
+        return min(deadline, self.last_marker + self.case_time) - now
+
+    def feed(self, data, now):
+        """
+            Purpose:
+                Take output that arrived at now
+            Returns:
+                False if the run has written more than output_limit
+        """
+        if self.written + len(data) > self.output_limit:
+            self.out.write(data[:self.output_limit - self.written])
+            self.over_limit = True
+            return False
+        self.out.write(data)
+        self.written += len(data)
+
+        lines        = (self.partial + data).split(b"\n")
+        self.partial = lines.pop()
+        for line in lines:
+            line += b"\n"
+            if case := BATCH_CASE.search(line):
+                self.case, self.last_marker = (case.group(1), now), now
+            elif (end := BATCH_EXIT.search(line)) and self.case and end.group(1) == self.case[0]:
+                self.times[self.case[0].decode('utf-8', 'replace')] = now - self.case[1]
+                self.case, self.last_marker = None, now
+        return True
+
+
+def batch_paths(tests):
+    base = f"{LOG_DIR}/batch-{tests[0].testname}"
+    return {kind: f"{base}.{kind}" for kind in ["stdin", "stdout", "stderr", "valgrind", "asan"]}
+
+
+@contextmanager
+def batch_run(tests, user):
+    """
+        Purpose:
+            Prepare to run tests as the cases of one process: their executable is run with BATCH_ARGV, 
+            and reads the cases from stdin, one per line - the testname, then the test's argv, tab-separated
+        Yields:
+            (dict) : arguments for run_exec/run_exec_async on tests[0]
+        Notes:
+            The run is under valgrind [or is the sanitizer build] if the tests use valgrind. Its 
+            manifest, output, and memcheck report are kept in LOG_DIR/batch-<first testname>.*
+            Each case is held to the tests' max_time [valgrind_max_time, under valgrind] by a CaseClock, 
+            which times it; the run as a whole to the sum of its cases' limits.
+    """
+    leader   = tests[0]
+    paths    = batch_paths(tests)
+    Path(paths['stdin']).write_text(''.join('\t'.join([test.testname] + test.argv) + '\n' for test in tests))
+    max_time = (leader.valgrind_max_time if leader.valgrind else None) or leader.max_time
+    args     = dict(argv=BATCH_ARGV, STDINPATH=paths['stdin'], STDOUTPATH=paths['stdout'], STDERRPATH=paths['stderr'],
+                    user=user, limit_output=True, cases=len(tests), max_time=max_time,
+                    clock=CaseClock(max_time, leader.file_size_limit * len(tests)))
+    if leader.valgrind and leader.asan_executable:
+        with leader.asan_run(log_file=paths['asan']) as memcheck:
+            yield dict(args, **memcheck)
+    elif leader.valgrind:
+        yield dict(args, exec_prepend=leader.valgrind_command(error_exitcode=False, log_file=paths['valgrind']))
+    else:
+        yield args
+
+
+def record_batch(tests, result, clock):
+    """
+        Purpose:
+            Give each test its output and 'standard' test variables from its case in a batch run
+        Returns:
+            (list, list) : the tests whose case started but didn't finish [the process crashed, or the 
+                           case timed out], or wrote more than file_size_limit - these have to be run on 
+                           their own - and the tests whose case was never reached, which can be batched again
+        Notes:
+            Each case is given the wall time the clock measured between its markers, and the run's cpu 
+            time in proportion to it; peak memory isn't known per case.
+    """
+    paths      = batch_paths(tests)
+    stdouts    = split_batch_output(Path(paths['stdout']).read_bytes())
+    stderrs    = split_batch_output(Path(paths['stderr']).read_bytes())
+    unfinished = []
+    unreached  = []
+    for test in tests:
+        stdout, status = stdouts.get(test.testname, (b"", None))
+        stderr, _      = stderrs.get(test.testname, (b"", None))
+        if test.testname not in stdouts:
+            unreached.append(test)
+            continue
+        if status is None or max(len(stdout), len(stderr)) > test.file_size_limit:
+            unfinished.append(test)
+            continue
+        Path(test.fpaths['stdout']).write_bytes(stdout)
+        Path(test.fpaths['stderr']).write_bytes(stderr)
+        wall_time = clock.times.get(test.testname, 0)
+        share     = wall_time / result.wall_time if result.wall_time else 1 / len(tests)
+        test.record_test(Supervised(returncode=status,
+                                    wall_time=wall_time,
+                                    user_time=result.user_time * share,
+                                    sys_time=result.sys_time * share))
+
+    if len(unreached) == len(tests):            # the driver doesn't take cases from stdin [or never got to]
+        return unreached, []
+    return unfinished, unreached
+
+
+def batch_memcheck(tests, result):
+    """
+        Purpose:
+            The memcheck report of a batch run, if it settles the finished cases: the run wasn't cut 
+            short, and no errors or leaks were found
+        Returns:
+            the report [see parse_valgrind_log], or None if each case has to be checked on its own
+    """
+    paths = batch_paths(tests)
+    if not tests[0].valgrind or result.timed_out or result.term_signal:
+        return None
+    if tests[0].asan_executable:
+        report = parse_asan_log(paths['asan'])
+    elif os.path.exists(paths['valgrind']):
+        report = parse_valgrind_log(paths['valgrind'])
+    else:
+        return None
+    clean = (report["errors"], report["contexts"], report["suppressed"]) == (0, 0, 0) and report["all_freed"]
+    return report if clean and not report["out_of_memory"] and not report.get("unavailable") else None
+
+
+def finish_batched_test(test, report, user="student"):
+    """
+        Purpose:
+            Finish a test whose case finished in a batch run; report is the batch's clean memcheck 
+            report, if there is one [otherwise the test has had its own valgrind run]
+    """
+    if test.valgrind and report:
+        test.valgrind_wall_time = 0                 # the batch run is recorded as the test's 'run'
+        test.record_memcheck(report)
+    test.run_diffs(user=user)
+    test.determine_success()
+    test.save_status(finished=True)
+
+
+def run_batch(tup):
+    """
+        Purpose:
+            Run tests that share an executable as the cases of one process [see batch_run], so 
+            the process [and valgrind] startup is paid once for all of them
+        Returns:
+            list of the finished tests
+        Notes:
+            A test whose case didn't finish is run on its own, and the cases after it are batched 
+            again. If the run's memory check found anything, each test gets its own valgrind run, 
+            so errors are attributed to their case.
+    """
+    tests, user = tup
+    if not os.path.exists(os.path.join(BUILD_DIR, tests[0].executable)):
+        return [run_full_test((test, user)) for test in tests]
+
+    for test in tests:
+        test.save_status(finished=False)
+    with batch_run(tests, user) as args:
+        result = tests[0].run_exec(**args)
+    unfinished, unreached = record_batch(tests, result, args['clock'])
+    report                = batch_memcheck(tests, result)
+    for test in tests:
+        if test in unfinished:
+            run_full_test((test, user))
+        elif test not in unreached:
+            if test.valgrind and not report:
+                test.run_valgrind(user=user)
+            finish_batched_test(test, report, user)
+    if unreached:
+        run_unit((unreached, user))
+    return tests
+
+
+async def run_batch_async(tests, user, slots):
+    """
+        Purpose:
+            As run_batch, waiting on the processes in the event loop
+    """
+    import asyncio
+    if not os.path.exists(os.path.join(BUILD_DIR, tests[0].executable)):
+        return [await run_full_test_async(test, user, slots) for test in tests]
+
+    async with slots:
+        for test in tests:
+            test.save_status(finished=False)
+        with batch_run(tests, user) as args:
+            result = await tests[0].run_exec_async(**args)
+        unfinished, unreached = record_batch(tests, result, args['clock'])
+        report                = batch_memcheck(tests, result)
+        for test in tests:
+            if test in unfinished or test in unreached:
+                continue
+            if test.valgrind and not report:
+                await test.run_valgrind_async(user=user)
+            await asyncio.to_thread(finish_batched_test, test, report, user)
+    await asyncio.gather(*[run_full_test_async(test, user, slots) for test in unfinished],
+                         *([run_unit_async(unreached, user, slots)] if unreached else []))
+    return tests
+
+
+def batch_units(tests):
+    """
+        Purpose:
+            Group the tests that can run as one batch [see Test.batch_key]
+        Returns:
+            list of lists of tests - a test on its own, or a batch - in the order of their first test
+    """
+    units = {}
+    for test in tests:
+        units.setdefault(test.batch_key or test.testname, []).append(test)
+    return list(units.values())
+
+
+def run_unit(tup):
+    tests, user = tup
+    return run_batch(tup) if len(tests) > 1 else [run_full_test((tests[0], user))]
+
+
+async def run_unit_async(tests, user, slots):
+    if len(tests) > 1:
+        return await run_batch_async(tests, user, slots)
+    return [await run_full_test_async(tests[0], user, slots)]
+
+
+async def run_tests_async(units, user, jobs):
+    """
+        Purpose:
+            Run all tests from one event loop, jobs at a time, starting them in the order given
+        Parameters:
+            units (list) : lists of tests to run together [see batch_units]
+        Returns: 
+            List of finished tests, in the same order as units
+    """
+    import asyncio
+    from tqdm import tqdm
+    slots = asyncio.Semaphore(jobs)
+    tasks = [asyncio.create_task(run_unit_async(unit, user, slots)) for unit in units]
+    with tqdm(total=len(tasks), ncols=60) as progress:
+        for finished in asyncio.as_completed(tasks):
+            await finished
+            progress.update()
+    return [test for task in tasks for test in task.result()]
+
+
+def runtime_inputs_digest(TESTS):
+    """
+        Purpose:
+            Hash what every test's result depends on besides its own files [see result_cache_key]: the 
+            autograder, the canonicalizers, and the files in BUILD_DIR a program could read as it runs - 
+            the copied and linked testset files, and the submission's files other than its code
+        Notes:
+            Sources, objects, the Makefile, and the tests' executables are left out: the code only 
+            matters through the executables, which each test hashes itself.
+    """
+    h = new_hash()
+    for path in [os.path.abspath(__file__), f"{CWD}/canonicalizers.py"]:
+        if os.path.exists(path):
+            hash_file(h, path)
+
+    executables = {normalize_target(test.executable) for test in TESTS.values() if test.executable}
+    for d, dirs, files in os.walk(BUILD_DIR, followlinks=True):
+        dirs.sort()
+        for f in sorted(files):
+            if f in executables or f == "Makefile" or f.endswith(SOURCE_EXTS + HEADER_EXTS + ('.o', '.gch')):
+                continue
+            path = os.path.join(d, f)
+            h.update(os.path.relpath(path, BUILD_DIR).encode())
+            hash_file(h, path)
+    return h.hexdigest()
+
+
+def portable_path(path):
+    """
+        Purpose:
+            path with RESULTS_DIR or CWD replaced by a placeholder, so a result cache entry can be 
+            restored into another submission's results directory [see local_path]
+    """
+    for placeholder, d in [("${results}", RESULTS_DIR), ("${root}", CWD)]:
+        if path == d or path.startswith(d + os.sep):
+            return placeholder + path[len(d):]
+    return path
+
+
+def local_path(path):
+    for placeholder, d in [("${results}", RESULTS_DIR), ("${root}", CWD)]:
+        if path.startswith(placeholder):
+            return d + path[len(placeholder):]
+    return path
+
+
+def portable_config(test, exclude=()):
+    """
+        Returns:
+            test's configuration [less the fields in exclude] as JSON, with the autograder's and 
+            results directories replaced by placeholders [see portable_path]
+    """
+    config = json.dumps({f.name: getattr(test, f.name) for f in fields(TestConfig) if f.name not in exclude},
+                        sort_keys=True, default=str)
+    return config.replace(RESULTS_DIR, '${results}').replace(CWD, '${root}')
+
+
+def result_cache_key(test, user, base, digests):
+    """
+        Purpose:
+            The result cache key of test: a hash of everything its result depends on
+        Parameters:
+            test    (Test)   : the test
+            user    (string) : user the test runs as
+            base    (string) : digest shared by all tests [see runtime_inputs_digest]
+            digests (dict)   : { path : digest } of the files hashed so far, shared between tests
+        Returns:
+            hex digest, or None if the test has no executable to run
+        Notes:
+            Besides base, the key covers the test's configuration [with the autograder's and results 
+            directories left out, so identical submissions graded in different directories share entries], its 
+            executable [and sanitizer build], its stdin file, and its reference output.
+            The executable is represented by its compile cache key when it has one [see compile_exec], 
+            not by its bytes: debug builds embed the directory they were built in, so the same sources 
+            built for two submissions never produce the same binary.
+    """
+    exe = os.path.join(BUILD_DIR, test.executable) if test.executable else None
+    if not test.exec_command and not os.path.exists(exe):
+        return None
+
+    h = new_hash()
+    h.update(f"{base}:{user}:{portable_config(test)}".encode())
+
+    paths = [test.fpaths['stdin']] + [os.path.join(REF_OUTPUT_DIR, f) for f in reference_index().find(test.testname)]
+    if not test.exec_command:
+        built = Path(f"{LOG_DIR}/{normalize_target(test.executable)}.compile.key")
+        if built.exists():
+            h.update(f"build:{built.read_text()}:{bool(test.asan_executable)}".encode())
+        else:
+            paths += [exe] + ([test.asan_executable] if test.asan_executable else [])
+    for path in paths:
+        if os.path.exists(path):
+            if path not in digests:
+                digests[path] = hash_file(new_hash(), path).hexdigest()
+            h.update(f"{portable_path(path)}:{digests[path]}".encode())
+    return h.hexdigest()
+
+
+def store_result(test, key, cache, outputs):
+    """
+        Purpose:
+            Save test's result and its files in OUTPUT_DIR to the result cache under key
+        Parameters:
+            outputs (OutputIndex) : index of OUTPUT_DIR
+        Notes:
+            An entry is a zip of the test's files and RESULT_ENTRY: its TestResult fields [with 
+            portable paths], and its per-ofile results. Results that depend on the load 
+            of the machine [timeouts, running out of memory] aren't saved.
+    """
+    if test.timed_out or test.kill_limit_exceeded or test.valg_out_of_mem:
+        return
+    result = {name: getattr(test.result, name) for name in TestResult.__slots__}
+    result["pending_diffs"] = [[portable_path(path) for path in diff] for diff in test.pending_diffs]
+    ofiles = {name: value for name, value in test.overrides.items() if name.endswith(("_diff_passed", "_file_exists"))}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        entry = os.path.join(tmp, "entry.zip")
+        with zipfile.ZipFile(entry, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr(RESULT_ENTRY, json.dumps({"result": result, "ofiles": ofiles}, default=str))
+            for f in outputs.find(test.testname):
+                z.write(os.path.join(OUTPUT_DIR, f), f)
+        cache.put(key, entry)
+
+
+def restore_result(test, key, cache):
+    """
+        Purpose:
+            Restore test's result and files from the result cache [see store_result]
+        Returns:
+            True on a hit
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        entry = os.path.join(tmp, "entry.zip")
+        if not cache.get(key, entry):
+            return False
+        try:
+            with zipfile.ZipFile(entry) as z:
+                saved = json.loads(z.read(RESULT_ENTRY))
+                for f in z.namelist():
+                    if f != RESULT_ENTRY:
+                        z.extract(f, OUTPUT_DIR)
+        except (zipfile.BadZipFile, KeyError, ValueError):
+            return False
+
+    for name, value in saved["result"].items():
+        setattr(test, name, value)
+    test.pending_diffs = [tuple(local_path(path) for path in diff) for diff in saved["result"]["pending_diffs"]]
+    for name, value in saved["ofiles"].items():
+        setattr(test, name, value)
+    return True
+
+
+def result_cache(TESTS, OPTS):
+    """
+        Returns:
+            the result cache, or None if it isn't used [with --no-cache, or for reference output]
+    """
+    if not TESTS or OPTS.get('no_cache') or OPTS["no_user"]:
+        return None
+    return ArtifactCache(f"{OPTS.get('cache_dir') or CACHE_DIR}/results",
+                         next(iter(TESTS.values())).result_cache_size * 1024 * 1024)
+
 
-def run_full_test(tup):
-    test = tup[0]
-    user = tup[1]
-    test.save_status(finished=False)
-    if not test.exec_command and not os.path.exists(os.path.join(BUILD_DIR, test.executable)):
-        test.success  = False
-        test.compiled = False
-        test.save_status(finished=True)
-    else:
-        test.run_test(user=user)
-        test.run_diffs()
-        test.run_valgrind(user=user)
-        test.determine_success()
+def restore_results(TESTS, cache, user):
+    """
+        Purpose:
+            Restore the results of the tests that have an entry in the result cache
+        Returns:
+            ({ testname : cache key, or None }, { testname : restored Test })
+    """
+    base    = runtime_inputs_digest(TESTS)
+    digests = {}
+    keys    = {name: result_cache_key(test, user, base, digests) for name, test in TESTS.items()}
+    cached  = {name: test for name, test in TESTS.items() if keys[name] and restore_result(test, keys[name], cache)}
+    for test in cached.values():
         test.save_status(finished=True)
-    return test
+    return keys, cached
+
+
+def store_results(TESTS, keys, cache):
+    """
+        Purpose:
+            Save the results of finished tests to the result cache, and keep it within its size
+    """
+    outputs = OutputIndex(OUTPUT_DIR)
+    for name, test in TESTS.items():
+        if keys.get(name):
+            store_result(test, keys[name], cache, outputs)
+    cache.evict()
+
+
+def load_staff_artifacts(TESTS):
+    """
+        Purpose:
+            Load the testset's read-only artifacts into this process's caches: the reference output 
+            index and digests, the up-to-date prebuilt staff objects, the canonicalizers, and the rss_shim
+        Notes:
+            Worker processes forked afterwards inherit them instead of loading them again; the 
+            class grader loads them once for every submission.
+    """
+    rss_shim()
+    reference_index()
+    load_digest_index(REF_OUTPUT_DIR)
+    manifest = load_prebuilt_manifest()
+    if manifest:
+        current_prebuilt_units(manifest["command"], TESTSET_DIR)
+    if any(test.ccizer_name for test in TESTS.values()):
+        load_canonicalizers()
+
 
 def run_tests(TESTS, OPTS):
     """
@@ -775,35 +2670,58 @@ def run_tests(TESTS, OPTS):
         Returns: 
             List of finished tests
         Notes: 
-            Tests are run in parallel, on per process       
+            With the 'process' engine, tests are run in parallel, on per process. 
+            With the 'asyncio' engine, tests are run in this process, and only the 
+            student programs [and valgrind] run in parallel.
+            Parallel tests are started longest-first [see schedule]; results are returned in 
+            the original order. Tests with the batch option that share an executable are run 
+            together [see run_batch].
+            A test whose executable, inputs, reference output, and configuration are unchanged 
+            since an earlier run has its result restored from the result cache instead of being 
+            run [see result_cache_key]; the cache isn't used with --no-cache, or for reference output.
             Make sure to store result as list before returning
     """
-    INFORM(f"🕐 Running {len(TESTS)} test{'s' if len(TESTS) > 1 else ''}", color=BLUE)
-    user = None if OPTS["no_user"] else "student"
-    if OPTS['jobs'] == 1:
-        return {test.testname: run_full_test((test, user)) for test in TESTS.values()}
+    user     = None if OPTS["no_user"] else "student"
+    runtimes = load_runtimes(OPTS)
+    order    = list(TESTS.keys())
+    load_staff_artifacts(TESTS)             # loaded once here, and inherited by the worker processes
+
+    keys, cached = {}, {}
+    cache        = result_cache(TESTS, OPTS)
+    if cache:
+        keys, cached = restore_results(TESTS, cache, user)
+        if cached:
+            INFORM(f"📦 Restored {len(cached)} test result{'s' if len(cached) > 1 else ''} from the result cache", color=CYAN)
+        TESTS = {name: test for name, test in TESTS.items() if name not in cached}
+
+    INFORM(f"🕐 Running {len(TESTS)} test{'s' if len(TESTS) != 1 else ''}", color=BLUE)
+    if OPTS['engine'] == 'asyncio':
+        import asyncio
+        result = asyncio.run(run_tests_async(batch_units(schedule(TESTS, runtimes)), user, OPTS['jobs']))
+        TESTS  = {test.testname: test for test in result}
+    elif OPTS['jobs'] == 1:
+        TESTS = {test.testname: test for unit in batch_units(TESTS.values()) for test in run_unit((unit, user))}
     else:
-        result = process_map(run_full_test, [(x, user) for x in TESTS.values()], ncols=60, max_workers=OPTS['jobs'])
-        return {test.testname: test for test in result}
+        from tqdm.contrib.concurrent import process_map
+        result = process_map(run_unit, [(x, user) for x in batch_units(schedule(TESTS, runtimes))], ncols=60, max_workers=OPTS['jobs'])
+        TESTS  = {test.testname: test for unit in result for test in unit}
 
-def compile_exec(target, OPTS):
-    """
-        Purpose:    
-            compile the target executable in BUILD_DIR    
-        Parameters: 
-            target to build
-        Effects:    
-            writes result of compilation to the right place 
-        Returns:    
-            whether or not the compilation was successful
-    """
-    if not target:
-        return 0
+    if cache:
+        store_results(TESTS, keys, cache)
+    TESTS = {testname: cached[testname] if testname in cached else TESTS[testname] for testname in order}
 
-    # if student provides executable, remove it.
-    if os.path.exists(os.path.join(BUILD_DIR, target)):
-        os.remove(os.path.join(BUILD_DIR, target))
+    save_runtimes(TESTS, runtimes, OPTS)
+
+    # reference output is built without the student user; index it with the output
+    if OPTS["no_user"]:
+        write_digest_index(OUTPUT_DIR)
+    return TESTS
 
+def normalize_target(target):
+    """
+        Purpose:
+            Turn a test's executable (e.g. './test01') into the name of the make target to build
+    """
     if target[:2] == './':
         target = target[2:]               # remove the './' prefix
 
@@ -814,13 +2732,226 @@ def compile_exec(target, OPTS):
         else: schar             = '\\'
         target                  = target.split(schar)[-1]
 
-    user = None if OPTS["no_user"] else "student"
+    return target
+
+
+def make_prerequisites(targets, user, timeout):
+    """
+        Purpose:
+            Ask make for the prerequisites of each of the given targets, without building anything
+        Parameters:
+            targets (list)   : make targets to look up
+            user    (string) : user to run make as
+            timeout (int)    : timeout in seconds
+        Returns:
+            dictionary of { target : [prerequisites] } [order-only prerequisites are dropped]
+        Notes:
+            Parses make's database (make -p -q), which lists every file target with its
+            prerequisites fully expanded - so pattern and variable-generated targets work too.
+    """
+    db = RUN(["make", "--print-data-base", "--question"] + targets, cwd=BUILD_DIR, timeout=timeout,
+             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, user=user).stdout
+
+    prereqs  = {}
+    in_files = False
+    for line in db.splitlines():
+        if line.startswith("# Files"):
+            in_files = True
+        elif line.startswith("# files hash-table stats"):
+            break
+        elif in_files:
+            rule = re.match(r"^([^#\s][^:=]*?)::?(?!=)\s*(.*)$", line)
+            if rule and rule.group(1) in targets:
+                prereqs[rule.group(1)] = rule.group(2).split('|')[0].split()
+    return prereqs
+
+
+def make_object(target, user, timeout, cache=None, key_fn=None):
+    """
+        Purpose:
+            Build one object file shared by the executables; output is kept for their compile logs
+            [errors included, since the targets that need a failed object aren't linked]
+        Returns:
+            (bool, string, bool) : whether make succeeded, the output of make, and whether the 
+                                   object was restored from the compile cache [None if no cache]
+    """
+    key = key_fn(target) if cache else None
+    if key and cache.get(key, os.path.join(BUILD_DIR, target), mode=0o666):
+        return True, "📦 restored from compile cache\n", True
+
+    proc = RUN(["make", target], cwd=BUILD_DIR, timeout=timeout, stdout=subprocess.PIPE,
+               stderr=subprocess.STDOUT, universal_newlines=True, user=user)
+    success = proc.returncode == 0
+    if key and success and os.path.exists(os.path.join(BUILD_DIR, target)):
+        cache.put(key, os.path.join(BUILD_DIR, target))
+    return success, proc.stdout, False if key else None
+
+
+def compiler_identity(command):
+    """
+        Purpose:
+            Something that changes when the program `command` is upgraded [its resolved path, size, and mtime]
+    """
+    path = shutil.which(command)
+    if not path:
+        return command
+    st = os.stat(path)
+    return f"{os.path.realpath(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def built_objects(commands):
+    """
+        Purpose:
+            The object files a build's commands [each a list of tokens] write: each -o <name>.o, and 
+            <source>.o for each source compiled with -c and no -o
+        Returns:
+            set of their real paths
+    """
+    built = set()
+    for tokens in commands:
+        outputs = [tok for prev, tok in zip([None] + tokens, tokens) if prev == '-o']
+        if outputs:
+            built.update(tok for tok in outputs if tok.endswith('.o'))
+        elif '-c' in tokens:
+            built.update(f"{os.path.splitext(os.path.basename(tok))[0]}.o" for tok in tokens if tok.endswith(SOURCE_EXTS))
+    return {os.path.realpath(os.path.join(BUILD_DIR, o)) for o in built}
+
+
+def compile_cache_key(target, user, timeout, build_headers, digests, make_args=None):
+    """
+        Purpose:
+            Content-address a make target for the compile cache
+        Parameters:
+            target        (string) : make target
+            user          (string) : user to run make as
+            timeout       (int)    : timeout in seconds
+            build_headers (set)    : every header under BUILD_DIR
+            digests       (dict)   : { path : digest } memo shared by the keys of one build
+            make_args     (dict)   : { target : [extra make arguments] }
+        Returns:
+            hex digest, or None if make can't say how target would be built
+        Notes:
+            The key covers the Makefile, the commands make would run to build target from scratch
+            (so the compiler and all flags), the compiler binaries, every file those commands name,
+            and every header they could include: the headers in BUILD_DIR, in any -I directory, and 
+            next to any named source. Object files the commands themselves build are skipped, since 
+            they are built from sources that are already part of the key; any other object [e.g. a 
+            staff object linked in from testset/link] is hashed like any other file.
+    """
+    make_args = make_args or {}
+    dry = RUN(["make", "--dry-run", "--always-make", target] + make_args.get(target, []), cwd=BUILD_DIR, timeout=timeout,
+              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, user=user)
+    if dry.returncode != 0:
+        return None
+
+    h = new_hash()
+    h.update(Path(BUILD_DIR, 'Makefile').read_bytes() if os.path.exists(f"{BUILD_DIR}/Makefile") else b'')
+    h.update(dry.stdout.encode())
+
+    commands = []
+    for line in dry.stdout.splitlines():
+        try:
+            commands.append(shlex.split(line))
+        except ValueError:
+            commands.append(line.split())
+
+    sources      = set()
+    include_dirs = set()
+    built        = built_objects(commands)
+    for tokens in commands:
+        if tokens:
+            h.update(compiler_identity(tokens[0]).encode())
+        for prev, tok in zip([None] + tokens, tokens):
+            if prev == '-I':
+                include_dirs.add(os.path.join(BUILD_DIR, tok))
+            elif tok.startswith('-I'):
+                include_dirs.add(os.path.join(BUILD_DIR, tok[2:]))
+            elif prev != '-o' and not tok.startswith('-'):
+                path = os.path.normpath(os.path.join(BUILD_DIR, tok))
+                if tok.endswith('.o') and os.path.realpath(path) in built:
+                    continue
+                if os.path.isfile(path):
+                    sources.add(path)
+                    include_dirs.add(os.path.dirname(path))
+
+    headers = set(build_headers)
+    for d in include_dirs:
+        if os.path.isdir(d):
+            headers.update(os.path.normpath(os.path.join(d, f)) for f in os.listdir(d) if f.endswith(HEADER_EXTS))
+
+    for path in sorted(sources | headers):
+        if path not in digests:
+            digests[path] = hash_file(new_hash(), path).hexdigest()
+        h.update(f"{os.path.relpath(path, BUILD_DIR)}:{digests[path]}".encode())
+    return h.hexdigest()
+
+
+def find_headers(d):
+    """
+        Purpose:
+            Every header file under d [symlinked directories aren't followed]
+    """
+    return {os.path.normpath(os.path.join(root, f)) for root, _, files in os.walk(d) for f in files
+            if f.endswith(HEADER_EXTS)}
+
+
+def compile_exec(target, OPTS, object_logs=None, cache=None, key_fn=None, make_args=None):
+    """
+        Purpose:    
+            compile the target executable in BUILD_DIR    
+        Parameters: 
+            target      (string)        : target to build
+            OPTS        (dict)          : testing options
+            object_logs (dict)          : { object : (success, make output, cached) } for the objects target 
+                                          depends on that compile_targets already made; these are logged 
+                                          first, and target isn't linked if any of them failed
+            cache       (ArtifactCache) : compile cache, or None
+            key_fn      (function)      : target -> compile cache key
+            make_args   (list)          : extra arguments for make [e.g. STAFF_OBJ=...]
+        Effects:    
+            writes result of compilation to the right place, and the executable's compile cache key 
+            to LOG_DIR/<target>.compile.key [see result_cache_key]
+        Returns:    
+            whether or not the compilation was successful
+    """
+    if not target:
+        return 0
+
+    object_logs = object_logs or {}
+    make_args   = make_args or []
+    user        = None if OPTS["no_user"] else "student"
+    exe         = os.path.join(BUILD_DIR, target)
+    cached      = [c for _, _, c in object_logs.values() if c is not None]
+    failed      = [obj for obj, (success, _, _) in object_logs.items() if not success]
+    key         = key_fn(target) if cache and not failed else None
 
     with open(f"{LOG_DIR}/{target}.compile.log", "w") as f:
-        INFORMF(f"🔨 running make {target}\n", stream=f, color=BLUE)
-        compilation_proc    = RUN(["make", target], cwd=BUILD_DIR, stdout=f, stderr=subprocess.STDOUT, user=user)
-        compilation_success = compilation_proc.returncode == 0
-        compilation_color   = GREEN if compilation_success else RED
+        for obj, (_, obj_output, _) in object_logs.items():
+            INFORMF(f"🔨 running make {obj}\n", stream=f, color=BLUE)
+            f.write(obj_output)
+        f.flush()
+
+        if failed:
+            INFORMF(f"🔨 not linking {target}: {', '.join(failed)} failed to build\n", stream=f, color=RED)
+            compilation_success = False
+        elif key and cache.get(key, exe, mode=0o777):
+            INFORMF(f"🔨 running make {target}\n", stream=f, color=BLUE)
+            f.write("📦 restored from compile cache\n")
+            compilation_success = True
+            cached.append(True)
+        else:
+            INFORMF(f"🔨 running make {target}\n", stream=f, color=BLUE)
+            compilation_proc    = RUN(["make", target] + make_args, cwd=BUILD_DIR, timeout=OPTS['compile_timeout'],
+                                      stdout=f, stderr=subprocess.STDOUT, user=user)
+            compilation_success = compilation_proc.returncode == 0
+            if key:
+                cached.append(False)
+                if compilation_success and os.path.exists(exe):
+                    cache.put(key, exe)
+
+        if cached:
+            INFORMF(f"📦 compile cache: {sum(cached)} hit(s), {len(cached) - sum(cached)} miss(es)\n", 
+                    stream=f, color=CYAN)
 
         if not compilation_success:
             INFORMF(f"❌ build failed\n", stream=f, color=RED)
@@ -831,9 +2962,325 @@ def compile_exec(target, OPTS):
             INFORMF("✅ build completed successfully\n", stream=f, color=GREEN)
             RUN(["chmod", "a+x", target], cwd=BUILD_DIR, user=user)      # g++ doesn't always play nice, so chmod it
 
+    key_path = Path(f"{LOG_DIR}/{target}.compile.key")
+    if key and compilation_success:
+        key_path.write_text(key)
+    elif key_path.exists():
+        key_path.unlink()
     return compilation_success
 
 
+def compile_targets(targets, OPTS, cache=None, make_args=None):
+    """
+        Purpose:
+            Build a set of executables with the Makefile currently in BUILD_DIR, OPTS['compile_jobs'] at a time
+        Parameters:
+            targets (list)          : executables to build [duplicates are built once]
+            OPTS    (dict)          : testing options
+            cache     (ArtifactCache) : if provided, objects and executables are restored from / saved to it
+            make_args (dict)          : { target : [extra make arguments] } [see use_prebuilt_objects]
+        Returns:
+            list of bools - whether each unique target built successfully
+        Notes:
+            Two stages: first every .o prerequisite of any target is built once, in parallel, 
+            then the targets themselves are linked in parallel. Because the shared objects are 
+            already up to date by the second stage, concurrent `make target` runs don't race to
+            rebuild the same object. A target that needs an object that failed to build isn't 
+            linked at all [make would retry the object, once per target, all at the same time]; 
+            the compiler error is copied into its compile log instead.
+            Cache keys are content hashes (see compile_cache_key), so a hit is only possible when
+            the Makefile, flags, and sources are identical to an earlier build.
+    """
+    targets   = list(dict.fromkeys(normalize_target(t) for t in targets if t))
+    make_args = make_args or {}
+    user      = None if OPTS["no_user"] else "student"
+    timeout   = OPTS['compile_timeout']
+
+    # if student provides executable, remove it.
+    for target in targets:
+        if os.path.exists(os.path.join(BUILD_DIR, target)):
+            os.remove(os.path.join(BUILD_DIR, target))
+
+    prereqs = make_prerequisites(targets, user, timeout)
+    objects = list(dict.fromkeys(p for t in targets for p in prereqs.get(t, []) if p.endswith('.o')))
+
+    key_fn = partial(compile_cache_key, user=user, timeout=timeout,
+                     build_headers=find_headers(BUILD_DIR) if cache else set(), digests={}, make_args=make_args)
+
+    with ThreadPoolExecutor(max_workers=OPTS['compile_jobs']) as pool:
+        built       = pool.map(partial(make_object, user=user, timeout=timeout, cache=cache, key_fn=key_fn), objects)
+        object_logs = dict(zip(objects, built))
+        return list(pool.map(lambda t: compile_exec(t, OPTS, {o: object_logs[o] for o in prereqs.get(t, [])
+                                                              if o in object_logs}, cache, key_fn,
+                                                    make_args.get(t, [])), targets))
+
+
+def make_variables(names, cwd, user=None):
+    """
+        Purpose:
+            Evaluate variables of the Makefile in cwd [e.g. CXX, CXXFLAGS]
+        Returns:
+            dictionary of { name : value }
+    """
+    print_rule = 'autograde-print-%: ; @echo $($*)'
+    proc = RUN(["make", "-s", "--no-print-directory", "--eval", print_rule] + [f"autograde-print-{n}" for n in names],
+               cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, user=user)
+    values = proc.stdout.split('\n')
+    return {name: values[i].strip() if i < len(values) else "" for i, name in enumerate(names)}
+
+
+def staff_compile_command(cwd):
+    """
+        Purpose:
+            The compiler and flags our Makefile in cwd compiles a translation unit with
+    """
+    variables = make_variables(["CXX", "CPPFLAGS", "CXXFLAGS"], cwd)
+    return ' '.join(v for v in variables.values() if v)
+
+
+def staff_digest(command):
+    """
+        Purpose:
+            Hash everything a staff translation unit depends on besides its own source: the compile 
+            command, the compiler binary, and the staff headers in testset/cpp, link/, and copy/
+    """
+    h = new_hash()
+    h.update(command.encode())
+    h.update(compiler_identity(command.split()[0] if command else "").encode())
+    for d in [TEST_CPP_DIR, LINK_DIR, COPY_DIR]:
+        if os.path.isdir(d):
+            for f in sorted(os.listdir(d)):
+                if f.endswith(HEADER_EXTS) and os.path.isfile(os.path.join(d, f)):
+                    h.update(f.encode())
+                    hash_file(h, os.path.join(d, f))
+    return h.hexdigest()
+
+
+def unit_digest(src, base):
+    h = new_hash()
+    h.update(base.encode())
+    return hash_file(h, src).hexdigest()
+
+
+def staff_sources(headers=[]):
+    """
+        Purpose:
+            The staff-owned files that can be built ahead of time
+        Returns:
+            dictionary of { path in PREBUILT_DIR (relative) : source path }
+    """
+    sources = {}
+    for kind, d in [("cpp", TEST_CPP_DIR), ("link", LINK_DIR)]:
+        if os.path.isdir(d):
+            for f in sorted(os.listdir(d)):
+                if f.endswith('.cpp'):
+                    sources[f"{kind}/{f[:-len('.cpp')]}.o"] = os.path.join(d, f)
+    for header in headers:
+        for d in [LINK_DIR, COPY_DIR, TEST_CPP_DIR]:
+            if os.path.isfile(os.path.join(d, header)):
+                sources[f"include/{header}.gch"] = os.path.join(d, header)
+                break
+    return sources
+
+
+def prebuild_staff_objects(TOML, OPTS):
+    """
+        Purpose:
+            Compile the staff-owned translation units [drivers in testset/cpp and sources in 
+            testset/link] and any [common] prebuild_headers once, into testset/prebuilt, so 
+            compile_execs only has to compile the student's code. 
+        Notes:
+            Run when the container image is built (see etc/Dockerfile). 
+            Compilation happens in a staging directory laid out like results/build, but without a 
+            submission - so a translation unit that includes a student header fails here and is 
+            simply left out, and is compiled per-submission as usual. 
+            A manifest records a hash of each unit's inputs; use_prebuilt_objects ignores any unit
+            whose inputs have changed since, e.g. after a `git pull` of the testset.
+    """
+    if not os.path.exists(MAKEFILE_PATH):
+        FAIL("prebuilding requires a custom Makefile in testset/makefile/")
+
+    COMMON_CONFIG = TestConfig(**TOML['common'])
+    jobs          = OPTS.get('compile_jobs') or OPTS['jobs']
+    created_results = not os.path.exists(RESULTS_DIR)
+
+    shutil.rmtree(PREBUILD_DIR, ignore_errors=True)
+    os.makedirs(PREBUILD_DIR)
+    if os.path.exists(COPY_DIR):
+        shutil.copytree(COPY_DIR, PREBUILD_DIR, dirs_exist_ok=True)
+    if os.path.exists(LINK_DIR):
+        for f in os.listdir(LINK_DIR):
+            os.symlink(os.path.join(LINK_DIR, f), os.path.join(PREBUILD_DIR, f))
+    shutil.copyfile(MAKEFILE_PATH, f"{PREBUILD_DIR}/Makefile")
+
+    command = staff_compile_command(PREBUILD_DIR)
+    base    = staff_digest(command)
+    sources = staff_sources(COMMON_CONFIG.prebuild_headers)
+
+    shutil.rmtree(PREBUILT_DIR, ignore_errors=True)
+    for kind in ["cpp", "link", "include"]:
+        os.makedirs(f"{PREBUILT_DIR}/{kind}")
+
+    def prebuild(item):
+        rel, src = item
+        lang     = ["-x", "c++-header"] if rel.startswith("include/") else ["-c"]
+        proc     = RUN(shlex.split(command) + lang + [src, "-o", f"{PREBUILT_DIR}/{rel}"], cwd=PREBUILD_DIR,
+                       timeout=COMMON_CONFIG.compile_timeout, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return proc.returncode == 0
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        built = dict(zip(sources, pool.map(prebuild, sources.items())))
+
+    manifest = {
+        "command" : command,
+        "units"   : {rel: unit_digest(src, base) for rel, src in sources.items() if built[rel]}
+    }
+    Path(f"{PREBUILT_DIR}/manifest.json").write_text(json.dumps(manifest, indent=4))
+
+    shutil.rmtree(PREBUILD_DIR)
+    if created_results:
+        shutil.rmtree(RESULTS_DIR)
+
+    INFORM(f"🔨 Prebuilt {len(manifest['units'])} of {len(sources)} staff translation unit(s) with `{command}`", color=BLUE)
+    for rel in sources:
+        if not built[rel]:
+            print(f"   {rel} was not prebuilt [it likely includes a student header]")
+
+
+def load_prebuilt_manifest():
+    try:
+        return json.loads(Path(f"{PREBUILT_DIR}/manifest.json").read_text())
+    except FileNotFoundError:
+        return None
+
+
+@lru_cache(maxsize=None)
+def current_prebuilt_units(command, testset_dir):
+    """
+        Purpose:
+            The units in testset/prebuilt whose inputs are unchanged since they were built with command
+        Returns:
+            list of paths in PREBUILT_DIR (relative)
+        Notes:
+            The staff sources don't change while grading, so they're hashed once per process [and 
+            testset; testset_dir is only part of the cache key].
+    """
+    manifest = load_prebuilt_manifest()
+    base     = staff_digest(command)
+    sources  = staff_sources([rel[len("include/"):-len(".gch")] for rel in manifest["units"] if rel.startswith("include/")])
+    return [rel for rel, digest in manifest["units"].items() if rel in sources and unit_digest(sources[rel], base) == digest]
+
+
+def use_prebuilt_objects(OPTS):
+    """
+        Purpose:
+            Make the up-to-date objects in testset/prebuilt available to the build in BUILD_DIR
+        Returns:
+            dictionary of { target : [extra make arguments] } - STAFF_OBJ=<path> for every target 
+            whose driver in testset/cpp was prebuilt
+        Notes:
+            Must be run after our Makefile is in BUILD_DIR. 
+            Prebuilt testset/link objects and precompiled headers are copied into BUILD_DIR; since the 
+            copies are newer than the sources, make treats them as up to date. Drivers are compiled as 
+            part of linking, so our Makefile has to opt in with STAFF_OBJ (see testset/makefile/Makefile 
+            in the sanity_check assignment).
+            Nothing is used if the compile command differs from the one the units were built with.
+    """
+    manifest = load_prebuilt_manifest()
+    if not manifest:
+        return {}
+
+    command = staff_compile_command(BUILD_DIR)
+    if command != manifest["command"]:
+        INFORM("prebuilt staff objects were compiled with different flags - ignoring them", color=MAGENTA)
+        return {}
+
+    make_args = {}
+    for rel in current_prebuilt_units(command, TESTSET_DIR):
+        kind, name = rel.split('/', 1)
+        if kind == "cpp":
+            make_args[name[:-len('.o')]] = [f"STAFF_OBJ={PREBUILT_DIR}/{rel}"]
+        else:
+            shutil.copyfile(f"{PREBUILT_DIR}/{rel}", f"{BUILD_DIR}/{name}")
+            os.chmod(f"{BUILD_DIR}/{name}", 0o666)
+    return make_args
+
+
+def prepare_asan_directory():
+    """
+        Purpose:
+            Set up ASAN_BUILD_DIR with the same sources as BUILD_DIR [see build_testing_directories]
+        Notes:
+            Set up from the submission and testset rather than copied from BUILD_DIR, so none of
+            the objects, executables, or precompiled headers built there without the sanitizer come along.
+    """
+    shutil.rmtree(ASAN_BUILD_DIR, ignore_errors=True)
+    shutil.copytree(SUBMISSION_DIR, ASAN_BUILD_DIR, ignore=skip_submitted)
+    chmod_dir(ASAN_BUILD_DIR, "u+w")
+    if os.path.exists(COPY_DIR):
+        shutil.copytree(COPY_DIR, ASAN_BUILD_DIR, dirs_exist_ok=True)
+    if os.path.exists(LINK_DIR):
+        for f in os.listdir(LINK_DIR):
+            os.symlink(os.path.join('..', '..', LINK_DIR, f), os.path.join(ASAN_BUILD_DIR, f))
+    chmod_dir(ASAN_BUILD_DIR, "777")
+
+
+def asan_instrumented(path):
+    """
+        Purpose:
+            Whether the executable at path is linked with the sanitizer runtime
+    """
+    return ASAN_RUNTIME in Path(path).read_bytes()
+
+
+def compile_asan_variants(targets, OPTS, makefile=None):
+    """
+        Purpose:
+            Build sanitizer-instrumented copies of targets in ASAN_BUILD_DIR, for the tests
+            with memcheck_engine = "asan" [see Test.run_valgrind]
+        Parameters:
+            targets  (list)   : executables to build
+            OPTS     (dict)   : testing options
+            makefile (string) : Makefile to build with, or None for the one already there [the student's]
+        Returns:
+            list of the targets built with the sanitizer
+        Notes:
+            The targets are built by a single `make -k -j` with ASAN_FLAGS added to CC and CXX,
+            so make schedules the objects they share itself. Prebuilt staff objects aren't used,
+            since they were compiled without the sanitizer. An executable without the sanitizer
+            runtime [e.g. its Makefile rule ignores CXX] is removed, so its tests fall back to
+            valgrind. The build output goes to LOG_DIR/build-asan.log.
+    """
+    targets = list(dict.fromkeys(normalize_target(t) for t in targets if t))
+    if not targets:
+        return []
+
+    user = None if OPTS["no_user"] else "student"
+    if makefile:
+        shutil.copyfile(makefile, f"{ASAN_BUILD_DIR}/Makefile")
+    for target in targets:
+        if os.path.exists(os.path.join(ASAN_BUILD_DIR, target)):
+            os.remove(os.path.join(ASAN_BUILD_DIR, target))
+
+    compilers = make_variables(["CC", "CXX"], ASAN_BUILD_DIR, user)
+    overrides = [f"{name}={value} {ASAN_FLAGS}" for name, value in compilers.items() if value]
+    rounds    = -(-len(targets) // OPTS['compile_jobs'])
+    with open(f"{LOG_DIR}/build-asan.log", "a") as f:
+        INFORMF(f"🔨 running make {' '.join(targets)} with {ASAN_FLAGS}\n", stream=f, color=BLUE)
+        RUN(["make", "-k", f"-j{OPTS['compile_jobs']}"] + overrides + targets, cwd=ASAN_BUILD_DIR,
+            timeout=OPTS['compile_timeout'] * rounds, stdout=f, stderr=subprocess.STDOUT, user=user)
+
+    built = []
+    for target in targets:
+        exe = os.path.join(ASAN_BUILD_DIR, target)
+        if os.path.exists(exe) and asan_instrumented(exe):
+            RUN(["chmod", "a+x", target], cwd=ASAN_BUILD_DIR, user=user)
+            built.append(target)
+        elif os.path.exists(exe):
+            os.remove(exe)
+    return built
+
+
 def compile_execs(TOML, TESTS, OPTS):
     """
         Purpose:
@@ -847,30 +3294,60 @@ def compile_execs(TOML, TESTS, OPTS):
             True iff all of the compilations succeeded
         Notes:      
             Will copy the custom Makefile to build/ if it exists. Ignore if using exec_command [test.executable == None].
+            The student's Makefile targets are built first, since ours overwrites it in build/. 
+            Tests with memcheck_engine = "asan" also get a sanitizer build [see compile_asan_variants].
     """
     execs_to_compile     = { test.executable: test.our_makefile for test in TESTS.values() if test.executable != None }
+    asan_execs           = { test.executable for test in TESTS.values() 
+                             if test.valgrind and test.memcheck_engine == "asan" and test.executable and not test.exec_command }
     our_makefile_tests   = [ test for test in execs_to_compile if execs_to_compile[test] ]
     their_makefile_tests = [ test for test in execs_to_compile if not execs_to_compile[test] ]
 
+    COMMON_CONFIG           = TestConfig(**TOML['common'])
+    OPTS['compile_timeout'] = COMMON_CONFIG.compile_timeout
+    if not OPTS.get('compile_jobs'):
+        OPTS['compile_jobs'] = OPTS['jobs']
+
+    cache = None
+    if not OPTS.get('no_cache'):
+        cache = ArtifactCache(f"{OPTS.get('cache_dir') or CACHE_DIR}/compile", COMMON_CONFIG.compile_cache_size * 1024 * 1024)
+
     compiled_list = []
-    num_execs     = len(execs_to_compile)
     if their_makefile_tests:
         INFORM(
             f"🔨 Building {len(their_makefile_tests)} executable{'s' if len(their_makefile_tests) >= 1 else ''} with the student's makefile",
             color=BLUE)
-        compiled_list = [compile_exec(x, OPTS) for x in their_makefile_tests]
+        compiled_list = compile_targets(their_makefile_tests, OPTS, cache)
+
+    asan_built = []
+    if asan_execs:
+        prepare_asan_directory()
+        asan_built = compile_asan_variants([t for t in their_makefile_tests if t in asan_execs], OPTS)
 
     if our_makefile_tests:
         INFORM(
             f"🔨 Building {len(our_makefile_tests)} executable{'s' if len(our_makefile_tests) >= 1 else ''} with our makefile",
             color=BLUE)
+        make_args = {}
         if not os.path.exists(MAKEFILE_PATH):
             print("our_makefile option requires a custom Makefile in testset/makefile/")
         else:
-            shutil.copyfile(MAKEFILE_PATH, 'results/build/Makefile')
-        compiled_list += [compile_exec(x, OPTS) for x in our_makefile_tests]
-
-    if sum(compiled_list) != num_execs:
+            shutil.copyfile(MAKEFILE_PATH, f"{BUILD_DIR}/Makefile")
+            make_args = use_prebuilt_objects(OPTS)
+        compiled_list += compile_targets(our_makefile_tests, OPTS, cache, make_args)
+        if os.path.exists(MAKEFILE_PATH):
+            asan_built += compile_asan_variants([t for t in our_makefile_tests if t in asan_execs], OPTS, MAKEFILE_PATH)
+
+    if asan_execs:
+        missing = sorted({normalize_target(t) for t in asan_execs} - set(asan_built))
+        INFORM(f"🧪 Built {len(asan_built)} sanitizer variant{'s' if len(asan_built) != 1 else ''}" + 
+               (f"; valgrind will be used for {', '.join(missing)} [see {LOG_DIR}/build-asan.log]" if missing else ""),
+               color=BLUE)
+
+    if cache:
+        cache.evict()
+
+    if not all(compiled_list):
         INFORM("❌ Some Tests Failed to Build!\n", color=RED)
         report_compile_logs(type_to_report="fail")
     else:
@@ -887,6 +3364,17 @@ def chmod_dir(d, permissions):
         subprocess.run([f"chmod -R {permissions} {d}"], shell=True)
 
 
+def skip_submitted(d, names):
+    """
+        Purpose:
+            copytree ignore function for copying the submission into a build directory: leaves out 
+            the student's .o files, and files named like one in testset/link [which is linked in instead]
+    """
+    if os.path.abspath(d) != SUBMISSION_DIR:
+        return []
+    return [f for f in names if f.endswith('.o') or os.path.exists(os.path.join(LINK_DIR, f))]
+
+
 def build_testing_directories(OPTS):
     """
         Purpose:
@@ -896,10 +3384,10 @@ def build_testing_directories(OPTS):
             there should be no need to change them.
             don't remove results_dir directly because gradescope puts the 'stdout' file there
     """
-    no_nuke = OPTS.get('dont_nuke', [])
+    no_nuke = OPTS.get('dont_nuke') or []
     
     if os.path.exists(RESULTS_DIR):
-        for fldr in BUILD_DIR, LOG_DIR, OUTPUT_DIR:
+        for fldr in BUILD_DIR, ASAN_BUILD_DIR, LOG_DIR, OUTPUT_DIR:
             if os.path.exists(fldr) and fldr not in no_nuke:
                 shutil.rmtree(fldr)
 
@@ -907,15 +3395,10 @@ def build_testing_directories(OPTS):
         if not os.path.exists(fldr):
             os.mkdir(fldr)
 
-    # if submission dir doesn't have +w, we won't be able to copy anything after first copytree()
-    chmod_dir(SUBMISSION_DIR, "770")
-
-    # remove any student-provided .o files
-    for f in os.listdir(SUBMISSION_DIR):
-        if f.endswith('.o') or os.path.exists(os.path.join(LINK_DIR, f)):
-            os.remove(os.path.join(SUBMISSION_DIR, f))
-
-    shutil.copytree(SUBMISSION_DIR, BUILD_DIR, dirs_exist_ok=True)
+    # the submission is left as it is [it may be an instructor's only copy - see grade_class.py]; 
+    # if it doesn't have +w, we won't be able to copy anything into BUILD_DIR after the first copytree()
+    shutil.copytree(SUBMISSION_DIR, BUILD_DIR, ignore=skip_submitted, dirs_exist_ok=True)
+    chmod_dir(BUILD_DIR, "u+w")
     if os.path.exists(COPY_DIR):
         shutil.copytree(COPY_DIR, BUILD_DIR, dirs_exist_ok=True)
     
@@ -923,8 +3406,14 @@ def build_testing_directories(OPTS):
         for f in os.listdir(LINK_DIR):
             os.symlink(os.path.join('..', '..', LINK_DIR, f), os.path.join(BUILD_DIR, f))
 
-    Path(f'{LOG_DIR}/status.lock').write_text("Lockfile for status reporting")
-    Path(f'{LOG_DIR}/status').write_text("")
+    # Makefiles refer to the testset as ../../testset from BUILD_DIR; results outside the autograder 
+    # directory [see set_paths] get a link to it next to them
+    try:
+        os.symlink(TESTSET_DIR, os.path.join(os.path.dirname(RESULTS_DIR), "testset"))
+    except FileExistsError:
+        pass
+
+    Path(RESULTS_STORE).write_text("")
 
     # students need read access to link/stdin/cpp dirs
     chmod_dir(TESTSET_DIR, "555") 
@@ -978,12 +3467,15 @@ def filter_tests(TESTS, OPTS):
         OPTS['diff'] = [f".{x}.diff" for x in OPTS['diff']]
 
     if OPTS['filter']:
+        # passed/failed refers to the previous run, so read its results before the log dir is rebuilt
         OPTS['filter'] = OPTS['filter'][0]
-        get_test_var   = lambda test: test.valgrind_passed if OPTS['valgrind'] else test.success
+        previous       = read_results()
+        key            = 'valgrind_passed' if OPTS['valgrind'] else 'success'
+        get_test_var   = lambda name: previous.get(name, {}).get(key)
         TESTS          = {
              name: test for name, test in TESTS.items() if \
-                            get_test_var(test) and OPTS['filter'] == "passed" or \
-                        not get_test_var(test) and OPTS['filter'] == "failed"
+                            get_test_var(name) and OPTS['filter'] == "passed" or \
+                        not get_test_var(name) and OPTS['filter'] == "failed"
         }
     return TESTS
 
@@ -1028,10 +3520,13 @@ def validate_opts(TESTS, OPTS):
     return OPTS
 
 
-def load_tests(TOML):
+def load_tests(TOML, calibrate=True):
     """
         Purpose:
             Loads tests from the TOML file 
+        Parameters:
+            TOML      (dict) : the contents of testset.toml
+            calibrate (bool) : apply the calibrated limits of the tests that opt in [see calibrate_limits]
         Returns:
             A dictionary of { testname : Test }
         Notes: 
@@ -1039,17 +3534,64 @@ def load_tests(TOML):
             of the parameters in the 'narrower' configuration overrides the corresponding config
             of the 'broader' category. i.e. the test-specific config overrides the group config,
             and group config overrides the global config.
+            The tests of a group share its config; each test stores only its own settings.
     """
     COMMON_CONFIG = TestConfig(**TOML['common'])
     TESTS         = {}
     for group in [TOML[group_name] for group_name in TOML if group_name != "common"]:
-        GROUP_CONFIG = COMMON_CONFIG.mergecopy(**group)
+        settings     = {key: value for key, value in group.items() if key != "tests"}
+        GROUP_CONFIG = COMMON_CONFIG.mergecopy(**settings).in_runtime_units()
+        placeholders = [key for key, value in vars(GROUP_CONFIG).items() if has_placeholder(value)]
         for tinfo in group['tests']:
-            TEST_CONFIG              = GROUP_CONFIG.mergecopy(**tinfo)
-            TESTS[tinfo['testname']] = Test(TEST_CONFIG)
+            TESTS[tinfo['testname']] = Test(GROUP_CONFIG, tinfo, placeholders)
+    if calibrate:
+        reference = load_reference_limits(REF_OUTPUT_DIR)
+        for test in TESTS.values():
+            if test.calibrated_limits and test.testname in reference:
+                calibrate_limits(test, reference[test.testname])
     return TESTS
 
 
+@lru_cache(maxsize=None)
+def load_reference_limits(directory):
+    """
+        Purpose:
+            Load the solution's resource usage recorded with the reference output in directory
+            [see build_reference.py], if there is any
+    """
+    try:
+        return json.loads(Path(f"{directory}/{LIMITS_DB}").read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def calibrate_limits(test, usage):
+    """
+        Purpose:
+            Hold test to calibration_factor times the time and memory the solution used on it
+        Parameters:
+            test  (Test) : a test with calibrated_limits set
+            usage (dict) : the solution's usage, from LIMITS_DB [wall, cpu, and valgrind_wall in seconds; rss_kb]
+        Notes:
+            Each limit is at least its floor, and a calibrated limit never loosens one given in the .toml
+            file. max_ram is only calibrated if the solution's peak RSS was measured. The valgrind run gets a time limit of its own from the solution's valgrind run, so a tight
+            max_time doesn't time it out.
+            Tests run once under valgrind, or in a batch, keep their limits: neither run is what the solution
+            was measured on [see Test.runs_once and Test.batch_key].
+    """
+    if test.single_run or test.batch:
+        return
+    factor   = test.calibration_factor
+    limit    = lambda seconds: round(max(test.calibration_time_floor, factor * seconds), 2)
+    if usage.get('valgrind_wall'):
+        test.valgrind_max_time = min(test.valgrind_max_time or test.max_time, limit(usage['valgrind_wall']))
+    test.max_time = min(test.max_time, limit(max(usage['wall'], usage['cpu'])))
+
+    if isinstance(usage.get('rss_kb'), (int, float)):          # no peak RSS was measured: leave max_ram be
+        max_ram      = int(max(test.calibration_ram_floor, factor * usage['rss_kb']))
+        test.max_ram = max_ram if test.max_ram == -1 else min(test.max_ram, max_ram)
+
+
 def parse_args(argv):
     """
         Purpose:
@@ -1065,6 +3607,10 @@ def parse_args(argv):
             -v, --valgrind      show valgrind output
             -c, --compile-logs  show the compilation logs and commands
             -j, --jobs jobs     number of parallel jobs; default=1; -1=number of available cores
+            -J, --compile-jobs jobs
+                          number of parallel compilation jobs; default=same as --jobs; -1=number of available cores
+            -e, --engine {process,asyncio}
+                          how tests are run in parallel; default=process
             -f, --filter [filteropt [filteropt ...]]
                           one or more filters to apply: failed, cmpwarning, cmperr, memerr, memleak
             -d, --diff [diffopt [diffopt ...]]
@@ -1072,6 +3618,9 @@ def parse_args(argv):
             -t, --tests [testXX [testXX ...]]
                           one or more tests to run
             -n, --no-user do not run tests in group 'student' [used to build container on local system]
+            --cache-dir dir     directory for the autograder's caches; default=./.autograde_cache
+            --no-cache          don't read or write the autograder's caches
+            --prebuild          compile the staff-provided sources into testset/prebuilt and exit
                         
             These args are passed in here 'as expected' i.e. flags are bools, 
             and 'filter', 'diff', and 'tests' are all lists of strings. 
@@ -1081,12 +3630,17 @@ def parse_args(argv):
         'v' : "show valgrind output",
         'c' : "show the compilation logs and commands",
         'j' : "number of parallel jobs; default=1; -1=number of available cores",
+        'J' : "number of parallel compilation jobs; default=same as --jobs; -1=number of available cores",
+        'e' : "how tests are run in parallel: 'process' runs each test in a worker process; 'asyncio' runs all tests from one event loop, -j programs at a time; default=process",
         'f' : "one or more filters to apply: (f)ailed, (p)assed",
         'd' : "one or more diffs to show: stdout, stderr, and ofile",
         't' : "one or more tests to run",
         'l' : "show output in one column",
         'n' : "runs tests without running as student user. Used to build container on local system",
-        'k' : "don't nuke these autograder directories before starting. Used to preserve dirs if needed given custom file configs."
+        'k' : "don't nuke these autograder directories before starting. Used to preserve dirs if needed given custom file configs.",
+        'cache_dir' : "directory for the autograder's caches; default=./.autograde_cache",
+        'no_cache'  : "don't read or write the autograder's caches",
+        'prebuild'  : "compile the staff-provided sources into testset/prebuilt and exit [used when building the container]"
     }
     ap = argparse.ArgumentParser(formatter_class=CustomFormatter)
     ap.add_argument('-s', '--status', action='store_true', help=HELP['s'])
@@ -1094,15 +3648,22 @@ def parse_args(argv):
     ap.add_argument('-c', '--compile-logs', action='store_true', help=HELP['c'])
     ap.add_argument('-l', '--lengthy-output', action='store_true', help=HELP['l'])
     ap.add_argument('-j', '--jobs', default=1, metavar="jobs", type=int, help=HELP['j'])
+    ap.add_argument('-J', '--compile-jobs', default=None, metavar="jobs", type=int, help=HELP['J'])
+    ap.add_argument('-e', '--engine', default='process', choices=['process', 'asyncio'], help=HELP['e'])
     ap.add_argument('-d', '--diff', nargs='*', metavar="diffopt", type=str, help=HELP['d'])
     ap.add_argument('-f', '--filter', nargs='*', metavar="filteropt", type=str, help=HELP['f'])
     ap.add_argument('-t', '--tests', nargs='*', metavar="testXX", type=str, help=HELP['t'])
     ap.add_argument('-n', '--no-user', action='store_true', help=HELP['n'])
     ap.add_argument('-k', '--dont-nuke', nargs='*', metavar="dirname", type=str, help=HELP['k'])
+    ap.add_argument('--cache-dir', default=CACHE_DIR, metavar="dir", type=str, help=HELP['cache_dir'])
+    ap.add_argument('--no-cache', action='store_true', help=HELP['no_cache'])
+    ap.add_argument('--prebuild', action='store_true', help=HELP['prebuild'])
 
     args = vars(ap.parse_args(argv))
     if args['jobs'] == -1:
-        args['jobs'] = cpu_count()
+        args['jobs'] = os.cpu_count()
+    if args['compile_jobs'] == -1:
+        args['compile_jobs'] = os.cpu_count()
     return args
 
 
@@ -1118,15 +3679,15 @@ def report_compile_logs(exitcode=None, type_to_report=None, tests=None, output_f
 
     compile_pass = "build completed successfully"
     compile_fail = "build failed"
-    build_logs   = find_logs(['.compile.log'], os.listdir(LOG_DIR), directory=LOG_DIR)
+    if tests:
+        build_logs = OutputIndex(LOG_DIR).read(tests, ['.compile.log'])
+    else:
+        build_logs = {f: Path(os.path.join(LOG_DIR, f)).read_text() for f in os.listdir(LOG_DIR) if f.endswith('.compile.log')}
 
     if type_to_report:
         type_to_report = compile_pass if type_to_report == "passed" else compile_fail
         build_logs     = {f: log for f, log in build_logs.items() if type_to_report in log}
 
-    if tests:
-        build_logs = {f: log for f, log in build_logs.items() if f.split('compile.log')[0] in tests}
-
     build_pass_fn = lambda x: True if compile_pass in x else False
     logs = report_log(build_logs, build_pass_fn, print_header=True, output_format=output_format)
     if exitcode != None:
@@ -1134,6 +3695,34 @@ def report_compile_logs(exitcode=None, type_to_report=None, tests=None, output_f
     return logs
 
 
+def read_results(store=None):
+    """
+        Purpose: 
+            Materialize the current state of each test from the results store, in one pass
+        Returns:
+            dictionary of { testname : latest record }
+        Notes:
+            A partial last line [a record still being written] is ignored.
+    """
+    results = {}
+    try:
+        lines = Path(store or RESULTS_STORE).read_text().splitlines()
+    except FileNotFoundError:
+        return results
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        results[record['testname']] = record
+    return results
+
+
+def status_line(record):
+    color = {"passed": GREEN, "failed": RED}.get(record['state'], CYAN)
+    return COLORIZE(f"{record['state']} {record['testname']} - {record['description']}", color=color)
+
+
 def report_log(data_dict, success_fn, print_header=True, output_format="stdout"):
     """
         Purpose: 
@@ -1162,17 +3751,13 @@ def report_log(data_dict, success_fn, print_header=True, output_format="stdout")
         return output_str
 
 
-def find_logs(exts, tests_to_report, directory=OUTPUT_DIR):
+def find_logs(exts, tests_to_report, directory=None):
     """
         Purpose: 
             Given a file extension and a subset of tests to report, return a dictionary of 
             { filename: filedata }, where filedata is the loaded text of the file.
     """
-    logs = {}
-    for f in os.listdir(directory):
-        if any([f.endswith(ext) for ext in exts]) and any([t in f for t in tests_to_report]):
-            logs[f] = Path(os.path.join(directory, f)).read_text()
-    return logs
+    return OutputIndex(directory or OUTPUT_DIR).read(tests_to_report, exts)
 
 
 def cleanup():
@@ -1186,9 +3771,14 @@ def run_autograder(argv):
     if not os.path.exists('testset.toml'):
         FAIL("testset.toml must be in the current directory")
 
-    TOML = tml.load('testset.toml')
+    import toml
+    TOML = toml.load('testset.toml')
+
+    if OPTS['prebuild']:
+        prebuild_staff_objects(TOML, OPTS)
+        return
 
-    TESTS = load_tests(TOML)
+    TESTS = load_tests(TOML, calibrate=not OPTS['no_user'])
 
     # make sure user called program correctly
     OPTS = validate_opts(TESTS, OPTS)
@@ -1203,12 +3793,14 @@ def run_autograder(argv):
         print("🟢 Tests ran successfully\n")
 
         if OPTS['status']:
-            statusfile    = Path(f"{LOG_DIR}/status").read_text().splitlines()
-            filteredlines = list(filter(lambda l: any([t in l for t in TESTS]), statusfile))
+            status        = read_results()
+            filteredlines = [status_line(status[t]) for t in sorted(TESTS) if t in status]
             line_pass     = lambda x: True if "passed" in x else False if "failed" in x else None
             report_log({i: l for i, l in enumerate(filteredlines)}, line_pass, print_header=False)
 
         elif OPTS['diff']:
+            for test in TESTS.values():
+                render_diffs(test.pending_diffs, test.pretty_diff)
             dtests = find_logs(OPTS['diff'], TESTS.keys())
             report_log(dtests, lambda x: x == '')
 
@@ -1216,13 +3808,14 @@ def run_autograder(argv):
             report_compile_logs(exitcode=0, type_to_report=OPTS['filter'], tests=TESTS.keys())
 
         elif OPTS['valgrind']:
-            vtests     = find_logs(['.valgrind'], TESTS.keys())
-            vtest_pass = lambda x: MEMERR_PASS in x and MEMLEAK_PASS in x
+            vtests     = find_logs(['.valgrind', '.asan'], TESTS.keys())
+            vtest_pass = lambda x: MEMERR_PASS in x and MEMLEAK_PASS in x if "Memcheck" in x else "Sanitizer" not in x
             report_log(vtests, vtest_pass)
         else:
             report_results(TESTS)
             visible_tests = {k: v for k, v in TESTS.items() if v.visibility == "visible"}
             out_file = f"{RESULTS_DIR}/visible_results_output.txt"
+            from rich.console import Console
             with open(out_file, "w") as f:
                 console = Console(file=f)
                 report_results(visible_tests, console=console)
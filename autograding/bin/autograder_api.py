@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+autograder_api.py
+
+Grade submissions from Python, many times in one process:
+
+    from autograder_api import Autograder
+
+    grader = Autograder("assignments/my_assign/autograder", jobs=8)
+    for submission in submissions:
+        result = grader.grade(submission, results_dir=f"regrade/{os.path.basename(submission)}")
+        print(result.score, result.max_score, [t.testname for t in result.failed])
+
+An Autograder is configured with an assignment's autograder directory and the options autograde.py
+takes on its command line. It loads the testset, the canonicalizers, and the style configuration
+once; each grade() builds, runs, and scores one submission in a results directory of its own, just
+as autograde.py and make_gradescope_results.py would, and returns a GradeResult.
+"""
+import os
+from dataclasses import dataclass
+from contextlib import ExitStack, redirect_stdout, redirect_stderr
+
+import autograde
+import make_gradescope_results
+
+GRADE_LOG = "autograde.log"         # what autograde would print, in the results directory [unless verbose]
+
+
+@dataclass
+class GradeResult:
+    submission  : str               # the submission directory
+    results_dir : str               # its results [build/, logs/, output/, results.json, ...]
+    tests       : dict              # { testname : autograde.Test }, in testset order
+    score       : float             # total score, as Gradescope is given it [tests, valgrind, and style]
+    max_score   : float
+    gradescope  : dict              # the contents of results.json
+
+    @property
+    def passed(self):
+        return [test for test in self.tests.values() if test.success]
+
+    @property
+    def failed(self):
+        return [test for test in self.tests.values() if not test.success]
+
+
+class Autograder:
+
+    def __init__(self, root=".", jobs=1, compile_jobs=None, engine="process", tests=None, no_user=False,
+                 cache_dir=None, no_cache=False, config_toml=None, assignment_title=None, verbose=False):
+        """
+            Parameters:
+                root             (string) : the assignment's autograder directory [testset.toml, testset/, canonicalizers.py]
+                jobs ... no_cache         : as autograde.py's options [see autograde.parse_args]
+                config_toml      (string) : the course config.toml, for the style check;
+                                            default=/autograder/source/config.toml
+                assignment_title (string) : the Gradescope assignment title; default=$ASSIGNMENT_TITLE, or root's name
+                verbose          (bool)   : print what autograde would; otherwise it goes to GRADE_LOG
+        """
+        import toml
+
+        self.root             = os.path.abspath(root)
+        self.TOML             = toml.load(os.path.join(self.root, "testset.toml"))
+        self.assignment_title = assignment_title or os.environ.get('ASSIGNMENT_TITLE') or os.path.basename(self.root)
+        self.verbose          = verbose
+
+        argv = ["-j", str(jobs), "-e", engine, "--cache-dir", cache_dir or f"{self.root}/.autograde_cache"]
+        argv += (["-J", str(compile_jobs)] if compile_jobs else []) + (["-t"] + tests if tests else [])
+        argv += (["-n"] if no_user else []) + (["--no-cache"] if no_cache else [])
+        self.argv = argv
+
+        with autograde.using_paths(self.root):
+            TESTS = autograde.load_tests(self.TOML)
+            autograde.validate_opts(TESTS, autograde.parse_args(argv))       # fail here, not on the first grade()
+            autograde.load_staff_artifacts(TESTS)
+
+        self.testset_common = self.TOML['common']
+        self.style_config   = {}
+        if self.testset_common.get("style_check"):
+            import style_check
+            self.style_config = toml.load(config_toml or style_check.AUTOGRADER_CONFIG_TOML_PATH)["style"]
+
+    def style_check(self, submission_dir):
+        import style_check
+        return style_check.StyleChecker(submission_dir, testset_common=self.testset_common, config=self.style_config)
+
+    def write_visible_results(self, TESTS):
+        # the results table of the visible tests, which make_gradescope_results shows students [see make_test00]
+        from rich.console import Console
+        visible_tests = {k: v for k, v in TESTS.items() if v.visibility == "visible"}
+        with open(f"{autograde.RESULTS_DIR}/visible_results_output.txt", "w") as f:
+            autograde.report_results(visible_tests, console=Console(file=f))
+
+    def grade(self, submission_dir, results_dir=None):
+        """
+            Purpose:
+                Build, run, and score one submission
+            Parameters:
+                submission_dir (string) : the submission to grade
+                results_dir    (string) : where its results go; default=results/<submission's name>, next to
+                                          submission_dir [so submissions in one directory don't share results]
+            Returns:
+                GradeResult
+            Notes:
+                Raises whatever stopped the grading, where autograde.py would print it.
+        """
+        submission_dir = os.path.abspath(submission_dir)
+        results_dir    = os.path.abspath(results_dir or os.path.join(os.path.dirname(submission_dir), "results",
+                                                                     os.path.basename(submission_dir)))
+
+        with ExitStack() as stack:
+            stack.enter_context(autograde.using_paths(self.root, submission_dir, results_dir))
+            os.makedirs(results_dir, exist_ok=True)
+            if not self.verbose:
+                log = stack.enter_context(open(os.path.join(results_dir, GRADE_LOG), "w"))
+                stack.enter_context(redirect_stdout(log))
+                stack.enter_context(redirect_stderr(log))
+
+            TESTS = autograde.load_tests(self.TOML)
+            OPTS  = autograde.validate_opts(TESTS, autograde.parse_args(self.argv))
+            TESTS = autograde.filter_tests(TESTS, OPTS)
+            autograde.build_testing_directories(OPTS)
+            autograde.compile_execs(self.TOML, TESTS, OPTS)
+            TESTS = autograde.run_tests(TESTS, OPTS)
+            autograde.report_results(TESTS)
+            self.write_visible_results(TESTS)
+
+            gradescope = make_gradescope_results.make_gradescope_results(
+                             self.TOML, results_dir, self.style_check(submission_dir), self.assignment_title)
+            max_score  = make_gradescope_results.get_max_score()
+
+        return GradeResult(submission_dir, results_dir, TESTS, gradescope["score"], max_score, gradescope)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+build_reference.py
+
+Builds an assignment's reference output [testset/ref_output] by running the autograder on the
+solution, regenerating only the tests whose inputs have changed since the last build.
+
+Each test's inputs are fingerprinted: its testset.toml entry [with its group's and [common]'s
+settings], its stdin file, its staff driver [testset/cpp/<executable>.cpp], canonicalizers.py if
+it's canonicalized [its reference .ccized files come from it], and what every test
+shares - the Makefile, the other files in testset/cpp, the copied and linked files, and the
+solution. The fingerprints are kept in testset/ref_manifest.json, next to ref_output. A test is
+rebuilt if its fingerprint isn't in the manifest or differs from it, or if it has no reference
+output; the outputs of tests no longer in testset.toml are removed.
+
+Each rebuilt test is then run again, several times, to measure the solution: the most wall time,
+CPU time, and peak RSS it took go to ref_output/limits.json, with the time of its valgrind run.
+Tests with calibrated_limits set are held to a multiple of these [see autograde.calibrate_limits].
+
+Run it from an assignment's autograder directory [the one with testset.toml]:
+
+    build_reference.py [-j jobs] [-s solution] [-r runs] [-t testXX ...] [--all]
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import autograde
+from artifact_cache import hash_file, new_hash
+
+MANIFEST = "ref_manifest.json"          # { testname : fingerprint }, in testset/
+
+# settings that only change how a test is scored or shown, not what it outputs
+REPORTING_FIELDS = ("description", "max_score", "visibility", "pretty_diff", "max_valgrind_score", "valgrind_score_visibility",
+                    "style_check", "max_submissions", "max_submission_exceptions", "required_files", "manage_tokens",
+                    "compile_cache_size", "result_cache_size", "calibrated_limits", "calibration_factor",
+                    "calibration_time_floor", "calibration_ram_floor")
+
+
+def hash_tree(h, d, skip=lambda path: False):
+    """
+        Purpose:
+            Feed the names and contents of the files under d into the hashlib object h, in a fixed order
+    """
+    for parent, dirs, files in os.walk(d, followlinks=True):
+        dirs.sort()
+        for f in sorted(files):
+            path = os.path.join(parent, f)
+            if not skip(path):
+                h.update(os.path.relpath(path, d).encode())
+                hash_file(h, path)
+    return h
+
+
+def driver_path(test):
+    if not test.executable or test.exec_command:
+        return None
+    return os.path.join(autograde.TEST_CPP_DIR, f"{autograde.normalize_target(test.executable)}.cpp")
+
+
+def shared_digest(TESTS):
+    """
+        Purpose:
+            Hash the inputs every test's output depends on: the Makefile, the staff files in testset/cpp
+            other than the tests' own drivers, the copied and linked files, and the solution
+    """
+    drivers = {driver_path(test) for test in TESTS.values()}
+    h       = new_hash()
+    for d in [os.path.dirname(autograde.MAKEFILE_PATH), autograde.COPY_DIR, autograde.LINK_DIR, autograde.SUBMISSION_DIR]:
+        h.update(f"{os.path.basename(d)}/".encode())
+        hash_tree(h, d)
+    h.update(b"cpp/")
+    hash_tree(h, autograde.TEST_CPP_DIR, skip=lambda path: path in drivers)
+    return h.hexdigest()
+
+
+def fingerprint(test, base):
+    """
+        Returns:
+            hex digest of everything test's reference output depends on; base is the shared_digest
+    """
+    h = new_hash()
+    h.update(f"{base}:{autograde.portable_config(test, REPORTING_FIELDS)}".encode())
+    canonicalizers = f"{autograde.CWD}/canonicalizers.py" if test.ccizer_name else None
+    for kind, path in [("stdin", test.fpaths['stdin']), ("driver", driver_path(test)), ("canonicalizers", canonicalizers)]:
+        if path and os.path.exists(path):
+            h.update(kind.encode())
+            hash_file(h, path)
+    return h.hexdigest()
+
+
+def load_manifest():
+    try:
+        return json.loads(Path(f"{autograde.TESTSET_DIR}/{MANIFEST}").read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def discard_canonicalized(TESTS, reference):
+    """
+        Purpose:
+            Remove the canonicalized reference output [.ccized] of the tests about to be rebuilt
+        Notes:
+            Their new output is then canonicalized by the current canonicalizers.py, never copied 
+            from the old reference [see Test.run_diff], even when the raw output is unchanged.
+    """
+    autograde.chmod_dir(autograde.REF_OUTPUT_DIR, "u+w")
+    for name in TESTS:
+        for f in reference.find(name, ['.ccized']):
+            os.remove(os.path.join(autograde.REF_OUTPUT_DIR, f))
+
+
+def update_reference(TESTS, removed):
+    """
+        Purpose:
+            Replace the reference output of the tests that were just run with their new output in
+            OUTPUT_DIR, and remove the reference output of the removed tests
+        Notes:
+            Diffs aren't copied. The runtime database and the digest index are rewritten for the
+            whole of ref_output.
+    """
+    reference = autograde.OutputIndex(autograde.REF_OUTPUT_DIR)
+    outputs   = autograde.OutputIndex(autograde.OUTPUT_DIR)
+    for name in list(TESTS) + removed:
+        for f in reference.find(name):
+            os.remove(os.path.join(autograde.REF_OUTPUT_DIR, f))
+    for name in TESTS:
+        for f in outputs.find(name):
+            if not f.endswith('.diff'):
+                shutil.copyfile(os.path.join(autograde.OUTPUT_DIR, f), os.path.join(autograde.REF_OUTPUT_DIR, f))
+
+    runtimes_path = os.path.join(autograde.OUTPUT_DIR, autograde.RUNTIME_DB)
+    if os.path.exists(runtimes_path):
+        runtimes = json.loads(Path(runtimes_path).read_text())
+        runtimes = {name: runtime for name, runtime in runtimes.items() if name not in removed}
+        Path(autograde.REF_OUTPUT_DIR, autograde.RUNTIME_DB).write_text(json.dumps(runtimes, indent=4, sort_keys=True))
+    autograde.write_digest_index(autograde.REF_OUTPUT_DIR)
+
+
+def measure(tup):
+    """
+        Purpose:
+            Run the solution on a test runs times, uninstrumented, as the test's main run is graded
+        Returns:
+            (testname, the most wall time, CPU time, and peak RSS [KB, or None if unknown] of the runs)
+        Notes:
+            Stops after the first run that times out; more of them wouldn't tell us anything.
+    """
+    test, runs = tup
+    usage = {'wall': 0, 'cpu': 0, 'rss_kb': None, 'runs': 0}
+    for _ in range(runs):
+        test.run_test(user=None)
+        usage['wall']   = max(usage['wall'], round(test.wall_time, 3))
+        usage['cpu']    = max(usage['cpu'], round(test.user_time + test.sys_time, 3))
+        usage['rss_kb'] = max(usage['rss_kb'] or 0, test.max_rss) if test.max_rss is not None else usage['rss_kb']
+        usage['runs']  += 1
+        if test.timed_out:
+            break
+    return test.testname, usage
+
+
+def update_limits(TESTS, removed, runs, jobs):
+    """
+        Purpose:
+            Measure the solution on the tests that were just run, and record their usage in ref_output's
+            LIMITS_DB; the entries of the removed tests are dropped
+    """
+    path = os.path.join(autograde.REF_OUTPUT_DIR, autograde.LIMITS_DB)
+    try:
+        limits = json.loads(Path(path).read_text())
+    except (FileNotFoundError, ValueError):
+        limits = {}
+    for name in removed:
+        limits.pop(name, None)
+
+    valgrind = {name: round(test.valgrind_wall_time, 3) for name, test in TESTS.items()
+                if test.valgrind_wall_time and not test.runs_once}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for name, usage in pool.map(measure, [(test, runs) for test in TESTS.values()]):
+            limits[name] = dict(usage, valgrind_wall=valgrind.get(name))
+    Path(path).write_text(json.dumps(limits, indent=4, sort_keys=True))
+
+
+def parse_args(argv):
+    HELP = {
+        'j' : "number of parallel jobs; default=1; -1=number of available cores",
+        's' : "the solution to build the reference output from; default=../solution, or ./solution",
+        'r' : "times each rebuilt test is run to measure the solution's time and memory; default=3; 0=don't measure",
+        't' : "only consider these tests",
+        'all' : "rebuild the reference output of every test, changed or not",
+    }
+    ap = argparse.ArgumentParser(description="Rebuild the reference output of the tests whose inputs changed")
+    ap.add_argument('-j', '--jobs', default=1, metavar="jobs", type=int, help=HELP['j'])
+    ap.add_argument('-s', '--solution', default=None, metavar="dir", help=HELP['s'])
+    ap.add_argument('-r', '--runs', default=3, metavar="runs", type=int, help=HELP['r'])
+    ap.add_argument('-t', '--tests', nargs='*', metavar="testXX", type=str, help=HELP['t'])
+    ap.add_argument('--all', action='store_true', help=HELP['all'])
+    return vars(ap.parse_args(argv))
+
+
+def main(argv):
+    args = parse_args(argv)
+    if not os.path.exists('testset.toml'):
+        autograde.FAIL("testset.toml must be in the current directory")
+    solution = args['solution'] or next((d for d in ["../solution", "solution"] if os.path.isdir(d)), None)
+    if not solution or not os.path.isdir(solution):
+        autograde.FAIL("no solution directory found; use -s")
+
+    import toml
+    TOML = toml.load('testset.toml')
+
+    with autograde.using_paths(".", solution):
+        # as the CI job runs the autograder: without the student user, and without the caches
+        OPTS = autograde.parse_args(["-n", "--no-cache", "-j", str(args['jobs'])] + (["-t"] + args['tests'] if args['tests'] else []))
+        ALL  = autograde.load_tests(TOML, calibrate=False)       # the solution is measured, not held to limits
+        OPTS = autograde.validate_opts(ALL, OPTS)
+        TESTS = autograde.filter_tests(ALL, OPTS)
+
+        manifest  = load_manifest()
+        base      = shared_digest(ALL)
+        prints    = {name: fingerprint(test, base) for name, test in TESTS.items()}
+        reference = autograde.OutputIndex(autograde.REF_OUTPUT_DIR)
+        stale     = {name: test for name, test in TESTS.items()
+                     if args['all'] or manifest.get(name) != prints[name] or not reference.find(name)}
+        removed   = [name for name in manifest if name not in ALL] if not args['tests'] else []
+
+        autograde.INFORM(f"🔎 {len(stale)} of {len(TESTS)} test{'s' if len(TESTS) != 1 else ''} changed" +
+                         (f"; {len(removed)} removed" if removed else ""), color=autograde.BLUE)
+        if not stale and not removed:
+            print("🟢 Reference output is up to date")
+            return
+
+        if stale:
+            discard_canonicalized(stale, reference)
+            autograde.build_testing_directories(OPTS)
+            autograde.compile_execs(TOML, stale, OPTS)
+            stale = autograde.run_tests(stale, OPTS)
+
+        autograde.chmod_dir(autograde.TESTSET_DIR, "u+w")
+        os.makedirs(autograde.REF_OUTPUT_DIR, exist_ok=True)
+        built = {name: test for name, test in stale.items() if test.compiled is not False}
+        update_reference(built, removed)
+        if args['runs'] > 0:
+            update_limits(built, removed, args['runs'], OPTS['jobs'])
+
+        for name in removed:
+            manifest.pop(name, None)
+        manifest.update({name: prints[name] for name in built})
+        Path(f"{autograde.TESTSET_DIR}/{MANIFEST}").write_text(json.dumps(manifest, indent=4, sort_keys=True))
+
+    print(f"🟢 Rebuilt the reference output of {len(built)} test{'s' if len(built) != 1 else ''}")
+    for name in sorted(set(stale) - set(built)):
+        print(autograde.COLORIZE(f"   {name} didn't build; its reference output wasn't updated", color=autograde.RED))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+grade_class.py
+
+Grades every submission in a directory against one assignment's testset, e.g. to regrade a
+class after a testset fix. Each subdirectory of the submissions directory is a submission;
+its results [build/, logs/, output/, ...] go to <output>/<submission>/, laid out as autograde.py
+lays out results/.
+
+Builds and tests of all the submissions share one pool of worker processes: a submission's
+tests are queued as soon as it is built, so the pool isn't left waiting on the slowest test of
+each submission. The testset is loaded once, and the workers share the staff-side artifacts
+[reference output index and digests, prebuilt staff objects, canonicalizers] and caches.
+
+The submissions can also be a Gradescope "export submissions" archive. Submissions are
+extracted from it one at a time, as a worker is free to build them, into <output>/<submission>/submission/.
+
+The submissions themselves are only read: what autograde.py would remove before building [.o
+files, copies of testset/link files] is left out of each build directory instead.
+
+Every submission's programs run as the same student user, and a submission's build/, logs/, and
+output/ are writable by that user while its tests run [as autograde.py makes them]. So while
+submissions are graded side by side, one's code could write into another's results. A submission's
+directories are made read-only to the student user as soon as its tests finish; grade submissions
+you don't trust not to tamper with each other with -j 1.
+
+Run it from an assignment's autograder directory [the one with testset.toml]:
+
+    grade_class.py [-j jobs] [-o output] [-t testXX ...] [--no-cache] submissions
+"""
+import os
+import sys
+import json
+import shutil
+import zipfile
+import argparse
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import autograde
+
+GRADE_LOG    = "autograde.log"      # what autograde would print for the submission, in its results directory
+SUMMARY_FILE = "summary.json"       # { submission : {passed, failed, score, max_score} | {error} }, in the output directory
+CHUNK_SIZE   = 1 << 20
+
+
+def submission_paths(submission_dir, output_dir, name=None):
+    return (".", submission_dir, os.path.join(output_dir, name or os.path.basename(submission_dir)))
+
+
+def export_submissions(archive):
+    """
+        Purpose:
+            Group the files in a Gradescope export archive by submission, without extracting anything
+        Returns:
+            dictionary of { submission : [(ZipInfo, path in the submission)] }
+        Notes:
+            An export is one folder [assignment_<id>_export/] with a folder per submission 
+            [submission_<id>/] and submission_metadata.yml; files outside a submission folder are 
+            left out. So are .o files, which build_testing_directories would remove, and any path 
+            that would land outside its submission folder.
+    """
+    members = [(info, info.filename.split('/')) for info in archive.infolist() if not info.is_dir()]
+    tops    = {parts[0] for _, parts in members}
+    strip   = 1 if len(tops) == 1 and all(len(parts) > 1 for _, parts in members) else 0
+
+    submissions = {}
+    for info, parts in members:
+        parts = parts[strip:]
+        if len(parts) < 2 or parts[-1].endswith('.o') or any(p in ('', '.', '..') for p in parts):
+            continue
+        submissions.setdefault(parts[0], []).append((info, os.path.join(*parts[1:])))
+    return submissions
+
+
+def extract_submission(archive, name, files, output_dir):
+    """
+        Purpose:
+            Extract one submission from an export archive [see export_submissions] into 
+            <output_dir>/<name>/submission
+        Returns:
+            the submission's paths [see autograde.set_paths]
+    """
+    paths = submission_paths(os.path.join(output_dir, name, "submission"), output_dir, name)
+    shutil.rmtree(paths[1], ignore_errors=True)
+    for info, path in files:
+        dest = os.path.join(paths[1], path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with archive.open(info) as src, open(dest, 'wb') as f:
+            shutil.copyfileobj(src, f, CHUNK_SIZE)
+    return paths
+
+
+def build_submission(tup):
+    """
+        Purpose:
+            Set up a submission's results directory and build its executables [in a worker]
+        Parameters:
+            tup: (paths [see autograde.set_paths], parsed testset.toml, OPTS, user)
+        Returns:
+            (dictionary of { testname : Test }, result cache keys, names of the tests restored from the result cache)
+    """
+    paths, TOML, OPTS, user = tup
+    autograde.set_paths(*paths)
+    os.makedirs(autograde.RESULTS_DIR, exist_ok=True)
+    with open(os.path.join(autograde.RESULTS_DIR, GRADE_LOG), "w") as log, redirect_stdout(log):
+        TESTS = autograde.filter_tests(autograde.load_tests(TOML), OPTS)
+        autograde.build_testing_directories(OPTS)
+        autograde.compile_execs(TOML, TESTS, OPTS)
+
+        keys, cached = {}, {}
+        cache        = autograde.result_cache(TESTS, OPTS)
+        if cache:
+            keys, cached = autograde.restore_results(TESTS, cache, user)
+            if cached:
+                autograde.INFORM(f"📦 Restored {len(cached)} test result{'s' if len(cached) > 1 else ''} from the result cache",
+                                 color=autograde.CYAN)
+    return TESTS, keys, list(cached)
+
+
+def run_unit(tup):
+    paths, unit, user = tup
+    autograde.set_paths(*paths)
+    return autograde.run_unit((unit, user))
+
+
+def finish_submission(tup):
+    """
+        Purpose:
+            Save a graded submission's results and report them, as run_autograder would [in a worker]
+        Returns:
+            the submission's summary [see SUMMARY_FILE]
+    """
+    paths, TESTS, keys, runtimes, OPTS = tup
+    autograde.set_paths(*paths)
+    for d in [autograde.BUILD_DIR, autograde.ASAN_BUILD_DIR, autograde.LOG_DIR, autograde.OUTPUT_DIR]:
+        autograde.chmod_dir(d, "go-w")          # none of its code runs anymore [see the notes above]
+    with open(os.path.join(autograde.RESULTS_DIR, GRADE_LOG), "a") as log, redirect_stdout(log):
+        cache = autograde.result_cache(TESTS, OPTS)
+        if cache:
+            autograde.store_results(TESTS, keys, cache)
+        autograde.save_runtimes(TESTS, runtimes, OPTS)
+        autograde.report_results(TESTS)
+
+    from rich.console import Console
+    visible_tests = {k: v for k, v in TESTS.items() if v.visibility == "visible"}
+    with open(os.path.join(autograde.RESULTS_DIR, "visible_results_output.txt"), "w") as f:
+        autograde.report_results(visible_tests, console=Console(file=f))
+
+    passed = [test for test in TESTS.values() if test.success]
+    return {
+        "passed"    : len(passed),
+        "failed"    : len(TESTS) - len(passed),
+        "score"     : sum(test.max_score for test in passed),
+        "max_score" : sum(test.max_score for test in TESTS.values()),
+    }
+
+
+def grade_class(TOML, submissions, OPTS, total=None):
+    """
+        Purpose:
+            Grade the submissions on one pool of OPTS['jobs'] worker processes
+        Parameters:
+            TOML        (dict) : the parsed testset.toml
+            submissions (iterable) : paths [see autograde.set_paths] of each submission
+            OPTS        (dict)     : testing options [see autograde.parse_args]
+            total       (int)      : number of submissions, if submissions has no len()
+        Returns:
+            dictionary of { submission : summary }
+        Notes:
+            At most OPTS['jobs'] submissions are built at a time, so the tests of built submissions
+            are never stuck behind the builds of the whole class. The next submission is taken from 
+            submissions only when its build is queued, so a generator can extract it just in time. When a build finishes, the tests
+            not restored from the result cache are queued, longest-first [see autograde.schedule];
+            when a submission's last test finishes, its results are saved and reported.
+    """
+    from tqdm import tqdm
+
+    user     = None if OPTS["no_user"] else "student"
+    runtimes = autograde.load_runtimes(OPTS)
+    autograde.load_staff_artifacts(autograde.load_tests(TOML))
+
+    summaries = {}
+    waiting   = iter(submissions)
+    graded    = {}                  # submission : [Tests, result cache keys, units left]
+    futures   = {}                  # future : (step, submission paths)
+
+    with ProcessPoolExecutor(max_workers=OPTS['jobs']) as pool, tqdm(total=total or len(submissions), ncols=60) as progress:
+        def submit(step, fn, paths, arg):
+            futures[pool.submit(fn, arg)] = (step, paths)
+
+        def finish(paths):
+            TESTS, keys, _ = graded[paths]
+            submit("finish", finish_submission, paths, (paths, TESTS, keys, runtimes, OPTS))
+
+        def build_next():
+            paths = next(waiting, None)
+            if paths:
+                submit("build", build_submission, paths, (paths, TOML, OPTS, user))
+
+        for _ in range(OPTS['jobs']):
+            build_next()
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                step, paths = futures.pop(future)
+                name        = os.path.basename(paths[2])
+                if future.exception():
+                    summaries[name] = {"error": f"{step} failed: {future.exception()}"}
+                    graded.pop(paths, None)
+                    progress.update()
+                    if step == "build":
+                        build_next()
+
+                elif step == "build":
+                    TESTS, keys, cached = future.result()
+                    units = autograde.batch_units(autograde.schedule(
+                                {k: v for k, v in TESTS.items() if k not in cached}, runtimes))
+                    graded[paths] = [TESTS, keys, len(units)]
+                    for unit in units:
+                        submit("test", run_unit, paths, (paths, unit, user))
+                    if not units:
+                        finish(paths)
+                    build_next()
+
+                elif step == "test" and paths in graded:
+                    for test in future.result():
+                        graded[paths][0][test.testname] = test
+                    graded[paths][2] -= 1
+                    if graded[paths][2] == 0:
+                        finish(paths)
+
+                elif step == "finish":
+                    summaries[name] = future.result()
+                    del graded[paths]
+                    progress.update()
+    return summaries
+
+
+def parse_args(argv):
+    HELP = {
+        'j' : "number of worker processes shared by every submission's builds and tests; default=1; -1=number of available cores",
+        'o' : "directory for the submissions' results, one subdirectory each; default=./class_results",
+        't' : "one or more tests to run",
+        'n' : "runs tests without running as student user",
+        'cache_dir' : "directory for the autograder's caches; default=./.autograde_cache",
+        'no_cache'  : "don't read or write the autograder's caches",
+        'submissions' : "directory with one subdirectory per submission, or a Gradescope export (.zip)",
+    }
+    ap = argparse.ArgumentParser(description="Grade every submission in a directory or Gradescope export")
+    ap.add_argument('-j', '--jobs', default=1, metavar="jobs", type=int, help=HELP['j'])
+    ap.add_argument('-o', '--output', default="class_results", metavar="dir", help=HELP['o'])
+    ap.add_argument('-t', '--tests', nargs='*', metavar="testXX", type=str, help=HELP['t'])
+    ap.add_argument('-n', '--no-user', action='store_true', help=HELP['n'])
+    ap.add_argument('--cache-dir', default=autograde.CACHE_DIR, metavar="dir", type=str, help=HELP['cache_dir'])
+    ap.add_argument('--no-cache', action='store_true', help=HELP['no_cache'])
+    ap.add_argument('submissions', help=HELP['submissions'])
+    return vars(ap.parse_args(argv))
+
+
+def main(argv):
+    args = parse_args(argv)
+    if not os.path.exists('testset.toml'):
+        autograde.FAIL("testset.toml must be in the current directory")
+
+    # the options autograde would run each submission with; each worker builds one submission at a time
+    OPTS = autograde.parse_args(["-j", "1", "-J", "1", "--cache-dir", args['cache_dir']] +
+                                (["-n"] if args['no_user'] else []) + (["--no-cache"] if args['no_cache'] else []) +
+                                (["-t"] + args['tests'] if args['tests'] else []))
+    OPTS['jobs'] = os.cpu_count() if args['jobs'] == -1 else args['jobs']
+
+    import toml
+    TOML = json.loads(json.dumps(toml.load('testset.toml')))       # plain dicts, so it can be sent to the workers
+    OPTS = autograde.validate_opts(autograde.load_tests(TOML), OPTS)
+
+    output = os.path.abspath(args['output'])
+    os.makedirs(output, exist_ok=True)
+    os.chmod(output, 0o755)             # the student user needs to reach each submission's build directory
+
+    if zipfile.is_zipfile(args['submissions']):
+        archive     = zipfile.ZipFile(args['submissions'])
+        exported    = export_submissions(archive)
+        submissions = (extract_submission(archive, name, files, output) for name, files in sorted(exported.items()))
+        total       = len(exported)
+    else:
+        submissions = [submission_paths(entry.path, output) for entry in sorted(os.scandir(args['submissions']), key=lambda e: e.name)
+                       if entry.is_dir() and entry.path != output]
+        total       = len(submissions)
+
+    autograde.INFORM(f"🏫 Grading {total} submission{'s' if total != 1 else ''}, "
+                     f"{OPTS['jobs']} job{'s' if OPTS['jobs'] != 1 else ''} at a time", color=autograde.BLUE)
+    summaries = grade_class(TOML, submissions, OPTS, total)
+
+    with open(os.path.join(output, SUMMARY_FILE), "w") as f:
+        json.dump(summaries, f, indent=4, sort_keys=True)
+    for name, summary in sorted(summaries.items()):
+        if "error" in summary:
+            print(autograde.COLORIZE(f"{name:<32} {summary['error']}", color=autograde.RED))
+        else:
+            color = autograde.GREEN if not summary['failed'] else autograde.YELLOW
+            print(autograde.COLORIZE(f"{name:<32} {summary['passed']:>4} passed {summary['failed']:>4} failed "
+                                     f"{summary['score']:>6} / {summary['max_score']}", color=color))
+    print(f"\nResults are in {output}/<submission>/; the summary is in {output}/{SUMMARY_FILE}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
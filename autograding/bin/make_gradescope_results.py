@@ -1,12 +1,9 @@
 #!/usr/bin/env python3
 import os
 import json
-import ast
 from pathlib import Path
 from collections import OrderedDict
-import toml
 import autograde
-import style_check
 
 SUBMISSION_METADATA_PATH = "/autograder/submission_metadata.json"
 SUBMISSION_FOLDER        = "/autograder/submission"
@@ -19,7 +16,19 @@ HIDDEN          = "hidden"                  # Careful if using this setting! Gra
                                             # hides the total score from students if
                                             # ANY test is hidden.... smh....
 
-TESTSET = toml.load('testset.toml')
+# These are loaded by make_gradescope_results( ), so importing this module doesn't load the 
+# testset, the results, or run the style check
+TESTSET        = None
+TOML_SETTINGS  = None
+style_checker  = None
+TEST_SUMMARIES = None
+RESULTS        = None
+
+# The results being scored, also set by make_gradescope_results( )
+RESULTS_DIR      = None
+LOG_DIR          = None
+OUTPUT_DIR       = None
+RESULTS_JSONPATH = None
 
 # All the TOML settings used in this file
 MAX_VALGRIND_SCORE  = 'max_valgrind_score'
@@ -44,19 +53,7 @@ def load_common_based_on_defaults():
     return {k: (TESTSET['common'][k] if k in TESTSET['common'] else ds) for k, ds in TOML_DEFAULTS.items()}
 
 
-# Here we actually load up all our settings and add in MAX_STYLE_SCORE
-TOML_SETTINGS = load_common_based_on_defaults()
-
 # helper functions for file loading/saving, etc.
-def load_dict_from_file(d, fname):
-    return ast.literal_eval(Path(os.path.join(d, fname)).read_text())
-
-
-def load_dicts_from_files(d, extension):
-    files = [f for f in os.listdir(d) if f.endswith(extension)]
-    return [load_dict_from_file(d, f) for f in files]
-
-
 def load_json(fullpath):
     with open(fullpath, 'r') as f:
         jsondata = json.load(f)
@@ -77,10 +74,6 @@ def get_valgrind_score():
     except ZeroDivisionError:
         return 0
 
-# Checks style and collects violations - this had to be moved up here so that get_total_score() can incorporate
-# it and is put into the initial save_json() call below
-style_checker = style_check.StyleChecker()
-
 def get_total_score():
     # Modified to include style score, handles when style is not graded (get_style_score just returns 0) - slamel01
     return sum([x['max_score'] * (x['success'] if x['success'] is not None else 0) for x in TEST_SUMMARIES]) + get_valgrind_score() + style_checker.style_score
@@ -91,25 +84,6 @@ def get_max_score():
     return sum([x['max_score'] for x in TEST_SUMMARIES]) + TOML_SETTINGS[MAX_VALGRIND_SCORE] + style_checker.max_style_score
 
 
-HERE             = os.getcwd()
-LOG_DIR          = os.path.join(HERE, "results", "logs")
-OUTPUT_DIR       = os.path.join(HERE, "results", "output")
-TEST_SUMMARIES   = load_dicts_from_files(LOG_DIR, '.summary')
-RESULTS_DIR      = os.path.join(HERE, "results")
-RESULTS_JSONPATH = os.path.join(RESULTS_DIR, "results.json")
-
-# dictionary where we'll keep the results
-RESULTS = {
-    "score":             get_total_score(),
-    "visibility":        VISIBLE if 'lab' in os.environ['ASSIGNMENT_TITLE'] else AFTER_PUBLISHED,
-    "stdout_visibility": VISIBLE if 'lab' in os.environ['ASSIGNMENT_TITLE'] else AFTER_PUBLISHED,
-    "tests":             []
-}
-
-# Set defaults for gradescope now, so at least there's the total score if all
-# else fails.
-save_json(RESULTS_JSONPATH, RESULTS)
-
 # sometimes compile log not created if using manual mode
 def get_compile_log(execname):
     if os.path.exists(os.path.join(LOG_DIR, f"{execname}.compile.log")):
@@ -138,16 +112,17 @@ def make_test_result(name, visibility, score, max_score, output):
     return {"name": name, "visibility": visibility, "score": score, "max_score": max_score,
             "output": output, "output_format": "ansi"}
 
-def make_test_output(test):
+def make_test_output(test, outputs):
 #     """
 #     Modified to handle instances of non UTF-8 characters in diff files.
 #     2/9/23 - slamel01, atanne02
+#     outputs is an autograde.OutputIndex of OUTPUT_DIR, built after the diffs are rendered
 #     """
     failstr = ""
     if wrong_output_program(test['executable']) or test['compiled'] == False:
         return f"{test['testname']} failed to build. See log below.\n{get_compile_log(test['executable'])}"
 
-    diff_fpaths = [x for x in os.listdir(OUTPUT_DIR) if x.startswith(test['testname']) and x.endswith(f".diff")]
+    diff_fpaths = outputs.find(test['testname'], [".diff"])
     for f in diff_fpaths:
         try:
             diff_text = Path(os.path.join(OUTPUT_DIR, f)).read_text()
@@ -208,13 +183,24 @@ def make_build_test():
                          output     = compilation_results))
 
 
+def make_valgrind_output():
+    output = "This is your total Valgrind score.\n"
+    for test in TEST_SUMMARIES:
+        details = autograde.describe_valgrind(test.get('valgrind_report'))
+        if test['valgrind'] and details:
+            output += f"{test['testname']}: {details}\n"
+            for error in dict.fromkeys(test['valgrind_report']['top_errors']):
+                output += f"    {error}\n"
+    return output
+
+
 def make_valgrind_test():
     RESULTS["tests"].append(
         make_test_result(name       = "Valgrind Score",
                          visibility = TOML_SETTINGS[VALGRIND_VISIBILITY],
                          score      = get_valgrind_score(),
                          max_score  = TOML_SETTINGS[MAX_VALGRIND_SCORE],
-                         output     = "This is your total Valgrind score.\n"))
+                         output     = make_valgrind_output()))
 
 
 def make_style_test():
@@ -250,6 +236,10 @@ def make_results():
     make_valgrind_test()
     make_style_test()
 
+    for test in TEST_SUMMARIES:
+        autograde.render_diffs(test.get('pending_diffs', []), test['pretty_diff'])
+    outputs = autograde.OutputIndex(OUTPUT_DIR)
+
     for test in TEST_SUMMARIES:
         RESULTS["tests"].append(
             # Chami: for a similar to reason why I added the name to the autograder 
@@ -260,9 +250,66 @@ def make_results():
                              visibility = test['visibility'],
                              score      = test['max_score'] * (test['success'] if test['success'] is not None else 0),
                              max_score  = test['max_score'],
-                             output     = make_test_output(test)))
+                             output     = make_test_output(test, outputs)))
     
     save_json(RESULTS_JSONPATH, RESULTS)
 
-if __name__ == "__main__":
+def make_gradescope_results(testset, results_dir, checker, assignment_title):
+    """
+        Purpose:
+            Score the autograder's results in results_dir, and write them to results_dir/results.json
+        Parameters:
+            testset          (dict)         : the loaded testset.toml
+            results_dir      (string)       : the results directory autograde wrote [results/]
+            checker          (StyleChecker) : the submission's style check
+            assignment_title (string)       : the Gradescope assignment title [labs' results are visible]
+        Returns:
+            the contents of results.json
+        Notes:
+            The compile logs are read through autograde, so its paths must point at the same results 
+            [see autograde.using_paths].
+    """
+    global TESTSET, TOML_SETTINGS, style_checker, TEST_SUMMARIES, RESULTS, RESULTS_DIR, LOG_DIR, OUTPUT_DIR, RESULTS_JSONPATH
+
+    RESULTS_DIR      = results_dir
+    LOG_DIR          = os.path.join(RESULTS_DIR, "logs")
+    OUTPUT_DIR       = os.path.join(RESULTS_DIR, "output")
+    RESULTS_JSONPATH = os.path.join(RESULTS_DIR, "results.json")
+
+    TESTSET = testset
+
+    # Here we actually load up all our settings and add in MAX_STYLE_SCORE
+    TOML_SETTINGS = load_common_based_on_defaults()
+
+    # Checks style and collects violations - this has to come before RESULTS so that get_total_score() 
+    # can incorporate it and it is put into the initial save_json() call below
+    style_checker = checker
+
+    TEST_SUMMARIES = list(autograde.read_results(os.path.join(LOG_DIR, "results.jsonl")).values())
+
+    # dictionary where we'll keep the results
+    RESULTS = {
+        "score":             get_total_score(),
+        "visibility":        VISIBLE if 'lab' in assignment_title else AFTER_PUBLISHED,
+        "stdout_visibility": VISIBLE if 'lab' in assignment_title else AFTER_PUBLISHED,
+        "tests":             []
+    }
+
+    # Set defaults for gradescope now, so at least there's the total score if all
+    # else fails.
+    save_json(RESULTS_JSONPATH, RESULTS)
+
     make_results()
+    return RESULTS
+
+
+def main():
+    import toml
+    import style_check
+
+    make_gradescope_results(toml.load('testset.toml'), os.path.join(os.getcwd(), "results"),
+                            style_check.StyleChecker(), os.environ['ASSIGNMENT_TITLE'])
+
+
+if __name__ == "__main__":
+    main()
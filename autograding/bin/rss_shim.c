@@ -0,0 +1,72 @@
+/*
+ * rss_shim.c
+ *
+ * Runs a command as its child and reports the child's own peak resident set size, for
+ * autograde.py [see launch_command and rss_shim there]:
+ *
+ *     rss_shim <fd> <command> [args ...]
+ *
+ * The peak RSS [ru_maxrss, in KB] is written to file descriptor fd, which the command doesn't
+ * inherit, and the shim then exits the way the command did: with its exit code, or killed by
+ * the same signal.
+ *
+ * Linux carries a process's peak RSS across exec, so a program exec'd straight from the autograder
+ * [or from a process it vfork'd] reports the autograder's footprint as its own. The command here is
+ * forked from this small process instead, so its peak is its own.
+ *
+ * SIGTERM, SIGINT, and SIGHUP are ignored while the command runs: when the autograder stops a
+ * timed-out test's process group, the command still gets them, and its peak is still reported.
+ */
+#include <errno.h>
+#include <fcntl.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <unistd.h>
+#include <sys/resource.h>
+#include <sys/wait.h>
+
+int main(int argc, char *argv[])
+{
+        if (argc < 3) {
+                fprintf(stderr, "usage: %s fd command [args ...]\n", argv[0]);
+                return 125;
+        }
+        int fd = atoi(argv[1]);
+        fcntl(fd, F_SETFD, FD_CLOEXEC);
+
+        pid_t pid = fork();
+        if (pid < 0) {
+                perror("rss_shim: fork");
+                return 125;
+        }
+        if (pid == 0) {
+                execvp(argv[2], argv + 2);
+                int error = errno;
+                perror(argv[2]);
+                _exit(error == ENOENT ? 127 : 126);
+        }
+
+        signal(SIGTERM, SIG_IGN);
+        signal(SIGINT, SIG_IGN);
+        signal(SIGHUP, SIG_IGN);
+
+        int status;
+        struct rusage usage;
+        while (wait4(pid, &status, 0, &usage) < 0) {
+                if (errno != EINTR)
+                        return 125;
+        }
+        dprintf(fd, "%ld\n", usage.ru_maxrss);
+        close(fd);
+
+        if (WIFSIGNALED(status)) {
+                int sig = WTERMSIG(status);
+                struct rlimit no_core = { 0, 0 };
+                setrlimit(RLIMIT_CORE, &no_core);        /* we don't want a core dump of the shim */
+                signal(sig, SIG_DFL);
+                raise(sig);
+                return 128 + sig;
+        }
+        return WEXITSTATUS(status);
+}
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+startup_benchmark.py
+
+Reports how long each autograder entry point takes to import, since they run on every
+submission. Each entry point is imported in a fresh interpreter with `python -X importtime`,
+several times; the median total is reported, along with the imports that cost the most.
+
+Run it from an assignment's autograder directory [the one with testset.toml], as the
+entry points would be:
+
+    startup_benchmark.py [-n runs] [-k top] [entrypoint ...]
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+BIN_DIR     = os.path.dirname(os.path.abspath(__file__))
+ENTRYPOINTS = ["autograde", "make_gradescope_results", "validate_submission"]
+
+
+def import_times(module):
+    """
+        Purpose:
+            Import module in a fresh interpreter and collect its -X importtime report
+        Returns:
+            list of (cumulative microseconds, imported module, depth); depth 0 is a top-level import 
+            [the module itself, or the interpreter's own startup imports], depth 1 is imported by one, ...
+        Notes:
+            Raises RuntimeError with the interpreter's output if the import fails.
+    """
+    env  = dict(os.environ, PYTHONPATH=os.pathsep.join([BIN_DIR, os.environ.get('PYTHONPATH', '')]))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=env, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2        # nested imports are indented 2 spaces a level
+        times.append((int(cumulative), name.strip(), depth))
+    return times
+
+
+def benchmark(module, runs, top):
+    totals = []
+    for _ in range(runs):
+        times = import_times(module)
+        totals.append(sum(t for t, _, depth in times if depth == 0))
+    direct   = [(t, name) for t, name, depth in times if depth == 1 or depth == 0 and name != module]
+    heaviest = sorted(direct, reverse=True)[:top]
+    return statistics.median(totals), heaviest
+
+
+def parse_args(argv):
+    ap = argparse.ArgumentParser(description="Report the import time of the autograder entry points")
+    ap.add_argument('-n', '--runs', type=int, default=5, help="imports per entry point; the median is reported")
+    ap.add_argument('-k', '--top', type=int, default=5, help="number of the most expensive imports to list")
+    ap.add_argument('entrypoints', nargs='*', default=ENTRYPOINTS, help=f"modules to import (default: {' '.join(ENTRYPOINTS)})")
+    return ap.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    for module in args.entrypoints:
+        try:
+            total, heaviest = benchmark(module, args.runs, args.top)
+        except RuntimeError as e:
+            print(f"{module:<28} failed to import: {e}")
+            continue
+        print(f"{module:<28} {total / 1000:8.1f} ms")
+        for t, name in heaviest:
+            print(f"    {name:<32} {t / 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
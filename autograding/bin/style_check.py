@@ -234,9 +234,14 @@ def list_filenames(check_files):
 
 
 class StyleChecker:
-    def __init__(self, submission_folder=None, config_toml_path=None):
+    def __init__(self, submission_folder=None, config_toml_path=None, testset_common=None, config=None):
+        """
+        testset_common and config, if provided, are used instead of loading [common] from the
+        testset.toml and [style] from the config.toml - so a long-lived grader [see
+        autograder_api.py] can load them once for every submission it checks
+        """
         if submission_folder is None:
-            self.testset_common = toml.load(TESTSET_TOML_PATH)["common"]
+            self.testset_common = toml.load(TESTSET_TOML_PATH)["common"] if testset_common is None else testset_common
             self.submission_folder = AUTOGRADER_SUBMISSION_FOLDER
             config_toml_path = AUTOGRADER_CONFIG_TOML_PATH
         else:
@@ -245,9 +250,9 @@ class StyleChecker:
             # Here, we mimic the presence of a testset.toml that forces
             # a style check to be run - allows less modification
             # to the following code
-            self.testset_common = {"style_check": True}
+            self.testset_common = {"style_check": True} if testset_common is None else testset_common
             self.submission_folder = submission_folder
-        self.config = toml.load(config_toml_path)["style"]
+        self.config = toml.load(config_toml_path)["style"] if config is None else config
         self.style_results = ""
 
         if "style_check" in self.testset_common and self.testset_common["style_check"]:
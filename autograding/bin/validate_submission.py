@@ -15,9 +15,8 @@ import os
 import json
 import toml
 from pathlib import Path
-from dateutil import parser as dateparser
 from datetime import timedelta
-from token_manager import DB, INFORM, BLUE
+from autograde import INFORM, BLUE
 
 
 def EXIT_FAIL(message, db=None):
@@ -98,8 +97,6 @@ def make_dict_case_insensitive(d):
 
 
 
-INFORM("🔑 Submission Validation", BLUE)
-
 """
     establish paths
 """ 
@@ -111,184 +108,201 @@ CONFIG_PATH        = "/autograder/source/config.toml"
 TESTSET_PATH       = "/autograder/testset.toml"
 SUB_META_PATH      = "/autograder/submission_metadata.json"
 
-METADATA      = json.loads(Path(SUB_META_PATH).read_text())
-TESTSET_TOML  = toml.load(TESTSET_PATH)['common']
-CONFIG        = toml.load(CONFIG_PATH)
-SECRETS       = toml.load(SECRETS_PATH)
-AG_CONFIG     = CONFIG['repo']
-TOKEN_CONFIG  = CONFIG['tokens']
-ASSIGN_NAME   = METADATA['assignment']['title']
 
-"""
-    extract the email of the user from the metadata file.  
-    notes:
-        weird case with gradescope - the only submission that has a 'user' field is the active one
+def main():
+    """
+    Validates the submission, exiting with EXIT_SUCCESS / EXIT_FAIL.
+    Notes: 
+        The token manager [and paramiko] is only imported once a submission needs its tokens checked;
+        most submissions exit before then.
+    """
+    global CURR_SUB_NUM, MAX_SUB_NUM
+    INFORM("🔑 Submission Validation", BLUE)
 
-    CL: This swapped from 'name' to 'email' to account for the case of multiple students having the same name
-    (which would double count tokens for the lack of a better word) or a student sharing a name with a 
-    staff member (which could have them bypass the token check)
+    METADATA      = json.loads(Path(SUB_META_PATH).read_text())
+    TESTSET_TOML  = toml.load(TESTSET_PATH)['common']
+    CONFIG        = toml.load(CONFIG_PATH)
+    SECRETS       = toml.load(SECRETS_PATH)
+    AG_CONFIG     = CONFIG['repo']
+    TOKEN_CONFIG  = CONFIG['tokens']
+    ASSIGN_NAME   = METADATA['assignment']['title']
 
-    Lastly, the use of email is consistent with the CLI hitme system which uses it as a primary key in
-    the hitme database. 
+    """
+        extract the email of the user from the metadata file.  
+        notes:
+            weird case with gradescope - the only submission that has a 'user' field is the active one
 
-    We lowercase the email to enable case insentive email comparison when looking in the various 
-    TOML configuration files where users could have entered submission or token exemptions.
-""" 
-try:
-    GRADESCOPE_NAME = METADATA['users'][0]['email'].lower()
-    print(f"Submitter: {GRADESCOPE_NAME}")
-except:
-    EXIT_FAIL("ERROR: You can only run an active submission on gradescope.")
+        CL: This swapped from 'name' to 'email' to account for the case of multiple students having the same name
+        (which would double count tokens for the lack of a better word) or a student sharing a name with a 
+        staff member (which could have them bypass the token check)
 
+        Lastly, the use of email is consistent with the CLI hitme system which uses it as a primary key in
+        the hitme database. 
 
-"""
-    test set of required files
-    Chami: moved this to be before TEST_USER check just so that if a TA submits 
-    some code under their name missing a required file then that should be
-    reported immediately before they bypass the token and submission limit
-    checks that occur below. Otherwise, the autograder tries to run all
-    the tests and it takes awhile for them to all fail compilation
-"""
-REQUIRED_FILES  = set(TESTSET_TOML.get('required_files', []))
-SUBMITTED_FILES = set(os.listdir(SUBMISSION_DIR))
-MISSING_FILES   = REQUIRED_FILES - SUBMITTED_FILES 
-if len(MISSING_FILES) > 0:
-    EXIT_FAIL(f"ERROR: Required files missing: {MISSING_FILES} -- this does not count as a submission!")
+        We lowercase the email to enable case insentive email comparison when looking in the various 
+        TOML configuration files where users could have entered submission or token exemptions.
+    """ 
+    try:
+        GRADESCOPE_NAME = METADATA['users'][0]['email'].lower()
+        print(f"Submitter: {GRADESCOPE_NAME}")
+    except:
+        EXIT_FAIL("ERROR: You can only run an active submission on gradescope.")
 
 
-""" 
-    extract the number of current / maximum submissions
-    notes:
-        if student has an exception for the given assignment, then use that value instead of the course default
+    """
+        test set of required files
+        Chami: moved this to be before TEST_USER check just so that if a TA submits 
+        some code under their name missing a required file then that should be
+        reported immediately before they bypass the token and submission limit
+        checks that occur below. Otherwise, the autograder tries to run all
+        the tests and it takes awhile for them to all fail compilation
+    """
+    REQUIRED_FILES  = set(TESTSET_TOML.get('required_files', []))
+    SUBMITTED_FILES = set(os.listdir(SUBMISSION_DIR))
+    MISSING_FILES   = REQUIRED_FILES - SUBMITTED_FILES 
+    if len(MISSING_FILES) > 0:
+        EXIT_FAIL(f"ERROR: Required files missing: {MISSING_FILES} -- this does not count as a submission!")
 
-    Chami: moved this here because MAX_SUB_NUM and CURR_SUB_NUM must be defined before the first call
-    to EXIT_SUCCESS including when test user is passing by default 
-"""
-PREV_SUBMISSIONS = [submission for submission in METADATA['previous_submissions'] if float(submission['score']) > 0]
-CURR_SUB_NUM     = len(PREV_SUBMISSIONS) + 1
-try: 
-    # chami: convert user specifications in testset.toml for max submission exceptions to enable case insensitive 
-    # search by converting all specified emails to lowercase -- this is done here because 'max_submission_exceptions'
-    # may not be in common section of testset.toml
-    TESTSET_TOML['max_submission_exceptions'] = make_dict_case_insensitive(TESTSET_TOML['max_submission_exceptions'])
-    MAX_SUB_NUM  = TESTSET_TOML['max_submission_exceptions'][GRADESCOPE_NAME]
-except KeyError: 
-    MAX_SUB_NUM  = TESTSET_TOML.get('max_submissions', CONFIG['gradescope']['SUBMISSIONS_PER_ASSIGN'])    
 
+    """ 
+        extract the number of current / maximum submissions
+        notes:
+            if student has an exception for the given assignment, then use that value instead of the course default
 
-"""
-    If the user is a test user, we're done. 
+        Chami: moved this here because MAX_SUB_NUM and CURR_SUB_NUM must be defined before the first call
+        to EXIT_SUCCESS including when test user is passing by default 
+    """
+    PREV_SUBMISSIONS = [submission for submission in METADATA['previous_submissions'] if float(submission['score']) > 0]
+    CURR_SUB_NUM     = len(PREV_SUBMISSIONS) + 1
+    try: 
+        # chami: convert user specifications in testset.toml for max submission exceptions to enable case insensitive 
+        # search by converting all specified emails to lowercase -- this is done here because 'max_submission_exceptions'
+        # may not be in common section of testset.toml
+        TESTSET_TOML['max_submission_exceptions'] = make_dict_case_insensitive(TESTSET_TOML['max_submission_exceptions'])
+        MAX_SUB_NUM  = TESTSET_TOML['max_submission_exceptions'][GRADESCOPE_NAME]
+    except KeyError: 
+        MAX_SUB_NUM  = TESTSET_TOML.get('max_submissions', CONFIG['gradescope']['SUBMISSIONS_PER_ASSIGN'])    
 
-    Chami: We do a case insensitive check here -- GRADESCOPE_NAME has already been
-    lowercased, and here we lowercase the user specified test users in config.toml 
-"""
-try:
-    if GRADESCOPE_NAME in { u.lower() for u in CONFIG['gradescope']['TEST_USERS'] }:
-        EXIT_SUCCESS("Test user - passing submission validation by default.")
-except KeyError:
-    pass
 
+    """
+        If the user is a test user, we're done. 
 
-"""
-    test the max submission number
-"""
-if CURR_SUB_NUM > MAX_SUB_NUM:
-    EXIT_FAIL(f"ERROR: Max submissions exceeded for this assignment.")
+        Chami: We do a case insensitive check here -- GRADESCOPE_NAME has already been
+        lowercased, and here we lowercase the user specified test users in config.toml 
+    """
+    try:
+        if GRADESCOPE_NAME in { u.lower() for u in CONFIG['gradescope']['TEST_USERS'] }:
+            EXIT_SUCCESS("Test user - passing submission validation by default.")
+    except KeyError:
+        pass
 
 
-# If for this assignment we specified in testset.toml not to manage tokens, exit early 
-# Example for gerp medium large
-if 'manage_tokens' in TESTSET_TOML and not TESTSET_TOML['manage_tokens']:
-    EXIT_SUCCESS(f"not managing tokens for {ASSIGN_NAME} - passed by default")
+    """
+        test the max submission number
+    """
+    if CURR_SUB_NUM > MAX_SUB_NUM:
+        EXIT_FAIL(f"ERROR: Max submissions exceeded for this assignment.")
 
-# If manage_tokens was not specified for this assignment but was turned off course wide,
-# exit early (not used for 15 but for compatability) -- note we assume MANAGE_TOKENS is
-# always provided in config.toml 
-if 'manage_tokens' not in TESTSET_TOML and not TOKEN_CONFIG['MANAGE_TOKENS']:
-    EXIT_SUCCESS("not managing tokens for course - passed by default")
 
-# Otherwise, at this point manage_tokens is either set in testset.toml as true or it
-# was enabled course wide -- so we move forward to token check
+    # If for this assignment we specified in testset.toml not to manage tokens, exit early 
+    # Example for gerp medium large
+    if 'manage_tokens' in TESTSET_TOML and not TESTSET_TOML['manage_tokens']:
+        EXIT_SUCCESS(f"not managing tokens for {ASSIGN_NAME} - passed by default")
 
-"""
-    establish token constants
-"""
-GRACE_TIME         = timedelta(minutes=TOKEN_CONFIG["GRACE_TIME"]) 
-TOKEN_TIME         = timedelta(minutes=TOKEN_CONFIG["TOKEN_TIME"])
-SUBMISSION_TIME    = dateparser.parse(METADATA['created_at']) - GRACE_TIME
-DUE_TIME           = dateparser.parse(METADATA['users'][0]['assignment']['due_date'])
-ONE_TOKEN_DUE_TIME = DUE_TIME + TOKEN_TIME
-TWO_TOKEN_DUE_TIME = DUE_TIME + TOKEN_TIME + TOKEN_TIME
+    # If manage_tokens was not specified for this assignment but was turned off course wide,
+    # exit early (not used for 15 but for compatability) -- note we assume MANAGE_TOKENS is
+    # always provided in config.toml 
+    if 'manage_tokens' not in TESTSET_TOML and not TOKEN_CONFIG['MANAGE_TOKENS']:
+        EXIT_SUCCESS("not managing tokens for course - passed by default")
 
-"""
-    set opening balance of the user
-    notes: 
-        if they are an 'excepted' user then use that value, otherwise choose course default
-"""
-try:
-    # chami: convert user specifications in config.toml for token exceptions to enable case insensitive 
-    # search by converting all specified emails to lowercase -- this is done here because 'exceptions'
-    # may not be in token section of config.toml
-    TOKEN_CONFIG['EXCEPTIONS'] = make_dict_case_insensitive(TOKEN_CONFIG['EXCEPTIONS'])
-    OPENING_BALANCE = TOKEN_CONFIG['EXCEPTIONS'][GRADESCOPE_NAME]
-except KeyError:
-    OPENING_BALANCE = TOKEN_CONFIG['STARTING_TOKENS']
+    # Otherwise, at this point manage_tokens is either set in testset.toml as true or it
+    # was enabled course wide -- so we move forward to token check
+
+    """
+        establish token constants
+    """
+    from dateutil import parser as dateparser
+    GRACE_TIME         = timedelta(minutes=TOKEN_CONFIG["GRACE_TIME"]) 
+    TOKEN_TIME         = timedelta(minutes=TOKEN_CONFIG["TOKEN_TIME"])
+    SUBMISSION_TIME    = dateparser.parse(METADATA['created_at']) - GRACE_TIME
+    DUE_TIME           = dateparser.parse(METADATA['users'][0]['assignment']['due_date'])
+    ONE_TOKEN_DUE_TIME = DUE_TIME + TOKEN_TIME
+    TWO_TOKEN_DUE_TIME = DUE_TIME + TOKEN_TIME + TOKEN_TIME
+
+    """
+        set opening balance of the user
+        notes: 
+            if they are an 'excepted' user then use that value, otherwise choose course default
+    """
+    try:
+        # chami: convert user specifications in config.toml for token exceptions to enable case insensitive 
+        # search by converting all specified emails to lowercase -- this is done here because 'exceptions'
+        # may not be in token section of config.toml
+        TOKEN_CONFIG['EXCEPTIONS'] = make_dict_case_insensitive(TOKEN_CONFIG['EXCEPTIONS'])
+        OPENING_BALANCE = TOKEN_CONFIG['EXCEPTIONS'][GRADESCOPE_NAME]
+    except KeyError:
+        OPENING_BALANCE = TOKEN_CONFIG['STARTING_TOKENS']
     
-"""
-    establish db session and determine token usage for the current assignment
-    notes: 
-        the db session is specific to the assignment and the student. 
-        assignment and student will be added to the db if needed. 
-"""
-db = DB(ASSIGN_NAME, GRADESCOPE_NAME, OPENING_BALANCE, SECRETS, CONFIG)
-TOKENS_LEFT, ASSIGN_TOKENS_USED = db.get_tokens_left_and_assign_usage()
+    """
+        establish db session and determine token usage for the current assignment
+        notes: 
+            the db session is specific to the assignment and the student. 
+            assignment and student will be added to the db if needed. 
+    """
+    from token_manager import DB   # imported here: it connects to the db over ssh [paramiko]
+    db = DB(ASSIGN_NAME, GRADESCOPE_NAME, OPENING_BALANCE, SECRETS, CONFIG)
+    TOKENS_LEFT, ASSIGN_TOKENS_USED = db.get_tokens_left_and_assign_usage()
 
-"""
-    early or late
-"""
-if SUBMISSION_TIME <= DUE_TIME: 
-    EXIT_SUCCESS(f"Submission arrived before the due date - so zero tokens used.", db=db)
+    """
+        early or late
+    """
+    if SUBMISSION_TIME <= DUE_TIME: 
+        EXIT_SUCCESS(f"Submission arrived before the due date - so zero tokens used.", db=db)
 
-if SUBMISSION_TIME > TWO_TOKEN_DUE_TIME:
-    EXIT_FAIL("ERROR: After two-token deadline.", db=db)
+    if SUBMISSION_TIME > TWO_TOKEN_DUE_TIME:
+        EXIT_FAIL("ERROR: After two-token deadline.", db=db)
 
-"""
-    before one token deadline
-"""
-if SUBMISSION_TIME <= ONE_TOKEN_DUE_TIME:
-    if ASSIGN_TOKENS_USED  == 1:
-        EXIT_SUCCESS(f"Already used one token previously for {ASSIGN_NAME}, so zero tokens used.", db=db)
+    """
+        before one token deadline
+    """
+    if SUBMISSION_TIME <= ONE_TOKEN_DUE_TIME:
+        if ASSIGN_TOKENS_USED  == 1:
+            EXIT_SUCCESS(f"Already used one token previously for {ASSIGN_NAME}, so zero tokens used.", db=db)
 
-    if ASSIGN_TOKENS_USED  == 0:
-        if TOKENS_LEFT == 0:
-            EXIT_FAIL("Tokens needed: 1, tokens available: 0.", db=db)
+        if ASSIGN_TOKENS_USED  == 0:
+            if TOKENS_LEFT == 0:
+                EXIT_FAIL("Tokens needed: 1, tokens available: 0.", db=db)
         
-        db.use_token()
-        EXIT_SUCCESS(f"Before one token deadline, and no tokens yet used, so one token used.", db=db)
+            db.use_token()
+            EXIT_SUCCESS(f"Before one token deadline, and no tokens yet used, so one token used.", db=db)
 
-    EXIT_SUCCESS(f"Already used more than one token, but before one-token deadline, so zero tokens used.", db=db)
+        EXIT_SUCCESS(f"Already used more than one token, but before one-token deadline, so zero tokens used.", db=db)
     
-"""
-    before two token deadline
-"""
-if SUBMISSION_TIME <= TWO_TOKEN_DUE_TIME:
+    """
+        before two token deadline
+    """
+    if SUBMISSION_TIME <= TWO_TOKEN_DUE_TIME:
 
-    if ASSIGN_TOKENS_USED == 2: 
-        EXIT_SUCCESS(f"Already used two tokens previously for {ASSIGN_NAME}, so zero tokens used.", db=db)
+        if ASSIGN_TOKENS_USED == 2: 
+            EXIT_SUCCESS(f"Already used two tokens previously for {ASSIGN_NAME}, so zero tokens used.", db=db)
     
-    if ASSIGN_TOKENS_USED == 1:
-        if TOKENS_LEFT == 0:
-            EXIT_FAIL("Tokens needed: 2, tokens available: 0.", db=db)
+        if ASSIGN_TOKENS_USED == 1:
+            if TOKENS_LEFT == 0:
+                EXIT_FAIL("Tokens needed: 2, tokens available: 0.", db=db)
 
-        db.use_token()
-        EXIT_SUCCESS(f"Already used one token for {ASSIGN_NAME}; after one token deadline, so one token used.", db=db)
+            db.use_token()
+            EXIT_SUCCESS(f"Already used one token for {ASSIGN_NAME}; after one token deadline, so one token used.", db=db)
     
-    if ASSIGN_TOKENS_USED == 0:
-        if TOKENS_LEFT < 2:
-            EXIT_FAIL(f"Tokens needed: 2, tokens available: {TOKENS_LEFT}.", db=db)
+        if ASSIGN_TOKENS_USED == 0:
+            if TOKENS_LEFT < 2:
+                EXIT_FAIL(f"Tokens needed: 2, tokens available: {TOKENS_LEFT}.", db=db)
 
-        db.use_token()
-        db.use_token()
-        EXIT_SUCCESS(f"Before the two token deadline, and haven't used any tokens yet, so two tokens used.", db=db)
+            db.use_token()
+            db.use_token()
+            EXIT_SUCCESS(f"Before the two token deadline, and haven't used any tokens yet, so two tokens used.", db=db)
     
-    EXIT_SUCCESS(f"Already used more than two tokens, but before two-token deadline, so zero tokens used.", db=db)
\ No newline at end of file
+        EXIT_SUCCESS(f"Already used more than two tokens, but before two-token deadline, so zero tokens used.", db=db)
+
+
+if __name__ == "__main__":
+    main()